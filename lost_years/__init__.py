@@ -3,9 +3,18 @@
 # Get version from package metadata (Python 3.11+ has this built-in)
 from importlib.metadata import version
 
-from .hld import lost_years_hld
-from .ssa import lost_years_ssa
-from .types import ColumnConfig, ColumnMapping, DataSourceConfig, LifeExpectancyResult
+from .aggregate import yll
+from .fallback import lost_years_fallback
+from .hld import cohort_life_expectancy_hld, lost_years_hld, survival_hld
+from .lifetable import LifeTable, life_table, life_tables
+from .ssa import lost_years_ssa, survival_ssa
+from .types import (
+    ColumnConfig,
+    ColumnMapping,
+    DataSourceConfig,
+    HLDTablePreference,
+    LifeExpectancyResult,
+)
 from .who import lost_years_who
 
 __version__ = version("lost_years")
@@ -14,8 +23,17 @@ __all__ = [
     "lost_years_ssa",
     "lost_years_hld",
     "lost_years_who",
+    "lost_years_fallback",
+    "survival_ssa",
+    "survival_hld",
+    "cohort_life_expectancy_hld",
+    "yll",
+    "life_table",
+    "life_tables",
+    "LifeTable",
     "ColumnConfig",
     "ColumnMapping",
     "DataSourceConfig",
+    "HLDTablePreference",
     "LifeExpectancyResult",
 ]
@@ -0,0 +1,227 @@
+"""Years of life lost (YLL) aggregated by group.
+
+Each death loses the remaining life expectancy at its age, sex and year.
+Rather than enriching every input row and aggregating the enriched frame,
+:func:`yll` first sums the deaths of rows sharing a lookup key and a group,
+looks up life expectancy once per distinct key, and reduces the weighted
+values to the groups with one grouped sum. The cost of the lookups grows
+with the number of distinct keys, not with the number of rows or deaths.
+
+With ``samples``, the uncertainty of the WHO life expectancy is propagated
+by Monte Carlo: all samples of all distinct keys are drawn as one array per
+chunk of samples and reduced to the groups, so no lookup is repeated.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+from .lifetable import discounted_years
+from .sources import SOURCES
+from .utils import query_ages_years, query_columns
+
+YLL_COLUMNS = ["deaths", "yll", "unmatched_deaths"]
+# Standard normal quantile of the WHO 95% uncertainty intervals
+CI_Z = 1.959963984540054
+# Samples drawn from one random stream; fixed so results do not depend on workers
+SAMPLE_CHUNK = 64
+
+
+def _sample_totals(
+    size: int,
+    seed: np.random.SeedSequence,
+    draw_rows: np.ndarray,
+    expectancy: np.ndarray,
+    sd_low: np.ndarray,
+    sd_high: np.ndarray,
+    weights: np.ndarray,
+    starts: np.ndarray,
+    ages: np.ndarray,
+    discount_rate: float,
+    age_weighting: float,
+) -> np.ndarray:
+    """Years of life lost of each group in ``size`` Monte Carlo samples.
+
+    Life expectancy is drawn from a split normal distribution with the
+    given standard deviations below and above it, truncated at zero. Keys
+    with the same ``draw_rows`` code share their draws; keys are sorted by
+    group and each group's keys begin at its entry of ``starts``.
+
+    Returns:
+        Array of shape (size, number of groups).
+    """
+    z = np.random.default_rng(seed).standard_normal((size, draw_rows.max() + 1))[:, draw_rows]
+    draws = np.maximum(expectancy + z * np.where(z < 0, sd_low, sd_high), 0.0)
+    if discount_rate or age_weighting:
+        draws = discounted_years(ages, draws, discount_rate, age_weighting)
+    return np.add.reduceat(np.where(weights > 0, draws * weights, 0.0), starts, axis=1)
+
+
+def yll(
+    df: pd.DataFrame,
+    deaths: str | None = None,
+    by: list[str] | None = None,
+    source: str = "ssa",
+    cols: dict[str, str] | None = None,
+    samples: int = 0,
+    interval: float = 0.95,
+    seed: int | None = None,
+    workers: int | None = None,
+    **kwargs: Any,
+) -> pd.DataFrame:
+    """Sum the years of life lost by group.
+
+    Args:
+        df: Deaths, one row per death or per count of deaths.
+        deaths: Column holding the number of deaths of each row; None if
+            every row is one death. Missing counts are zero.
+        by: Columns to group by; None for a single total.
+        source: Life tables to use: 'ssa', 'who' or 'hld'.
+        cols: Column mapping of the source's query fields, as for its lookup
+            function (e.g. :func:`lost_years.lost_years_ssa`).
+        samples: Number of Monte Carlo samples of the WHO life expectancy,
+            drawn within its uncertainty interval, to estimate an interval
+            of the years of life lost; 0 for none. WHO source only.
+        interval: Probability covered by the estimated interval.
+        seed: Seed of the random samples, for reproducible intervals.
+        workers: Threads drawing the samples; None for the default of
+            :class:`concurrent.futures.ThreadPoolExecutor`. The result does
+            not depend on it.
+        **kwargs: Passed on to the lookup function, e.g. ``max_year_gap``.
+            With ``discount_rate`` or ``age_weighting``, the discounted and
+            age-weighted years are summed instead.
+
+    Returns:
+        DataFrame with the ``by`` columns and 'deaths', 'yll' (deaths times
+        remaining life expectancy) and 'unmatched_deaths' (deaths without a
+        life table match, left out of 'yll'), one row per group. With
+        ``samples``, also 'yll_low' and 'yll_high', the bounds of the
+        ``interval`` of the sampled years of life lost.
+
+    Raises:
+        ValueError: If the source is unknown, a column is missing, samples
+            are requested from a source without uncertainty intervals or the
+            source's data could not be loaded.
+    """
+    if source not in SOURCES:
+        raise ValueError(f"Unknown source: {source}; expected one of {list(SOURCES)}")
+    if samples and source != "who":
+        raise ValueError(f"Only the WHO data has uncertainty intervals to sample, not {source}")
+    lookup, fields = SOURCES[source]
+    by = list(by or [])
+    df_cols = query_columns(df, cols, fields)
+    missing = [c for c in [*by, *([deaths] if deaths else [])] if c not in df.columns]
+    if df_cols is None or missing:
+        raise ValueError(f"Missing columns for the {source.upper()} YLL: {missing or fields}")
+
+    # One row per distinct lookup key and group, with its deaths summed
+    weights = (
+        pd.to_numeric(df[deaths], errors="coerce").fillna(0.0)
+        if deaths
+        else pd.Series(1.0, index=df.index)
+    )
+    keys = list(dict.fromkeys([*by, *df_cols.values()]))
+    collapsed = (
+        df[keys]
+        .assign(__deaths=weights.to_numpy(dtype="float64"))
+        .groupby(keys, dropna=False, observed=True, sort=False)["__deaths"]
+        .sum()
+        .reset_index()
+    )
+
+    if samples:
+        kwargs["uncertainty"] = True
+    enriched = lookup(collapsed, cols=df_cols, **kwargs)
+    discount_rate = kwargs.get("discount_rate", 0.0)
+    age_weighting = kwargs.get("age_weighting", 0.0)
+    discounted = discount_rate or age_weighting
+    column = f"{source}_discounted_yll" if discounted else f"{source}_life_expectancy"
+    needed = [column, *(["who_life_expectancy", "who_low_ci", "who_high_ci"] if samples else [])]
+    absent = [c for c in needed if c not in enriched.columns]
+    if absent:
+        # The lookups return their input unchanged when the data cannot be loaded
+        raise ValueError(
+            f"The {source.upper()} lookup returned no {absent} columns; "
+            f"is the {source.upper()} data file available and readable?"
+        )
+    expectancy = pd.to_numeric(enriched[column], errors="coerce").to_numpy(dtype="float64")
+    counts = collapsed["__deaths"].to_numpy(dtype="float64")
+    matched = ~np.isnan(expectancy)
+
+    totals = pd.DataFrame(
+        {
+            "deaths": counts,
+            "yll": np.where(matched, counts * expectancy, 0.0),
+            "unmatched_deaths": np.where(matched, 0.0, counts),
+        }
+    )
+    if by:
+        totals[by] = collapsed[by]
+        grouped = totals.groupby(by, dropna=False, observed=True)
+        result = grouped[YLL_COLUMNS].sum().reset_index()
+        groups = grouped.ngroup().to_numpy()
+    else:
+        result = totals[YLL_COLUMNS].sum().to_frame().T
+        groups = np.zeros(len(totals), dtype=np.intp)
+    if not samples:
+        return result
+
+    # Split normal around the undiscounted expectancy, from the 95% bounds;
+    # bounds that are missing or do not bracket it (zero fills) add no spread
+    center = np.nan_to_num(enriched["who_life_expectancy"].to_numpy(dtype="float64"))
+    low = enriched["who_low_ci"].to_numpy(dtype="float64")
+    high = enriched["who_high_ci"].to_numpy(dtype="float64")
+    bracketed = (low <= center) & (center <= high)
+    sd_low = np.where(bracketed, center - low, 0.0) / CI_Z
+    sd_high = np.where(bracketed, high - center, 0.0) / CI_Z
+    # One draw per matched WHO row, shared by the keys and groups matching it
+    draw_rows = (
+        enriched.groupby(
+            [f"who_{c}" for c in ["country", "sex", "year", "age"]], dropna=False, sort=False
+        )
+        .ngroup()
+        .to_numpy()
+    )
+    # Keys alike in all but their deaths add up their deaths: the sampled
+    # years are linear in them. Sorted by group, ready for one reduction.
+    ages, _ = query_ages_years(collapsed, df_cols)
+    keyed = (
+        pd.DataFrame(
+            {
+                "group": groups,
+                "draw_rows": draw_rows,
+                "expectancy": center,
+                "sd_low": sd_low,
+                "sd_high": sd_high,
+                "ages": np.nan_to_num(ages) if discounted else 0.0,
+                "weights": np.where(matched, counts, 0.0),
+            }
+        )
+        .groupby(["group", "draw_rows", "expectancy", "sd_low", "sd_high", "ages"])["weights"]
+        .sum()
+        .reset_index()
+    )
+    starts = np.flatnonzero(np.diff(keyed.pop("group").to_numpy(), prepend=-1))
+    keyed_arrays = {name: keyed[name].to_numpy() for name in keyed.columns}
+
+    sizes = [min(SAMPLE_CHUNK, samples - start) for start in range(0, samples, SAMPLE_CHUNK)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        chunks = pool.map(
+            lambda size, chunk_seed: _sample_totals(
+                size,
+                chunk_seed,
+                starts=starts,
+                discount_rate=discount_rate,
+                age_weighting=age_weighting,
+                **keyed_arrays,
+            ),
+            sizes,
+            seeds,
+        )
+        sampled = np.concatenate(list(chunks))
+    tail = (1 - interval) / 2
+    result["yll_low"], result["yll_high"] = np.quantile(sampled, [tail, 1 - tail], axis=0)
+    return result
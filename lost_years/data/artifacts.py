@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Manifest of the packaged data artifacts.
+
+`artifacts.json` records, for every built data file, its SHA-256, size,
+modification time, row count, year range, number of countries and the
+version of the schema it was built with. Whether a file, or a cache or
+summary derived from it, is up to date can then be decided from a single
+`stat` call. Modification times do not survive a clone, checkout or
+install, so a file of the recorded size with another modification time is
+hashed once and its hash kept in a local cache (`VERIFIED_FILE`, outside
+the package), keyed by its size and modification time; later checks of the
+unchanged file are a `stat` call again.
+
+Run this module to refresh the manifest after changing data files by hand:
+
+    python -m lost_years.data.artifacts
+"""
+
+import json
+import logging
+import os
+import sys
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+from lost_years.data.schemas import SCHEMAS, validate_data_file
+from lost_years.utils import file_sha256
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = Path(__file__).parent
+MANIFEST_FILE = DATA_DIR / "artifacts.json"
+MANIFEST_FORMAT = 1
+# Built data file of each source, relative to the data directory
+ARTIFACTS = {"ssa": "ssa/ssa.csv", "who": "who/who.csv.gz", "hld": "hld/hld.csv.gz"}
+# Local cache of the hashes of data files whose modification time is not the recorded one
+VERIFIED_FILE = Path(
+    os.environ.get(
+        "LOST_YEARS_VERIFIED_CACHE", Path.home() / ".cache" / "lost_years" / "verified.json"
+    )
+)
+
+_record_lock = threading.Lock()  # Sources may be updated concurrently
+_verified_lock = threading.Lock()
+
+
+def fingerprint(path: str | Path) -> tuple[int, int] | None:
+    """Size and modification time of a file, or None if it does not exist.
+
+    Caches derived from a file can keep its fingerprint and compare it with
+    the current one to detect changes without reading the file.
+    """
+    try:
+        stat = Path(path).stat()
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def load_manifest(manifest_file: Path = MANIFEST_FILE) -> dict[str, Any]:
+    """Load the artifact manifest; an empty one if it is missing or unreadable."""
+    try:
+        manifest = json.loads(manifest_file.read_text())
+        if manifest.get("format") == MANIFEST_FORMAT:
+            return manifest
+        logger.warning(f"Ignoring artifact manifest of unknown format: {manifest_file}")
+    except FileNotFoundError:
+        pass
+    except ValueError:
+        logger.warning(f"Ignoring unreadable artifact manifest: {manifest_file}")
+    return {"format": MANIFEST_FORMAT, "artifacts": {}}
+
+
+def _load_verified() -> dict[str, list[Any]]:
+    try:
+        return json.loads(VERIFIED_FILE.read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def _verified_sha256(path: Path, current: tuple[int, int], compute: bool) -> str | None:
+    """SHA-256 of a file, from the local cache while its fingerprint is unchanged.
+
+    Args:
+        path: Data file.
+        current: Its fingerprint.
+        compute: Hash the file, and cache the hash, when it is not cached.
+
+    Returns:
+        The hash, or None if it is not cached and ``compute`` is false.
+    """
+    key = str(path.resolve())
+    with _verified_lock:
+        verified = _load_verified()
+        cached = verified.get(key)
+        if cached is not None and tuple(cached[:2]) == current:
+            return cached[2]
+        if not compute:
+            return None
+        sha256 = file_sha256(path)
+        verified[key] = [*current, sha256]
+        try:
+            VERIFIED_FILE.parent.mkdir(parents=True, exist_ok=True)
+            tmp_file = VERIFIED_FILE.with_name(f"{VERIFIED_FILE.name}.{os.getpid()}.tmp")
+            tmp_file.write_text(json.dumps(verified, indent=1, sort_keys=True))
+            tmp_file.replace(VERIFIED_FILE)
+        except OSError as e:
+            logger.debug(f"Could not cache the hash of {path}: {e}")
+        return sha256
+
+
+def artifact_status(
+    source: str,
+    path: Path | None = None,
+    manifest: dict[str, Any] | None = None,
+    verify: bool = False,
+) -> str:
+    """Compare a data file with its manifest entry.
+
+    Args:
+        source: Data source ('ssa', 'who', 'hld').
+        path: Data file; None for the packaged one.
+        manifest: Loaded manifest; None to load `artifacts.json`.
+        verify: Hash the file when its size matches but its modification
+            time does not and its hash is not in the local cache, instead
+            of reporting it as modified.
+
+    Returns:
+        'missing' (no file), 'unrecorded' (no entry), 'schema' (built with
+        another schema version), 'modified' or 'current'.
+    """
+    path = DATA_DIR / ARTIFACTS[source] if path is None else Path(path)
+    entry = (load_manifest() if manifest is None else manifest)["artifacts"].get(source)
+    current = fingerprint(path)
+    if current is None:
+        return "missing"
+    if entry is None:
+        return "unrecorded"
+    if entry["schema_version"] != SCHEMAS[source].VERSION:
+        return "schema"
+    if current == (entry["size"], entry["mtime_ns"]):
+        return "current"
+    if current[0] == entry["size"] and _verified_sha256(path, current, verify) == entry["sha256"]:
+        return "current"
+    return "modified"
+
+
+def check_artifact(source: str, path: str | Path) -> None:
+    """Warn when a packaged data file was built for another schema version.
+
+    Only reads the manifest, so loaders can call it on every load.
+    """
+    path = Path(path)
+    if path != DATA_DIR / ARTIFACTS[source]:
+        return
+    if artifact_status(source, path) == "schema":
+        logger.warning(
+            f"{path} was built for another {source.upper()} schema version; rebuild the data files"
+        )
+
+
+def describe_artifact(source: str, path: Path) -> dict[str, Any]:
+    """Build the manifest entry of a data file, reading it once.
+
+    Args:
+        source: Data source ('ssa', 'who', 'hld').
+        path: Data file.
+
+    Returns:
+        Entry with 'path', 'sha256', 'size', 'mtime_ns', 'rows',
+        'year_range', 'countries' (None for single-country sources),
+        'valid', 'schema_version' and 'built'.
+    """
+    size, mtime_ns = fingerprint(path) or (0, 0)
+    result = validate_data_file(source, str(path))
+    years = result.get("years") or []
+    try:
+        relative = str(path.relative_to(DATA_DIR))
+    except ValueError:
+        relative = str(path)
+    return {
+        "path": relative,
+        "sha256": file_sha256(path),
+        "size": size,
+        "mtime_ns": mtime_ns,
+        "rows": result.get("row_count", 0),
+        "year_range": [years[0], years[-1]] if years else None,
+        "countries": result.get("countries"),
+        "valid": result["valid"],
+        "schema_version": SCHEMAS[source].VERSION,
+        "built": datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+def record_artifacts(
+    sources: list[str] | None = None,
+    paths: dict[str, Path] | None = None,
+    manifest_file: Path = MANIFEST_FILE,
+) -> dict[str, Any]:
+    """Refresh the manifest entries of data files that changed.
+
+    Files whose entry is still current are not read. Entries of files that
+    no longer exist are dropped.
+
+    Args:
+        sources: Sources to refresh; None for all.
+        paths: Data file per source; defaults to the packaged files.
+        manifest_file: Manifest to update.
+
+    Returns:
+        The updated manifest.
+    """
+    with _record_lock:
+        return _record_artifacts(sources, paths or {}, manifest_file)
+
+
+def _record_artifacts(
+    sources: list[str] | None, paths: dict[str, Path], manifest_file: Path
+) -> dict[str, Any]:
+    manifest = load_manifest(manifest_file)
+    entries = manifest["artifacts"]
+    changed = False
+    for source in sources or list(ARTIFACTS):
+        path = paths.get(source, DATA_DIR / ARTIFACTS[source])
+        status = artifact_status(source, path, manifest, verify=True)
+        if status == "current":
+            # Same contents, e.g. after a checkout: the local cache keeps the check fast
+            continue
+        if status == "missing":
+            changed |= entries.pop(source, None) is not None
+            continue
+        logger.info(f"Recording {source.upper()} artifact ({status}): {path}")
+        entries[source] = describe_artifact(source, path)
+        changed = True
+    if changed:
+        tmp_file = manifest_file.with_name(manifest_file.name + ".tmp")
+        tmp_file.write_text(json.dumps(manifest, indent=2, sort_keys=True) + "\n")
+        tmp_file.replace(manifest_file)
+    return manifest
+
+
+def main() -> int:
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s - %(message)s")
+    manifest = record_artifacts()
+    for source, entry in manifest["artifacts"].items():
+        years = entry["year_range"] or ["?", "?"]
+        logger.info(
+            f"{source.upper():>3}: {entry['path']} {entry['rows']:,} rows, "
+            f"{years[0]}-{years[1]}, sha256 {entry['sha256'][:12]}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
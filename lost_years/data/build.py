@@ -0,0 +1,484 @@
+#!/usr/bin/env python3
+"""
+Data build pipeline for lost_years package.
+
+The packaged data files are built by a DAG of steps, from the raw
+downloads through cleaned, typed and indexed tables to the bundled data
+files:
+
+    who/who-lt.csv.gz -> who.clean -> who.typed -> who.indexed -> who.bundle
+    ssa/ssa.csv -> ssa.typed
+    hld/hld.zip -> hld.bundle
+
+Every step's output is cached under a key hashed from the step's name and
+version and the hashes of its inputs. Intermediate tables are pickled in
+the `.build` directory; bundled data files are written in place and
+recorded in the artifact manifest. The SSA table is maintained by hand, so
+its build only checks it against the schema. With `--changed-only`, steps whose key
+and output are unchanged are skipped; file hashes are memoized by size and
+modification time, so a no-op build only needs a `stat` call per file.
+
+Usage:
+
+    lost_years_build [--changed-only] [--dry-run] [steps ...]
+"""
+
+import argparse
+import graphlib
+import hashlib
+import json
+import logging
+import sys
+import time
+import zipfile
+from collections.abc import Callable
+from dataclasses import dataclass
+from pathlib import Path
+from typing import IO, Any
+
+import pandas as pd
+
+from lost_years.data.artifacts import fingerprint, record_artifacts
+from lost_years.data.incremental import PartitionedWriter, save_incremental
+from lost_years.data.schemas import SCHEMAS, HLDSchema, reader_dtypes
+from lost_years.utils import file_sha256
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = Path(__file__).parent
+CACHE_DIR = DATA_DIR / ".build"
+STATE_FORMAT = 1
+
+# Partition keys of the bundled WHO file; see `save_incremental`
+WHO_KEYS = ["country_code", "year", "sex_code"]
+WHO_BLOCK_KEYS = ["year"]
+# Partition keys of the bundled HLD file; see `PartitionedWriter`
+HLD_KEYS = ["Country", "Year1", "Sex"]
+HLD_BLOCK_KEYS = ["Country"]
+
+# Raw HLD columns by type; all other columns are kept as strings
+HLD_INT_COLUMNS = pd.Index(
+    [
+        "Region",
+        "Residence",
+        "Ethnicity",
+        "SocDem",
+        "Version",
+        "Year1",
+        "Year2",
+        "TypeLT",
+        "Sex",
+        "Age",
+        "AgeInt",
+    ]
+)
+HLD_FLOAT_COLUMNS = pd.Index(["m(x)", "q(x)", "l(x)", "d(x)", "L(x)", "T(x)", "e(x)", "e(x)Orig"])
+# Raw columns without which the loader drops a row (see HLDSchema.LAYOUT)
+HLD_REQUIRED_COLUMNS = pd.Index(
+    [raw for raw, name in HLDSchema.LAYOUT.renames.items() if name in HLDSchema.LAYOUT.required]
+)
+
+
+@dataclass(frozen=True)
+class Step:
+    """One step of the build.
+
+    Attributes:
+        name: Step name, '<source>.<stage>'.
+        inputs: Names of the steps, or paths relative to the data directory
+            of the files, the step reads.
+        run: Called with the input paths and the output path; writes the
+            output.
+        output: Bundled data file written, relative to the data directory;
+            None for an intermediate table cached in `.build`.
+        version: Bump to rebuild the step after changing `run`.
+    """
+
+    name: str
+    inputs: tuple[str, ...]
+    run: Callable[[list[Path], Path], None]
+    output: str | None = None
+    version: int = 1
+
+
+def clean_who(df: pd.DataFrame) -> pd.DataFrame:
+    """Map raw WHO GHO rows (CSV export or OData API) to the WHO schema.
+
+    Args:
+        df: Raw WHO rows.
+
+    Returns:
+        Schema columns, without rows missing a key or life expectancy and
+        with the 'SEX_' and 'AGEGROUP_' code prefixes removed.
+    """
+    clean_df = pd.DataFrame(
+        {
+            "country_code": df.get("COUNTRY (CODE)", df.get("SpatialDim", "")),
+            "country_name": df.get("COUNTRY (DISPLAY)", df.get("ParentLocation", "")),
+            "year": df.get("YEAR (CODE)", df.get("TimeDim", 0)),
+            "sex_code": df.get("SEX (CODE)", df.get("Dim1", "")),
+            "age_group": df.get("AGEGROUP (CODE)", df.get("Dim2", "AGELT1")),
+            "life_expectancy": df.get("Numeric", df.get("NumericValue", 0.0)),
+            "low_ci": df.get("Low", 0.0),
+            "high_ci": df.get("High", 0.0),
+        }
+    )
+    clean_df = clean_df.dropna(subset=["country_code", "year", "sex_code", "life_expectancy"])
+    clean_df = clean_df[clean_df["life_expectancy"] > 0]  # Remove invalid values
+    clean_df["sex_code"] = clean_df["sex_code"].str.replace("SEX_", "", regex=False)
+    # Rows without an age group are life expectancy at birth
+    clean_df["age_group"] = (
+        clean_df["age_group"].fillna("AGELT1").str.replace("AGEGROUP_", "", regex=False)
+    )
+    return clean_df
+
+
+def clean_hld(chunk: pd.DataFrame) -> pd.DataFrame:
+    """Give raw HLD rows, read as strings, the fixed types of their columns.
+
+    Args:
+        chunk: Raw HLD rows.
+
+    Returns:
+        The rows with integer, float and string columns, without rows
+        missing a value the loader requires, e.g. the age or the life
+        expectancy.
+    """
+    chunk.columns = chunk.columns.str.strip()
+    for col in HLD_INT_COLUMNS.intersection(chunk.columns):
+        chunk[col] = pd.to_numeric(chunk[col], errors="coerce").round().astype("Int64")
+    for col in HLD_FLOAT_COLUMNS.intersection(chunk.columns):
+        chunk[col] = pd.to_numeric(chunk[col], errors="coerce").astype("float64")
+    for col in chunk.columns.difference([*HLD_INT_COLUMNS, *HLD_FLOAT_COLUMNS]):
+        chunk[col] = chunk[col].astype("string").str.strip()
+    return chunk.dropna(subset=HLD_REQUIRED_COLUMNS.intersection(chunk.columns))
+
+
+def hld_member(names: list[str]) -> str | None:
+    """Name of the data file in the HLD zip ('res' or a CSV), None if absent."""
+    return next((n for n in names if n in ["res", "data.csv"] or n.endswith(".csv")), None)
+
+
+def save_hld(
+    csv_source: str | Path | IO[bytes], output_file: str | Path, chunk_size: int = 50000
+) -> int:
+    """Clean the raw HLD CSV into the partitioned HLD data file.
+
+    The data is read, cleaned and written one chunk at a time, so peak
+    memory is a few chunks whatever the size of the file. Only countries
+    whose tables changed are rewritten; replaced partitions are kept as
+    delta backups.
+
+    Args:
+        csv_source: Path or binary file object of the raw HLD CSV.
+        output_file: Path of the gzip CSV data file to write.
+        chunk_size: Number of rows per chunk.
+
+    Returns:
+        Number of rows written.
+
+    Raises:
+        ValueError: If the source has no usable rows.
+    """
+    countries: set[str] = set()
+    years: list[int] = []
+    with PartitionedWriter(Path(output_file), HLD_KEYS, block_keys=HLD_BLOCK_KEYS) as writer:
+        for i, chunk in enumerate(
+            pd.read_csv(
+                csv_source, chunksize=chunk_size, dtype=str, na_values=["."], on_bad_lines="skip"
+            )
+        ):
+            chunk = clean_hld(chunk)
+            writer.write(chunk)
+            countries.update(chunk["Country"].unique())
+            if not chunk.empty:
+                years += [chunk["Year1"].min(), chunk["Year1"].max()]
+            if (i + 1) % 20 == 0:
+                logger.info(f"Processed {writer.rows:,} rows...")
+        if writer.rows == 0:
+            # Raised inside the writer, so the existing file is left untouched
+            raise ValueError(f"No HLD records found in {csv_source}")
+    logger.info(
+        f"Saved {writer.rows:,} HLD records of {len(countries)} countries, "
+        f"years {min(years)}-{max(years)}, to {output_file}"
+    )
+    return writer.rows
+
+
+def _typed(source: str) -> Callable[[list[Path], Path], None]:
+    """Step casting a table to its schema's dtypes and validating it."""
+
+    def run(inputs: list[Path], output: Path) -> None:
+        path = inputs[0]
+        df = pd.read_pickle(path) if path.suffix == ".pkl" else pd.read_csv(path)
+        schema = SCHEMAS[source]
+        df = df.astype(reader_dtypes(schema, df.columns))
+        result = schema.validate(df)
+        for issue in result["issues"]:
+            logger.warning(f"{source.upper()}: {issue}")
+        if any(issue.startswith("Missing columns") for issue in result["issues"]):
+            raise ValueError(f"{source.upper()} data is missing schema columns")
+        df.to_pickle(output)
+
+    return run
+
+
+def _who_clean(inputs: list[Path], output: Path) -> None:
+    clean_who(pd.read_csv(inputs[0])).to_pickle(output)
+
+
+def _who_indexed(inputs: list[Path], output: Path) -> None:
+    # One row per lookup key, in the partition order of the bundled file
+    df = pd.read_pickle(inputs[0])
+    keys = [*WHO_KEYS, "age_group"]
+    df = df.drop_duplicates(keys, keep="last")
+    sort_keys = [*WHO_BLOCK_KEYS, *[k for k in keys if k not in WHO_BLOCK_KEYS]]
+    df.sort_values(sort_keys, kind="stable").reset_index(drop=True).to_pickle(output)
+
+
+def _who_bundle(inputs: list[Path], output: Path) -> None:
+    df = pd.read_pickle(inputs[0])
+    save_incremental(df, output, WHO_KEYS, block_keys=WHO_BLOCK_KEYS)
+
+
+def _hld_bundle(inputs: list[Path], output: Path) -> None:
+    # The HLD zip is cleaned in a single streaming pass
+    with zipfile.ZipFile(inputs[0]) as zf:
+        member = hld_member(zf.namelist())
+        if member is None:
+            raise ValueError(f"No HLD data file in {inputs[0]}")
+        with zf.open(member) as f:
+            save_hld(f, output)
+
+
+STEPS = [
+    Step("who.clean", ("who/who-lt.csv.gz",), _who_clean),
+    Step("who.typed", ("who.clean",), _typed("who")),
+    Step("who.indexed", ("who.typed",), _who_indexed),
+    Step("who.bundle", ("who.indexed",), _who_bundle, output="who/who.csv.gz"),
+    Step("ssa.typed", ("ssa/ssa.csv",), _typed("ssa")),
+    Step("hld.bundle", ("hld/hld.zip",), _hld_bundle, output="hld/hld.csv.gz"),
+]
+
+
+class Pipeline:
+    """Run build steps in dependency order, reusing cached outputs."""
+
+    def __init__(
+        self,
+        steps: list[Step] | None = None,
+        data_dir: Path = DATA_DIR,
+        cache_dir: Path | None = None,
+    ) -> None:
+        """Check the step graph and load the build state.
+
+        Args:
+            steps: Build steps; None for `STEPS`.
+            data_dir: Directory the steps' file paths and the artifact
+                manifest are relative to.
+            cache_dir: Directory of intermediate outputs and the build state;
+                None for `.build` in `data_dir`.
+
+        Raises:
+            ValueError: If the steps' inputs form a cycle.
+        """
+        self.steps = {step.name: step for step in (STEPS if steps is None else steps)}
+        self.data_dir = Path(data_dir)
+        self.cache_dir = self.data_dir / ".build" if cache_dir is None else Path(cache_dir)
+        self.state_file = self.cache_dir / "state.json"
+        graph = {
+            name: {i for i in step.inputs if i in self.steps} for name, step in self.steps.items()
+        }
+        try:
+            self.order = list(graphlib.TopologicalSorter(graph).static_order())
+        except graphlib.CycleError as e:
+            raise ValueError(f"Build steps form a cycle: {e.args[1]}") from e
+        self.state = self._load_state()
+
+    def _load_state(self) -> dict[str, Any]:
+        try:
+            state = json.loads(self.state_file.read_text())
+            if state.get("format") == STATE_FORMAT:
+                return state
+        except FileNotFoundError:
+            pass
+        except ValueError:
+            logger.warning(f"Ignoring unreadable build state: {self.state_file}")
+        return {"format": STATE_FORMAT, "files": {}, "steps": {}}
+
+    def _save_state(self) -> None:
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.state_file.with_name(self.state_file.name + ".tmp")
+        tmp_file.write_text(json.dumps(self.state, indent=1, sort_keys=True))
+        tmp_file.replace(self.state_file)
+
+    def file_hash(self, path: Path) -> str | None:
+        """SHA-256 of a file, memoized by its size and modification time.
+
+        Returns:
+            The hex digest, or None if the file does not exist.
+        """
+        current = fingerprint(path)
+        if current is None:
+            return None
+        memo = self.state["files"].get(str(path))
+        if memo is not None and tuple(memo["stat"]) == current:
+            return memo["sha256"]
+        digest = file_sha256(path)
+        self.state["files"][str(path)] = {"stat": list(current), "sha256": digest}
+        return digest
+
+    def input_paths(self, step: Step) -> list[Path] | None:
+        """Input files of a step, or None if an upstream step was never built."""
+        paths = []
+        for name in step.inputs:
+            if name not in self.steps:
+                paths.append(self.data_dir / name)
+            elif name in self.state["steps"]:
+                paths.append(Path(self.state["steps"][name]["output"]))
+            else:
+                return None
+        return paths
+
+    def step_key(self, step: Step) -> str | None:
+        """Cache key of a step, or None if one of its inputs is missing."""
+        paths = self.input_paths(step)
+        if paths is None:
+            return None
+        parts: list[Any] = [step.name, step.version]
+        for name, path in zip(step.inputs, paths, strict=True):
+            digest = self.file_hash(path)
+            if digest is None:
+                return None
+            parts.append([name, digest])
+        return hashlib.sha256(json.dumps(parts).encode()).hexdigest()
+
+    def output_path(self, step: Step, key: str) -> Path:
+        """Where a step writes its output for a given cache key."""
+        if step.output is not None:
+            return self.data_dir / step.output
+        return self.cache_dir / f"{step.name}-{key[:16]}.pkl"
+
+    def is_cached(self, step: Step, key: str) -> bool:
+        """Whether a step's recorded output was built from `key` and is unchanged."""
+        entry = self.state["steps"].get(step.name)
+        return (
+            entry is not None
+            and entry["key"] == key
+            and self.file_hash(Path(entry["output"])) == entry["sha256"]
+        )
+
+    def select(self, targets: list[str] | None = None) -> list[str]:
+        """Steps needed for `targets`, in build order.
+
+        Args:
+            targets: Step names or sources (e.g. 'who'); None for all steps.
+
+        Raises:
+            ValueError: If a target matches no step.
+        """
+        if not targets:
+            return list(self.order)
+        pending = []
+        for target in targets:
+            matches = [n for n in self.steps if n == target or n.startswith(f"{target}.")]
+            if not matches:
+                raise ValueError(f"Unknown build step: {target}")
+            pending.extend(matches)
+        needed: set[str] = set()
+        while pending:
+            name = pending.pop()
+            if name not in needed:
+                needed.add(name)
+                pending.extend(i for i in self.steps[name].inputs if i in self.steps)
+        return [name for name in self.order if name in needed]
+
+    def run(
+        self, targets: list[str] | None = None, changed_only: bool = False, dry_run: bool = False
+    ) -> dict[str, str]:
+        """Build the steps needed for `targets`.
+
+        Args:
+            targets: Step names or sources (e.g. 'who'); None for all steps.
+            changed_only: Skip steps whose inputs and output are unchanged.
+            dry_run: Only report what would be built.
+
+        Returns:
+            Status per step: 'cached', 'built', 'would build', 'missing
+            input' (a raw file or upstream output is unavailable) or
+            'failed'.
+        """
+        statuses: dict[str, str] = {}
+        for name in self.select(targets):
+            step = self.steps[name]
+            upstream = {statuses.get(i) for i in step.inputs}
+            if upstream & {"missing input", "failed"}:
+                statuses[name] = "missing input"
+            elif dry_run and "would build" in upstream:
+                statuses[name] = "would build"
+            elif (key := self.step_key(step)) is None:
+                statuses[name] = "missing input"
+            elif changed_only and self.is_cached(step, key):
+                statuses[name] = "cached"
+            elif dry_run:
+                statuses[name] = "would build"
+            else:
+                statuses[name] = self._build(step, key)
+        if not dry_run:
+            self._save_state()
+        return statuses
+
+    def _build(self, step: Step, key: str) -> str:
+        output = self.output_path(step, key)
+        output.parent.mkdir(parents=True, exist_ok=True)
+        started = time.time()
+        try:
+            step.run(self.input_paths(step) or [], output)
+        except Exception as e:
+            logger.error(f"{step.name}: {e}")
+            return "failed"
+        if step.output is not None:
+            source = step.name.split(".")[0]
+            record_artifacts([source], {source: output}, self.data_dir / "artifacts.json")
+        previous = self.state["steps"].get(step.name)
+        if previous is not None and previous["output"] != str(output):
+            Path(previous["output"]).unlink(missing_ok=True)  # Replaced intermediate
+        self.state["steps"][step.name] = {
+            "key": key,
+            "output": str(output),
+            "sha256": self.file_hash(output),
+        }
+        logger.info(f"{step.name}: built {output.name} in {time.time() - started:.1f}s")
+        return "built"
+
+
+def main(argv: list[str] = sys.argv[1:]) -> int:
+    parser = argparse.ArgumentParser(description="Build the lost_years data files")
+    parser.add_argument(
+        "steps", nargs="*", help="Steps or sources to build, e.g. `who` (default: all)"
+    )
+    parser.add_argument(
+        "--changed-only",
+        action="store_true",
+        help="Skip steps whose inputs and output are unchanged since the last build",
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Only list the steps that would be built"
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s - %(message)s")
+
+    started = time.time()
+    try:
+        statuses = Pipeline().run(args.steps, args.changed_only, args.dry_run)
+    except ValueError as e:
+        logger.error(str(e))
+        return 2
+    for name, status in statuses.items():
+        logger.info(f"{name:<12} {status}")
+    logger.info(f"Done in {time.time() - started:.2f}s")
+    return 1 if "failed" in statuses.values() else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
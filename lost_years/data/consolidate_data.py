@@ -12,6 +12,8 @@ from pathlib import Path
 
 import pandas as pd
 
+from lost_years.data.artifacts import record_artifacts
+
 # Setup logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
@@ -79,6 +81,7 @@ def consolidate_who_data():
                 "country_name": df["COUNTRY (DISPLAY)"].fillna(""),
                 "year": df["YEAR (CODE)"],
                 "sex_code": df["SEX (CODE)"],
+                "age_group": df["AGEGROUP (CODE)"].fillna("AGELT1"),
                 "life_expectancy": df["Numeric"],
                 "low_ci": df["Low"],
                 "high_ci": df["High"],
@@ -176,15 +179,15 @@ def main():
     logger.info("CONSOLIDATION SUMMARY")
     logger.info("=" * 50)
 
+    # Row counts come from the artifact manifest, which only re-reads files that changed
+    artifacts = record_artifacts(["ssa", "who"])["artifacts"]
     final_files = {"SSA": ssa_file, "WHO": who_file, "HMD": hmd_file}
 
     for source, file_path in final_files.items():
+        entry = artifacts.get(source.lower())
         if file_path and file_path.exists():
-            if file_path.suffix == ".gz":
-                df = pd.read_csv(file_path, compression="gzip")
-            else:
-                df = pd.read_csv(file_path)
-            logger.info(f"{source:>3}: ✅ {file_path.name} ({len(df)} rows)")
+            rows = f"{entry['rows']} rows" if entry else "placeholder"
+            logger.info(f"{source:>3}: ✅ {file_path.name} ({rows})")
         else:
             logger.info(f"{source:>3}: ❌ No data file")
 
@@ -9,10 +9,12 @@ this script provides instructions for manual download and processing.
 
 import logging
 import zipfile
-from datetime import datetime
 from pathlib import Path
 
-import pandas as pd
+import requests
+
+from lost_years.data.build import hld_member, save_hld
+from lost_years.utils import download_file
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
@@ -20,6 +22,8 @@ logger = logging.getLogger(__name__)
 
 # Base directory
 DATA_DIR = Path(__file__).parent
+# Optional `sha256sum` style manifest used to verify downloads
+CHECKSUM_MANIFEST = DATA_DIR / "SHA256SUMS"
 
 
 class HLDDataUpdater:
@@ -47,78 +51,60 @@ class HLDDataUpdater:
 
         return None
 
+    def download_hld_zip(self):
+        """Try downloading the HLD zip file directly.
+
+        The download is streamed to disk, resumed if interrupted and verified
+        against CHECKSUM_MANIFEST when it exists.
+        """
+        zip_path = DATA_DIR / "hld.zip"
+        logger.info(f"Downloading HLD data from {self.download_url}")
+        try:
+            return download_file(
+                self.download_url,
+                zip_path,
+                manifest=CHECKSUM_MANIFEST if CHECKSUM_MANIFEST.exists() else None,
+            )
+        except (requests.RequestException, ValueError) as e:
+            logger.error(f"Direct download failed: {e}")
+            return None
+
     def process_hld_zip(self, zip_path):
-        """Process downloaded HLD zip file."""
+        """Clean and save the HLD data file streamed straight from the zip."""
         logger.info(f"Processing HLD zip file: {zip_path}")
 
         try:
             with zipfile.ZipFile(zip_path, "r") as zf:
-                # Extract the main data file (usually 'res')
+                # Find the main data file (usually 'res')
                 files = zf.namelist()
                 logger.info(f"Zip contains: {files}")
 
-                # Find the main data file
-                data_file = None
-                for fname in files:
-                    if fname in ["res", "data.csv"] or fname.endswith(".csv"):
-                        data_file = fname
-                        break
-
-                if data_file:
-                    logger.info(f"Extracting: {data_file}")
-                    zf.extract(data_file, DATA_DIR)
-                    return DATA_DIR / data_file
-                else:
+                data_file = hld_member(files)
+                if data_file is None:
                     logger.error("No recognizable data file found in zip")
-                    return None
+                    return False
+
+                logger.info(f"Streaming: {data_file}")
+                with zf.open(data_file) as f:
+                    return self.clean_and_save_hld_data(f)
 
         except Exception as e:
             logger.error(f"Error processing zip file: {e}")
-            return None
+            return False
+
+    def clean_and_save_hld_data(self, csv_source, chunk_size=50000):
+        """Clean and save HLD data in standardized format.
 
-    def clean_and_save_hld_data(self, csv_path):
-        """Clean and save HLD data in standardized format."""
-        logger.info(f"Cleaning HLD data from: {csv_path}")
+        Args:
+            csv_source: Path or binary file object of the raw HLD CSV.
+            chunk_size: Number of rows per chunk.
+        """
+        logger.info(f"Cleaning HLD data from: {csv_source}")
 
         try:
-            # Read in chunks to handle large file and potential parsing errors
-            logger.info("Reading HLD data in chunks...")
-            chunks = []
-            chunk_size = 50000
-            total_rows = 0
-
-            for chunk in pd.read_csv(
-                csv_path, chunksize=chunk_size, low_memory=False, on_bad_lines="skip"
-            ):
-                chunks.append(chunk)
-                total_rows += len(chunk)
-                if len(chunks) % 20 == 0:
-                    logger.info(f"Processed {total_rows:,} rows...")
-
-            # Combine all chunks
-            logger.info("Combining data chunks...")
-            df = pd.concat(chunks, ignore_index=True)
-
-            logger.info(f"Loaded {len(df):,} HLD records")
-            logger.info(f"Countries: {df['Country'].nunique()}")
-            logger.info(f"Years: {df['Year1'].min()}-{df['Year1'].max()}")
-
-            # Save as compressed CSV
             output_file = DATA_DIR / "hld.csv.gz"
-            backup_file = DATA_DIR / f"hld-backup-{datetime.now().strftime('%Y%m%d')}.csv.gz"
-
-            # Backup existing file
-            if output_file.exists():
-                import shutil
-
-                shutil.copy2(output_file, backup_file)
-                logger.info(f"Backed up original data to {backup_file}")
-
-            # Save new clean data
-            df.to_csv(output_file, compression="gzip", index=False)
-            logger.info(f"Saved clean HLD data: {output_file}")
+            save_hld(csv_source, output_file, chunk_size)
             logger.info(f"File size: {output_file.stat().st_size / 1024**2:.1f} MB")
-
             return True
 
         except Exception as e:
@@ -142,20 +128,20 @@ class HLDDataUpdater:
         print(f"   {self.download_url}")
         print("=" * 60)
 
-    def update_hld_data(self):
+    def update_hld_data(self, download=False):
         """Main method to update HLD data."""
         logger.info("Starting HLD data update...")
 
         # Check for existing downloaded data
         existing_file = self.check_for_downloaded_data()
+        if existing_file is None and download:
+            existing_file = self.download_hld_zip()
 
         if existing_file:
             if existing_file.suffix == ".zip":
                 # Process zip file
-                logger.info("Found zip file, extracting...")
-                csv_file = self.process_hld_zip(existing_file)
-                if csv_file:
-                    return self.clean_and_save_hld_data(csv_file)
+                logger.info("Found zip file, streaming its data file...")
+                return self.process_hld_zip(existing_file)
 
             elif existing_file.name == "res" or existing_file.suffix == ".csv":
                 # Process CSV file directly
@@ -179,6 +165,9 @@ def main():
 
     parser = argparse.ArgumentParser(description="Update HLD life table data (manual download)")
     parser.add_argument("--verbose", "-v", action="store_true", help="Verbose output")
+    parser.add_argument(
+        "--download", action="store_true", help="Try downloading hld.zip directly first"
+    )
 
     args = parser.parse_args()
 
@@ -192,7 +181,7 @@ def main():
     print()
 
     updater = HLDDataUpdater()
-    success = updater.update_hld_data()
+    success = updater.update_hld_data(download=args.download)
 
     if success:
         print("✅ HLD data updated successfully!")
@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+"""
+Incremental updates of partitioned gzip CSV data files.
+
+A data file is written as a sequence of gzip members: one holding the CSV
+header, then one per block of partitions (e.g. all countries' rows for a
+year). Readers see an ordinary gzip CSV, as concatenated members decompress
+to one stream. A JSON manifest next to the file records the content hash of
+every partition (e.g. country, year and sex) and the byte range of every
+block, so later updates can:
+
+- skip writing entirely when no partition changed,
+- append new blocks to the end of the file when no existing block changed,
+- otherwise copy unchanged blocks' compressed bytes verbatim and only
+  compress the changed ones.
+
+Instead of full dated backup copies, each update that changes or removes
+blocks stores the replaced blocks in a small delta file.
+
+Data can be written in chunks with `PartitionedWriter`: each chunk's rows
+are spooled to a temporary file by partition, so memory use is bounded by
+the chunk size rather than the size of the data. Blocks are compressed in
+worker threads, and `lost_years.utils.read_csv_blocks` uses the manifest to
+decompress and parse them in parallel.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import zlib
+from collections import deque
+from collections.abc import Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import IO, Any
+
+import numpy as np
+import pandas as pd
+
+from lost_years.utils import manifest_path
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FORMAT = 1
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+def load_manifest(output_file: Path) -> dict[str, Any] | None:
+    """Load the manifest of `output_file` if it still describes the file.
+
+    Returns:
+        The manifest, or None if it is missing, unreadable or out of date
+        (e.g. the data file was replaced by another tool).
+    """
+    path = manifest_path(output_file)
+    if not (path.exists() and output_file.exists()):
+        return None
+    try:
+        manifest = json.loads(path.read_text())
+    except ValueError:
+        logger.warning(f"Ignoring unreadable manifest: {path}")
+        return None
+    if (
+        manifest.get("format") != MANIFEST_FORMAT
+        or manifest.get("file_size") != output_file.stat().st_size
+    ):
+        logger.warning(f"Manifest {path} does not match {output_file}, rewriting in full")
+        return None
+    return manifest
+
+
+def _join_keys(df: pd.DataFrame, cols: list[str]) -> list[str]:
+    parts = [df[col].astype(str) for col in cols]
+    return parts[0].str.cat(parts[1:], sep="|").tolist()
+
+
+def _serialize_partitions(
+    df: pd.DataFrame, keys: list[str], block_keys: list[str]
+) -> list[tuple[str, str, bytes]]:
+    """Serialize the rows of each partition in `df`.
+
+    Partitions are listed in order of first appearance and keep their rows
+    in input order.
+
+    Returns:
+        (partition key, block key, CSV rows) per partition.
+    """
+    codes = df.groupby(keys, sort=False, dropna=False).ngroup().to_numpy()
+    order = np.argsort(codes, kind="stable")
+    ordered = df.iloc[order]
+    starts = np.concatenate([[0], np.cumsum(np.bincount(codes))])
+    firsts = ordered.iloc[starts[:-1]]
+
+    text_cols = ordered.select_dtypes(include=["object", "string"])
+    multiline = text_cols.apply(lambda c: c.astype(str).str.contains("[\r\n]").any()).any()
+    spans = list(zip(starts[:-1], starts[1:], strict=True))
+    if multiline:
+        # Quoted line breaks: lines no longer map to rows
+        bodies = [ordered.iloc[a:b].to_csv(index=False, header=False).encode() for a, b in spans]
+    else:
+        lines = ordered.to_csv(index=False, header=False).encode().splitlines(keepends=True)
+        bodies = [b"".join(lines[a:b]) for a, b in spans]
+    return list(zip(_join_keys(firsts, keys), _join_keys(firsts, block_keys), bodies, strict=True))
+
+
+def _gzip_compressor(compresslevel: int) -> Any:
+    # wbits=31 writes a gzip member with a zero mtime, so identical blocks
+    # give identical bytes
+    return zlib.compressobj(compresslevel, zlib.DEFLATED, 31)
+
+
+def _copy_range(src: IO[bytes], dst: IO[bytes], offset: int, length: int) -> None:
+    src.seek(offset)
+    while length > 0:
+        data = src.read(min(length, COPY_BUFFER_SIZE))
+        if not data:
+            raise EOFError(f"Unexpected end of file at offset {src.tell()}")
+        dst.write(data)
+        length -= len(data)
+
+
+class PartitionedWriter:
+    """Write a partitioned gzip CSV chunk by chunk, rewriting only what changed.
+
+    Rows are spooled uncompressed to a temporary file, grouped by partition.
+    On `close` the partition hashes are compared with the manifest of the
+    existing file and only new or changed blocks are compressed; unchanged
+    blocks are copied from the existing file. Blocks and partitions keep the
+    order in which they first appear, and the rows of a partition stay
+    together even if they arrive in several chunks.
+
+    Usage::
+
+        with PartitionedWriter(path, ["country", "year", "sex"], ["country"]) as writer:
+            for chunk in chunks:
+                writer.write(chunk)
+        print(writer.summary)
+    """
+
+    def __init__(
+        self,
+        output_file: str | Path,
+        keys: list[str],
+        block_keys: list[str] | None = None,
+        compresslevel: int = 9,
+        workers: int | None = None,
+    ) -> None:
+        """Open a temporary spool for the rows.
+
+        Args:
+            output_file: Gzip CSV file to create or update.
+            keys: Columns identifying a partition, e.g. country, year and sex.
+            block_keys: Subset of `keys` grouping partitions into one
+                compressed block; None for one block per partition. Small
+                partitions compress poorly on their own, and blocking by the
+                key new data arrives under (e.g. year) lets updates append.
+            compresslevel: Gzip compression level of newly written blocks.
+            workers: Number of threads compressing blocks; None for the
+                number of CPUs. The output does not depend on it.
+        """
+        self.output_file = Path(output_file)
+        self.keys = keys
+        self.block_keys = keys if block_keys is None else block_keys
+        self.compresslevel = compresslevel
+        self.workers = workers or os.cpu_count() or 1
+        self.columns: list[str] | None = None
+        self.rows = 0
+        self.summary: dict[str, Any] | None = None
+        self._spool = tempfile.TemporaryFile()
+        self._spool_size = 0
+        self._spool_lock = threading.Lock()
+        # Per partition: block key, spooled (offset, length) segments, hash
+        self._partitions: dict[str, tuple[str, list[tuple[int, int]], Any]] = {}
+        self._blocks: dict[str, list[str]] = {}
+
+    def __enter__(self) -> "PartitionedWriter":
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Any, tb: Any) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self._spool.close()
+
+    def write(self, chunk: pd.DataFrame) -> None:
+        """Add a chunk of rows.
+
+        Chunks must share the same columns. Give the columns fixed dtypes so
+        the same values always serialize the same way (e.g. nullable Int64
+        rather than float for integer columns with missing values);
+        otherwise unchanged partitions may be reported as changed.
+        """
+        if self.columns is None:
+            self.columns = list(chunk.columns)
+        elif list(chunk.columns) != self.columns:
+            raise ValueError(f"Chunk columns {list(chunk.columns)} differ from {self.columns}")
+        if chunk.empty:
+            return
+        self.rows += len(chunk)
+        for key, block, body in _serialize_partitions(
+            chunk.reset_index(drop=True), self.keys, self.block_keys
+        ):
+            if key not in self._partitions:
+                self._partitions[key] = (block, [], hashlib.sha256())
+                self._blocks.setdefault(block, []).append(key)
+            _, segments, digest = self._partitions[key]
+            self._spool.write(body)
+            segments.append((self._spool_size, len(body)))
+            self._spool_size += len(body)
+            digest.update(body)
+
+    def _compress_block(self, block: str) -> bytes:
+        """Compress a spooled block into one gzip member."""
+        compressor = _gzip_compressor(self.compresslevel)
+        parts = []
+        for key in self._blocks[block]:
+            for offset, size in self._partitions[key][1]:
+                with self._spool_lock:
+                    self._spool.seek(offset)
+                    data = self._spool.read(size)
+                parts.append(compressor.compress(data))
+        parts.append(compressor.flush())
+        return b"".join(parts)
+
+    def _compressed_blocks(self, blocks: list[str]) -> Iterator[bytes]:
+        """Compress `blocks` in worker threads, yielding them in order.
+
+        At most twice as many blocks as workers are compressed ahead of the
+        one being written, which bounds the memory held by finished blocks.
+        """
+        if self.workers < 2 or len(blocks) < 2:
+            for block in blocks:
+                yield self._compress_block(block)
+            return
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending: deque[Future[bytes]] = deque()
+            for block in blocks:
+                pending.append(executor.submit(self._compress_block, block))
+                if len(pending) >= 2 * self.workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def close(self) -> dict[str, Any]:
+        """Compare with the existing file, write what changed and the manifest.
+
+        Returns:
+            Summary with the new 'version', the number of 'added', 'changed',
+            'removed' and 'unchanged' partitions, the number of
+            'blocks_written', the 'mode' ('unchanged', 'append', 'rewrite' or
+            'full'), 'bytes_written' and the 'delta' backup file name (None if
+            nothing was replaced).
+        """
+        if self.summary is not None:
+            return self.summary
+        try:
+            self.summary = self._finish()
+        finally:
+            self._spool.close()
+        return self.summary
+
+    def _finish(self) -> dict[str, Any]:
+        output_file = self.output_file
+        columns = self.columns or []
+        new_blocks = {
+            block: {key: self._partitions[key][2].hexdigest() for key in keys}
+            for block, keys in self._blocks.items()
+        }
+
+        manifest = load_manifest(output_file)
+        if manifest is not None and (
+            manifest["columns"] != columns
+            or manifest["keys"] != self.keys
+            or manifest["block_keys"] != self.block_keys
+        ):
+            logger.info("Layout changed, rewriting in full")
+            manifest = None
+        old = {} if manifest is None else {b["key"]: b for b in manifest["blocks"]}
+
+        old_hashes = {k: h for b in old.values() for k, h in b["partitions"].items()}
+        new_hashes = {k: h for hashes in new_blocks.values() for k, h in hashes.items()}
+        added = [k for k in new_hashes if k not in old_hashes]
+        removed = [k for k in old_hashes if k not in new_hashes]
+        changed = [k for k in new_hashes if k in old_hashes and old_hashes[k] != new_hashes[k]]
+        dirty = [k for k, h in new_blocks.items() if k in old and old[k]["partitions"] != h]
+        dropped = [k for k in old if k not in new_blocks]
+        fresh = [k for k in new_blocks if k not in old]
+
+        version = 1 if manifest is None else manifest["version"] + 1
+        summary = {
+            "version": version,
+            "added": len(added),
+            "changed": len(changed),
+            "removed": len(removed),
+            "unchanged": len(new_hashes) - len(added) - len(changed),
+            "blocks_written": 0,
+            "bytes_written": 0,
+            "delta": None,
+        }
+
+        if manifest is not None and not (dirty or dropped or fresh):
+            logger.info(f"No partitions changed, keeping {output_file} (version {version - 1})")
+            return {**summary, "version": version - 1, "mode": "unchanged"}
+
+        entries: dict[str, dict[str, Any]] = {}
+        if manifest is not None and not (dirty or dropped):
+            # Only new blocks: append them to the existing file
+            mode = "append"
+            entries.update(old)
+            offset = size = output_file.stat().st_size
+            with output_file.open("ab") as f:
+                try:
+                    for key, data in zip(fresh, self._compressed_blocks(fresh), strict=True):
+                        f.write(data)
+                        length = len(data)
+                        entries[key] = _block_entry(key, offset, length, new_blocks[key])
+                        offset += length
+                except BaseException:
+                    # Cut a partial append off, back to the file the manifest describes
+                    f.truncate(size)
+                    raise
+            summary["blocks_written"] = len(fresh)
+            summary["bytes_written"] = offset - manifest["file_size"]
+            header_length = manifest["header_length"]
+        else:
+            mode = "full" if manifest is None else "rewrite"
+            tmp_file = output_file.with_name(output_file.name + ".tmp")
+            replaced = set(dirty)
+            old_file = output_file.open("rb") if manifest is not None else None
+            kept = {k for k in new_blocks if k in old and k not in replaced}
+            compressed = self._compressed_blocks([k for k in new_blocks if k not in kept])
+            try:
+                with tmp_file.open("wb") as f:
+                    compressor = _gzip_compressor(self.compresslevel)
+                    header = pd.DataFrame(columns=columns).to_csv(index=False).encode()
+                    f.write(compressor.compress(header) + compressor.flush())
+                    header_length = offset = f.tell()
+                    for key, hashes in new_blocks.items():
+                        if old_file is not None and key in kept:
+                            length = old[key]["length"]
+                            _copy_range(old_file, f, old[key]["offset"], length)
+                        else:
+                            data = next(compressed)
+                            f.write(data)
+                            length = len(data)
+                            summary["blocks_written"] += 1
+                        entries[key] = _block_entry(key, offset, length, hashes)
+                        offset += length
+
+                if manifest is not None and old_file is not None and (dirty or dropped):
+                    # Keep the replaced blocks as a compact delta backup
+                    stem = output_file.name.removesuffix(".csv.gz")
+                    delta_file = output_file.with_name(f"{stem}-delta-v{version - 1}.csv.gz")
+                    with delta_file.open("wb") as f:
+                        _copy_range(old_file, f, 0, manifest["header_length"])
+                        for key in [*dirty, *dropped]:
+                            _copy_range(old_file, f, old[key]["offset"], old[key]["length"])
+                    summary["delta"] = delta_file.name
+                    summary["bytes_written"] += delta_file.stat().st_size
+            finally:
+                compressed.close()
+                if old_file is not None:
+                    old_file.close()
+
+            if manifest is None and output_file.exists():
+                # Unmanaged file from an earlier release: keep it once as the base
+                base_file = output_file.with_name(
+                    f"{output_file.name.removesuffix('.csv.gz')}-base.csv.gz"
+                )
+                output_file.replace(base_file)
+                summary["delta"] = base_file.name
+            tmp_file.replace(output_file)
+            summary["bytes_written"] += output_file.stat().st_size
+
+        history = [] if manifest is None else manifest["history"]
+        history.append(
+            {
+                "version": version,
+                "updated": datetime.now().isoformat(timespec="seconds"),
+                "mode": mode,
+                # Initial writes only record how many partitions they added
+                "added": len(added) if mode == "full" else added,
+                "changed": changed,
+                "removed": removed,
+                "delta": summary["delta"],
+            }
+        )
+        new_manifest = {
+            "format": MANIFEST_FORMAT,
+            "version": version,
+            "keys": self.keys,
+            "block_keys": self.block_keys,
+            "columns": columns,
+            "header_length": header_length,
+            "file_size": output_file.stat().st_size,
+            "blocks": list(entries.values()),
+            "history": history,
+        }
+        _write_atomic(manifest_path(output_file), json.dumps(new_manifest, indent=1).encode())
+        logger.info(
+            f"Saved {output_file} version {version} ({mode}): {len(added)} added, "
+            f"{len(changed)} changed, {len(removed)} removed partitions, "
+            f"{summary['bytes_written']:,d} bytes written"
+        )
+        return {**summary, "mode": mode}
+
+
+def _block_entry(key: str, offset: int, length: int, hashes: dict[str, str]) -> dict[str, Any]:
+    return {"key": key, "offset": offset, "length": length, "partitions": hashes}
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_bytes(data)
+    tmp_path.replace(path)
+
+
+def save_incremental(
+    df: pd.DataFrame,
+    output_file: str | Path,
+    keys: list[str],
+    block_keys: list[str] | None = None,
+    compresslevel: int = 9,
+    workers: int | None = None,
+) -> dict[str, Any]:
+    """Save `df` as a partitioned gzip CSV, rewriting only what changed.
+
+    Blocks are ordered by `block_keys` and partitions within a block by the
+    remaining keys; rows within a partition keep their input order. See
+    `PartitionedWriter` for the arguments and the returned summary.
+    """
+    block_keys = keys if block_keys is None else block_keys
+    sort_keys = [*block_keys, *[k for k in keys if k not in block_keys]]
+    with PartitionedWriter(output_file, keys, block_keys, compresslevel, workers) as writer:
+        writer.write(df.sort_values(sort_keys, kind="stable"))
+    return writer.close()
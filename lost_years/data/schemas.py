@@ -6,16 +6,129 @@ This module defines the expected schema for each data source:
 - SSA: US Social Security Administration life tables
 - WHO: World Health Organization life expectancy data
 - HLD: Human Life-Table Database from lifetable.de
+
+Each schema also declares the `TableLayout` its loader reads the file with,
+so `load_table` parses the data straight into its final column names and
+types.
+
+Validation streams a data file in chunks: every rule is a vectorized mask
+over a chunk, and only the number of offending rows and a bounded sample of
+them are kept, so memory use does not grow with the size of the file.
 """
 
-from dataclasses import dataclass
-from typing import Any
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, ClassVar
 
+import numpy as np
 import pandas as pd
 
+from lost_years.utils import read_csv_blocks
+
+MAX_SAMPLES = 10  # Offending rows kept per rule
+VALIDATION_CHUNK_SIZE = 100_000
+
+
+@dataclass(frozen=True)
+class Rule:
+    """A row-level check of one column.
+
+    Attributes:
+        label: Issue description, e.g. 'Invalid ages'.
+        column: Column checked; the rule is skipped if it is missing.
+        invalid: Returns a boolean mask of the offending values.
+    """
+
+    label: str
+    column: str
+    invalid: Callable[[pd.Series], pd.Series]
+
+
+def out_of_range(bounds: tuple[float, float]) -> Callable[[pd.Series], pd.Series]:
+    """Rule check for values outside `bounds` (inclusive) or not numeric."""
+    low, high = bounds
+
+    def invalid(values: pd.Series) -> pd.Series:
+        numbers = pd.to_numeric(values, errors="coerce")
+        return ~numbers.between(low, high) & values.notna()
+
+    return invalid
+
+
+def not_in(codes: set[Any]) -> Callable[[pd.Series], pd.Series]:
+    """Rule check for values that are not one of `codes`."""
+    numeric = [code for code in codes if isinstance(code, int | float)]
+
+    def invalid(values: pd.Series) -> pd.Series:
+        valid = values.isin(codes)
+        if numeric:
+            valid |= pd.to_numeric(values, errors="coerce").isin(numeric)
+        return ~valid
+
+    return invalid
+
+
+def sorted_values(values: Iterable[Any]) -> list[Any]:
+    """Sort distinct values, falling back to text order for mixed types."""
+    try:
+        return sorted(values)
+    except TypeError:
+        return sorted(values, key=str)
+
+
+@dataclass(frozen=True)
+class TableLayout:
+    """How a loader reads a data file.
+
+    Attributes:
+        columns: Columns to read; any of them may be absent from the file.
+        renames: New names of columns, applied after reading.
+        required: Renamed columns whose missing values drop the row.
+        defaults: Values for renamed columns that are absent or missing.
+        na_values: Extra strings parsed as missing values.
+    """
+
+    columns: list[str]
+    renames: dict[str, str] = field(default_factory=dict)
+    required: list[str] = field(default_factory=list)
+    defaults: dict[str, Any] = field(default_factory=dict)
+    na_values: list[str] = field(default_factory=list)
+
+
+class Schema:
+    """Base of the data source schemas.
+
+    Subclasses declare their `VERSION`, columns, dtypes, the `LAYOUT`
+    loaders read and validation `RULES`; `SUMMARY_COLUMNS` maps result keys
+    to a column and a function of its distinct values, e.g. the number of
+    countries.
+    """
+
+    VERSION: ClassVar[int] = 1  # Bump when the layout or types of the built file change
+    REQUIRED_COLUMNS: ClassVar[list[str]] = []
+    DTYPES: ClassVar[dict[str, str]] = {}
+    LAYOUT: ClassVar[TableLayout]
+    RULES: ClassVar[list[Rule]] = []
+    SUMMARY_COLUMNS: ClassVar[dict[str, tuple[str, Callable[[set[Any]], Any]]]] = {}
+
+    @classmethod
+    def column_issues(cls, columns: list[str]) -> list[str]:
+        """Issues with the columns of a data file."""
+        missing_cols = set(cls.REQUIRED_COLUMNS) - set(columns)
+        return [f"Missing columns: {missing_cols}"] if missing_cols else []
+
+    @classmethod
+    def validate(cls, df: pd.DataFrame, max_samples: int = MAX_SAMPLES) -> dict[str, Any]:
+        """Validate a DataFrame against the schema.
+
+        See `SchemaValidator.result` for the returned dict.
+        """
+        return SchemaValidator(cls, max_samples).update(df).result()
+
 
 @dataclass
-class SSASchema:
+class SSASchema(Schema):
     """Schema for SSA (Social Security Administration) life table data.
 
     Source: https://www.ssa.gov/oact/STATS/table4c6.html
@@ -53,38 +166,27 @@ class SSASchema:
     LIVES_RANGE = (0.0, 100000.0)  # Number of lives 0-100k
     LE_RANGE = (0.0, 100.0)  # Life expectancy 0-100 years
 
-    @classmethod
-    def validate(cls, df: pd.DataFrame) -> dict[str, Any]:
-        """Validate SSA data against schema."""
-        issues = []
-
-        # Check required columns
-        missing_cols = set(cls.REQUIRED_COLUMNS) - set(df.columns)
-        if missing_cols:
-            issues.append(f"Missing columns: {missing_cols}")
-
-        # Check age range
-        if "age" in df.columns:
-            invalid_ages = df[(df["age"] < cls.AGE_RANGE[0]) | (df["age"] > cls.AGE_RANGE[1])]
-            if not invalid_ages.empty:
-                issues.append(f"Invalid ages: {invalid_ages['age'].tolist()}")
-
-        # Check year range
-        if "year" in df.columns:
-            invalid_years = df[(df["year"] < cls.YEAR_RANGE[0]) | (df["year"] > cls.YEAR_RANGE[1])]
-            if not invalid_years.empty:
-                issues.append(f"Invalid years: {invalid_years['year'].unique().tolist()}")
+    RULES = [
+        Rule("Invalid ages", "age", out_of_range(AGE_RANGE)),
+        Rule("Invalid years", "year", out_of_range(YEAR_RANGE)),
+    ]
+    SUMMARY_COLUMNS = {"years": ("year", sorted_values)}
 
-        return {
-            "valid": len(issues) == 0,
-            "issues": issues,
-            "row_count": len(df),
-            "column_count": len(df.columns),
-        }
+    # Columns used for lookups and survival queries
+    LAYOUT = TableLayout(
+        columns=[
+            "age",
+            "male_n_lives",
+            "male_life_expectancy",
+            "female_n_lives",
+            "female_life_expectancy",
+            "year",
+        ],
+    )
 
 
 @dataclass
-class WHOSchema:
+class WHOSchema(Schema):
     """Schema for WHO (World Health Organization) life expectancy data.
 
     Source: WHO Global Health Observatory API
@@ -92,6 +194,8 @@ class WHOSchema:
     """
 
     # Required columns (simplified from WHO API response)
+    VERSION = 2  # Age groups added
+
     REQUIRED_COLUMNS = [
         "country_code",  # str: 3-letter ISO country code (e.g., 'USA')
         "country_name",  # str: Country display name
@@ -102,12 +206,18 @@ class WHOSchema:
         "high_ci",  # float: Upper confidence interval
     ]
 
+    # Optional columns (files without them hold life expectancy at birth)
+    OPTIONAL_COLUMNS = [
+        "age_group",  # str: GHO age group code ('AGELT1', 'AGE5-9', 'AGE85PLUS', ...)
+    ]
+
     # Data types
     DTYPES = {
         "country_code": "string",
         "country_name": "string",
         "year": "int32",
         "sex_code": "string",
+        "age_group": "category",
         "life_expectancy": "float64",
         "low_ci": "float64",
         "high_ci": "float64",
@@ -118,43 +228,30 @@ class WHOSchema:
     LE_RANGE = (20.0, 90.0)  # Reasonable life expectancy range
     VALID_SEX_CODES = {"MLE", "FMLE", "BTSX"}  # Male, Female, Both sexes
 
-    @classmethod
-    def validate(cls, df: pd.DataFrame) -> dict[str, Any]:
-        """Validate WHO data against schema."""
-        issues = []
-
-        # Check required columns
-        missing_cols = set(cls.REQUIRED_COLUMNS) - set(df.columns)
-        if missing_cols:
-            issues.append(f"Missing columns: {missing_cols}")
-
-        # Check sex codes
-        if "sex_code" in df.columns:
-            invalid_sex = set(df["sex_code"].unique()) - cls.VALID_SEX_CODES
-            if invalid_sex:
-                issues.append(f"Invalid sex codes: {invalid_sex}")
-
-        # Check life expectancy range
-        if "life_expectancy" in df.columns:
-            invalid_le = df[
-                (df["life_expectancy"] < cls.LE_RANGE[0])
-                | (df["life_expectancy"] > cls.LE_RANGE[1])
-            ]
-            if not invalid_le.empty:
-                issues.append(f"Invalid life expectancy values: {len(invalid_le)} rows")
+    RULES = [
+        Rule("Invalid sex codes", "sex_code", not_in(VALID_SEX_CODES)),
+        Rule("Invalid life expectancy values", "life_expectancy", out_of_range(LE_RANGE)),
+    ]
 
-        return {
-            "valid": len(issues) == 0,
-            "issues": issues,
-            "row_count": len(df),
-            "column_count": len(df.columns),
-            "countries": df["country_code"].nunique() if "country_code" in df.columns else 0,
-            "years": sorted(df["year"].unique().tolist()) if "year" in df.columns else [],
-        }
+    # Columns used for lookups, named as the other sources
+    LAYOUT = TableLayout(
+        columns=[
+            "country_code",
+            "year",
+            "sex_code",
+            "age_group",
+            "life_expectancy",
+            "low_ci",
+            "high_ci",
+        ],
+        renames={"country_code": "country", "sex_code": "sex"},
+        defaults={"age_group": "AGELT1"},  # Files without age groups hold e(0)
+    )
+    SUMMARY_COLUMNS = {"countries": ("country_code", len), "years": ("year", sorted_values)}
 
 
 @dataclass
-class HLDSchema:
+class HLDSchema(Schema):
     """Schema for HLD (Human Life-Table Database) data.
 
     Source: https://www.lifetable.de/
@@ -173,16 +270,36 @@ class HLDSchema:
         "l(x)",  # float: Number surviving to age x
     ]
 
+    # Optional columns identifying a life table, and their names after loading
+    TABLE_COLUMNS = {
+        "Region": "region",  # int: Sub-national region, 0 for the whole country
+        "Residence": "residence",  # int: Urban/rural, 0 for total
+        "Ethnicity": "ethnicity",  # int: Ethnic group, 0 for total
+        "SocDem": "socdem",  # int: Socio-demographic group, 0 for total
+        "Version": "version",  # int: Version of the table
+        "Ref-ID": "source",  # str: Source reference code
+        "TypeLT": "table_type",  # int: 1 complete, 2/4 abridged
+    }
+
     # Data types
     DTYPES = {
         "Country": "string",
         "Year1": "int32",
+        "Year2": "float64",  # Missing for single-year tables
         "Sex": "int32",
         "Age": "int32",
+        "AgeInt": "float64",  # Missing or 99 for the open age interval
         "e(x)": "float64",
         "m(x)": "float64",
         "q(x)": "float64",
         "l(x)": "float64",
+        "Region": "Int32",
+        "Residence": "Int32",
+        "Ethnicity": "Int32",
+        "SocDem": "Int32",
+        "Version": "Int32",
+        "Ref-ID": "string",
+        "TypeLT": "Int32",
     }
 
     # Validation rules
@@ -191,65 +308,248 @@ class HLDSchema:
     SEX_CODES = {1, 2}  # 1=Male, 2=Female
     LE_RANGE = (0.0, 100.0)  # Life expectancy range
 
-    @classmethod
-    def validate(cls, df: pd.DataFrame) -> dict[str, Any]:
-        """Validate HLD data against schema."""
-        issues = []
+    RULES = [
+        Rule("Invalid sex codes", "Sex", not_in(SEX_CODES)),
+        Rule("Invalid life expectancy values", "e(x)", out_of_range(LE_RANGE)),
+        Rule("Invalid years", "Year1", out_of_range(YEAR_RANGE)),
+        Rule("Invalid ages", "Age", out_of_range(AGE_RANGE)),
+    ]
+    SUMMARY_COLUMNS = {"countries": ("Country", len), "years": ("Year1", sorted_values)}
+
+    # Columns used for lookups, survival queries and cohort tables; missing table columns mean
+    # total population, version 1
+    LAYOUT = TableLayout(
+        columns=[
+            "Country",
+            "Year1",
+            "Year2",
+            "Sex",
+            "Age",
+            "AgeInt",
+            "e(x)",
+            "m(x)",
+            "q(x)",
+            "l(x)",
+            *TABLE_COLUMNS,
+        ],
+        renames={
+            "Country": "country",
+            "Year1": "year",
+            "Year2": "year_end",
+            "Sex": "sex",
+            "Age": "age",
+            "AgeInt": "age_interval",
+            "e(x)": "life_expectancy",
+            "m(x)": "death_rate",
+            "q(x)": "death_prob",
+            "l(x)": "survivors",
+            **TABLE_COLUMNS,
+        },
+        required=["country", "year", "sex", "age", "life_expectancy"],
+        defaults={
+            "region": 0,
+            "residence": 0,
+            "ethnicity": 0,
+            "socdem": 0,
+            "version": 1,
+            "source": "",
+            "table_type": 0,
+            "survivors": float("nan"),  # Only survival queries need l(x)
+            "death_rate": float("nan"),  # Only cohort tables need m(x) or q(x)
+            "death_prob": float("nan"),
+        },
+        na_values=["."],
+    )
 
-        # Check required columns (allow subset)
-        available_required = [col for col in cls.REQUIRED_COLUMNS if col in df.columns]
+    @classmethod
+    def column_issues(cls, columns: list[str]) -> list[str]:
+        """Issues with the columns of a data file (a subset is allowed)."""
+        available_required = [col for col in cls.REQUIRED_COLUMNS if col in columns]
         if len(available_required) < 4:  # Need at least country, year, sex, life expectancy
-            issues.append(f"Too few required columns. Found: {available_required}")
+            return [f"Too few required columns. Found: {available_required}"]
+        return []
+
+
+SCHEMAS: dict[str, type[Schema]] = {"ssa": SSASchema, "who": WHOSchema, "hld": HLDSchema}
 
-        # Check sex codes
-        if "Sex" in df.columns:
-            invalid_sex = set(df["Sex"].unique()) - cls.SEX_CODES
-            if invalid_sex:
-                issues.append(f"Invalid sex codes: {invalid_sex}")
 
-        # Check life expectancy range
-        if "e(x)" in df.columns:
-            invalid_le = df[(df["e(x)"] < cls.LE_RANGE[0]) | (df["e(x)"] > cls.LE_RANGE[1])]
-            if not invalid_le.empty:
-                issues.append(f"Invalid life expectancy values: {len(invalid_le)} rows")
+class SchemaValidator:
+    """Validate a data file chunk by chunk.
 
+    Usage::
+
+        validator = SchemaValidator(HLDSchema)
+        for chunk in pd.read_csv(path, chunksize=100_000):
+            validator.update(chunk)
+        result = validator.result()
+    """
+
+    def __init__(self, schema: type[Schema], max_samples: int = MAX_SAMPLES) -> None:
+        """Start an empty validation.
+
+        Args:
+            schema: Schema class to validate against.
+            max_samples: Number of offending rows kept per rule.
+        """
+        self.schema = schema
+        self.max_samples = max_samples
+        self.columns: list[str] | None = None
+        self.row_count = 0
+        self.counts = {rule.label: 0 for rule in schema.RULES}
+        self.samples: dict[str, list[dict[str, Any]]] = {rule.label: [] for rule in schema.RULES}
+        self.distinct: dict[str, set[Any]] = {key: set() for key in schema.SUMMARY_COLUMNS}
+
+    def update(self, chunk: pd.DataFrame) -> "SchemaValidator":
+        """Check the next chunk of rows."""
+        if self.columns is None:
+            self.columns = list(chunk.columns)
+        for rule in self.schema.RULES:
+            if rule.column not in chunk.columns:
+                continue
+            mask = rule.invalid(chunk[rule.column]).to_numpy(dtype=bool, na_value=True)
+            positions = np.flatnonzero(mask)
+            if not len(positions):
+                continue
+            self.counts[rule.label] += len(positions)
+            samples = self.samples[rule.label]
+            room = self.max_samples - len(samples)
+            if room > 0:
+                rows = chunk.iloc[positions[:room]].astype(object).where(lambda x: x.notna(), None)
+                for row, record in zip(
+                    self.row_count + positions[:room] + 1, rows.to_dict("records"), strict=True
+                ):
+                    samples.append({"row": int(row), **record})
+        for key, (column, _) in self.schema.SUMMARY_COLUMNS.items():
+            if column in chunk.columns:
+                self.distinct[key].update(chunk[column].dropna().unique().tolist())
+        self.row_count += len(chunk)
+        return self
+
+    def result(self) -> dict[str, Any]:
+        """Summarize the rows checked so far.
+
+        Returns:
+            Dict with 'valid', the list of 'issues', 'row_count',
+            'column_count', 'invalid_counts' and 'samples' (row number and
+            values of up to `max_samples` offending rows) per failed rule,
+            and the schema's summary columns (e.g. 'countries', 'years').
+        """
+        issues = self.schema.column_issues(self.columns or [])
+        invalid_counts = {label: count for label, count in self.counts.items() if count}
+        for rule in self.schema.RULES:
+            if rule.label in invalid_counts:
+                values = list(dict.fromkeys(s[rule.column] for s in self.samples[rule.label]))
+                count = invalid_counts[rule.label]
+                issues.append(f"{rule.label}: {count} rows, e.g. {values}")
         return {
             "valid": len(issues) == 0,
             "issues": issues,
-            "row_count": len(df),
-            "column_count": len(df.columns),
-            "countries": df["Country"].nunique() if "Country" in df.columns else 0,
-            "years": sorted(df["Year1"].unique().tolist()) if "Year1" in df.columns else [],
+            "row_count": self.row_count,
+            "column_count": len(self.columns or []),
+            "invalid_counts": invalid_counts,
+            "samples": {label: self.samples[label] for label in invalid_counts},
+            **{
+                key: summarize(self.distinct[key])
+                for key, (_, summarize) in self.schema.SUMMARY_COLUMNS.items()
+            },
         }
 
 
-def validate_data_file(source: str, file_path: str) -> dict[str, Any]:
-    """Validate a data file against its schema.
+def reader_dtypes(schema: type, columns: Iterable[str] | None = None) -> dict[str, str]:
+    """Dtypes to parse a data file with, from a schema's `DTYPES`.
+
+    Args:
+        schema: Schema class, e.g. `SSASchema`.
+        columns: Restrict to these columns; None for all declared columns.
+
+    Returns:
+        Mapping of column name to dtype for `pandas.read_csv`.
+    """
+    if columns is None:
+        return dict(schema.DTYPES)
+    return {col: schema.DTYPES[col] for col in columns if col in schema.DTYPES}
+
+
+def load_table(source: str, path: str | Path, engine: str = "auto") -> pd.DataFrame:
+    """Read a data file into the columns and types its loader works with.
+
+    Only the layout's columns are parsed, directly into the schema's dtypes
+    (required integer columns through their nullable counterpart); the
+    columns are then renamed, rows missing a required value dropped and
+    absent or missing values of optional columns filled with their defaults.
+
+    Args:
+        source: Data source ('ssa', 'who', 'hld').
+        path: Data file, optionally gzip compressed.
+        engine: CSV parser, see `lost_years.utils.resolve_engine`.
+
+    Returns:
+        The loaded table.
+    """
+    schema = SCHEMAS[source.lower()]
+    layout = schema.LAYOUT
+    wanted = set(layout.columns)
+    # Required integer columns are parsed as nullable, so rows missing them
+    # can be dropped, and then cast to their schema dtype
+    required = {c for c in layout.columns if layout.renames.get(c, c) in layout.required}
+    parse_dtypes = reader_dtypes(schema, layout.columns)
+    int_dtypes = {c: t for c, t in parse_dtypes.items() if c in required and t.startswith("int")}
+    parse_dtypes.update({c: t.capitalize() for c, t in int_dtypes.items()})
+    df = read_csv_blocks(
+        path,
+        engine=engine,
+        usecols=lambda c: c in wanted,
+        dtype=parse_dtypes,
+        na_values=layout.na_values or None,
+    ).rename(columns=layout.renames)
+    if layout.required:
+        df = df.dropna(subset=layout.required)
+    for col, dtype in int_dtypes.items():
+        name = layout.renames.get(col, col)
+        if name in df.columns:
+            df[name] = df[name].astype(dtype)
+
+    dtypes = {layout.renames.get(c, c): t for c, t in reader_dtypes(schema, wanted).items()}
+    for col, default in layout.defaults.items():
+        if col not in df.columns:
+            df[col] = pd.Series(default, index=df.index, dtype=dtypes.get(col))
+        elif df[col].hasnans:
+            if (
+                isinstance(df[col].dtype, pd.CategoricalDtype)
+                and default not in df[col].cat.categories
+            ):
+                df[col] = df[col].cat.add_categories([default])
+            df[col] = df[col].fillna(default)
+    return df
+
+
+def validate_data_file(
+    source: str,
+    file_path: str,
+    chunk_size: int = VALIDATION_CHUNK_SIZE,
+    max_samples: int = MAX_SAMPLES,
+) -> dict[str, Any]:
+    """Validate a data file against its schema in one streaming pass.
 
     Args:
         source: Data source ('ssa', 'who', 'hld')
-        file_path: Path to data file
+        file_path: Path to data file, optionally gzip compressed
+        chunk_size: Rows read at a time
+        max_samples: Offending rows kept per rule
 
     Returns:
-        Validation results dict
+        Validation results dict, see `SchemaValidator.result`
     """
+    schema = SCHEMAS.get(source.lower())
+    if schema is None:
+        return {"valid": False, "issues": [f"Unknown source: {source}"]}
+
     try:
-        # Load data based on file extension
-        if file_path.endswith(".gz"):
-            df = pd.read_csv(file_path, compression="gzip")
-        else:
-            df = pd.read_csv(file_path)
-
-        # Validate against appropriate schema
-        match source.lower():
-            case "ssa":
-                return SSASchema.validate(df)
-            case "who":
-                return WHOSchema.validate(df)
-            case "hld":
-                return HLDSchema.validate(df)
-            case _:
-                return {"valid": False, "issues": [f"Unknown source: {source}"]}
+        validator = SchemaValidator(schema, max_samples)
+        with pd.read_csv(file_path, chunksize=chunk_size) as reader:
+            for chunk in reader:
+                validator.update(chunk)
+        return validator.result()
 
     except Exception as e:
         return {"valid": False, "issues": [f"Error reading file: {e}"]}
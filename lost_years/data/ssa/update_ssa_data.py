@@ -11,9 +11,10 @@ from datetime import datetime
 from pathlib import Path
 
 import pandas as pd
-import requests
 from bs4 import BeautifulSoup
 
+from lost_years.utils import NOT_MODIFIED, CachedSession
+
 # Optional Selenium imports
 try:
     from selenium import webdriver
@@ -39,12 +40,14 @@ class SSADataUpdater:
     """SSA data updater using web scraping."""
 
     def __init__(self):
-        self.session = requests.Session()
+        self.session = CachedSession()
         user_agent = (
             "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) "
             "AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
         )
         self.session.headers.update({"User-Agent": user_agent})
+        # URL of the response the data was built from, cached on success
+        self.source_url = None
 
     def scrape_ssa_table4c6(self):
         """Scrape SSA actuarial life table from table4c6.html."""
@@ -55,9 +58,15 @@ class SSADataUpdater:
         try:
             response = self.session.get(url, timeout=30)
 
+            if response.status_code == 304:
+                return NOT_MODIFIED
+
             if response.status_code == 200:
                 logger.info("Successfully retrieved SSA page")
-                return self.parse_ssa_html_table(response.text)
+                result = self.parse_ssa_html_table(response.text)
+                if result is not None:
+                    self.source_url = url
+                return result
             else:
                 logger.error(f"HTTP {response.status_code} from {url}")
                 return None
@@ -318,10 +327,13 @@ class SSADataUpdater:
             try:
                 logger.info(f"Trying historical URL: {url}")
                 response = self.session.get(url, timeout=30)
+                if response.status_code == 304:
+                    return NOT_MODIFIED
                 if response.status_code == 200:
                     logger.info(f"Successfully retrieved data from {url}")
                     result = self.parse_ssa_html_table(response.text)
                     if result is not None:
+                        self.source_url = url
                         # Extract year from URL if possible
                         year_match = None
                         import re
@@ -571,10 +583,18 @@ class SSADataUpdater:
         # Try main SSA table first
         data = self.scrape_ssa_table4c6()
 
+        if data is NOT_MODIFIED:
+            logger.info("SSA data unchanged upstream, nothing to update")
+            return True
+
         if data is None:
             # Try alternative sources
             data = self.try_alternative_ssa_sources()
 
+        if data is NOT_MODIFIED:
+            logger.info("SSA data unchanged upstream, nothing to update")
+            return True
+
         if data is None:
             # Try Selenium as final fallback
             logger.info("Trying Selenium as fallback...")
@@ -584,7 +604,10 @@ class SSADataUpdater:
             logger.error("Failed to fetch SSA data from all sources (requests + Selenium)")
             return False
 
-        return self.save_ssa_data(data, overwrite=overwrite)
+        success = self.save_ssa_data(data, overwrite=overwrite)
+        if success:
+            self.session.commit(self.source_url)
+        return success
 
 
 def main():
@@ -7,9 +7,15 @@ Updates all data sources in the lost_years package.
 import argparse
 import logging
 import sys
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from datetime import datetime
 from pathlib import Path
 
+from lost_years.data.artifacts import record_artifacts
+
 # Setup logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
@@ -36,79 +42,134 @@ except ImportError as e:
     sys.exit(1)
 
 
+# Per-source updater, entry point, data directory, failure message and
+# default timeout in seconds
+SOURCES = {
+    "who": {
+        "label": "WHO",
+        "updater": WHODataUpdater,
+        "method": "update_who_data",
+        "data_dir": data_dir / "who",
+        "failure": "Failed to update WHO data",
+        "timeout": 600.0,
+    },
+    "ssa": {
+        "label": "SSA",
+        "updater": SSADataUpdater,
+        "method": "update_ssa_data",
+        "data_dir": data_dir / "ssa",
+        "failure": "Failed to update SSA data (website may block automated access)",
+        "timeout": 600.0,
+    },
+    "hld": {
+        "label": "HLD",
+        "updater": HLDDataUpdater,
+        "method": "update_hld_data",
+        "data_dir": data_dir / "hld",
+        "failure": "Failed to update HLD data (manual download may be required)",
+        "timeout": 300.0,
+    },
+}
+
+
+def written_bytes(directory, since):
+    """Total size of the files in `directory` modified at or after `since`."""
+    return sum(
+        path.stat().st_size
+        for path in Path(directory).rglob("*")
+        if path.is_file() and path.stat().st_mtime >= since
+    )
+
+
 class MasterDataUpdater:
-    """Master updater for all data sources."""
+    """Master updater for all data sources.
 
-    def __init__(self):
+    Sources are refreshed concurrently, one worker thread each, so the total
+    wall time is about that of the slowest source. A source that runs past
+    its timeout is reported as timed out and abandoned: its HTTP session is
+    closed to abort in-flight requests and, as the worker is a daemon
+    thread, it cannot keep the process alive.
+    """
+
+    def __init__(self, timeouts=None):
         self.results = {}
+        self.updaters = {}
         self.start_time = datetime.now()
-
-    def update_who_data(self):
-        """Update WHO data."""
+        self.end_time = None
+        self.timeouts = {
+            source: (timeouts or {}).get(source, info["timeout"])
+            for source, info in SOURCES.items()
+        }
+
+    def run_source(self, source):
+        """Run one source's updater and describe the outcome.
+
+        Returns:
+            Dict with 'success', 'status' ('success', 'failed', 'error'),
+            'message', 'duration' (seconds) and 'bytes' (size of the files
+            written under the source's data directory).
+        """
+        info = SOURCES[source]
         logger.info("=" * 50)
-        logger.info("UPDATING WHO DATA")
+        logger.info(f"UPDATING {info['label']} DATA")
         logger.info("=" * 50)
 
+        started = time.time()
+        status = "error"
         try:
-            updater = WHODataUpdater()
-            success = updater.update_who_data()
-            self.results["WHO"] = {
-                "success": success,
-                "message": "Successfully updated WHO data"
-                if success
-                else "Failed to update WHO data",
-            }
-            return success
+            updater = self.updaters[source] = info["updater"]()
+            success = bool(getattr(updater, info["method"])())
+            status = "success" if success else "failed"
+            message = f"Successfully updated {info['label']} data" if success else info["failure"]
+            if success:
+                # Hash and summarize the new file once, for O(1) checks later
+                record_artifacts([source])
         except Exception as e:
-            logger.error(f"Error updating WHO data: {e}")
-            self.results["WHO"] = {"success": False, "message": f"Error: {e}"}
-            return False
+            logger.error(f"Error updating {info['label']} data: {e}")
+            success, message = False, f"Error: {e}"
+        return {
+            "success": success,
+            "status": status,
+            "message": message,
+            "duration": time.time() - started,
+            "bytes": written_bytes(info["data_dir"], started) if success else 0,
+        }
+
+    def update_who_data(self):
+        """Update WHO data."""
+        self.results["WHO"] = self.run_source("who")
+        return self.results["WHO"]["success"]
 
     def update_ssa_data(self):
         """Update SSA data."""
-        logger.info("=" * 50)
-        logger.info("UPDATING SSA DATA")
-        logger.info("=" * 50)
-
-        try:
-            updater = SSADataUpdater()
-            success = updater.update_ssa_data()
-            self.results["SSA"] = {
-                "success": success,
-                "message": "Successfully updated SSA data"
-                if success
-                else "Failed to update SSA data (website may block automated access)",
-            }
-            return success
-        except Exception as e:
-            logger.error(f"Error updating SSA data: {e}")
-            self.results["SSA"] = {"success": False, "message": f"Error: {e}"}
-            return False
+        self.results["SSA"] = self.run_source("ssa")
+        return self.results["SSA"]["success"]
 
     def update_hld_data(self):
         """Update HLD data (manual download required)."""
-        logger.info("=" * 50)
-        logger.info("UPDATING HLD DATA")
-        logger.info("=" * 50)
-
-        try:
-            updater = HLDDataUpdater()
-            success = updater.update_hld_data()
-            self.results["HLD"] = {
-                "success": success,
-                "message": "Successfully updated HLD data"
-                if success
-                else "Failed to update HLD data (manual download may be required)",
-            }
-            return success
-        except Exception as e:
-            logger.error(f"Error updating HLD data: {e}")
-            self.results["HLD"] = {"success": False, "message": f"Error: {e}"}
-            return False
+        self.results["HLD"] = self.run_source("hld")
+        return self.results["HLD"]["success"]
+
+    def cancel_source(self, source):
+        """Abort a running source by closing its HTTP session, if any."""
+        logger.warning(f"Cancelling {SOURCES[source]['label']} update")
+        session = getattr(self.updaters.get(source), "session", None)
+        if session is not None:
+            session.close()
+
+    def summary(self):
+        """Structured summary of the last update run."""
+        end_time = self.end_time or datetime.now()
+        return {
+            "started": self.start_time.isoformat(),
+            "finished": end_time.isoformat(),
+            "duration": (end_time - self.start_time).total_seconds(),
+            "sources": self.results,
+        }
 
     def print_summary(self):
         """Print summary of update results."""
-        end_time = datetime.now()
+        end_time = self.end_time or datetime.now()
         duration = end_time - self.start_time
 
         logger.info("=" * 60)
@@ -123,9 +184,10 @@ class MasterDataUpdater:
         total_count = len(self.results)
 
         for source, result in self.results.items():
-            status = "✅ SUCCESS" if result["success"] else "❌ FAILED"
+            status = "✅ SUCCESS" if result["success"] else f"❌ {result['status'].upper()}"
             logger.info(f"{source:>10s}: {status}")
             logger.info(f"{'':>12s}  {result['message']}")
+            logger.info(f"{'':>12s}  {result['duration']:.1f}s, {result['bytes']:,d} bytes written")
             logger.info("")
 
             if result["success"]:
@@ -144,30 +206,56 @@ class MasterDataUpdater:
         return success_count, total_count
 
     def update_all(self, sources=None):
-        """Update all specified data sources."""
+        """Update all specified data sources concurrently."""
         logger.info("Starting master data update process...")
+        self.start_time = datetime.now()
 
         # Default to all sources if none specified
         if sources is None:
             sources = ["who", "ssa", "hld"]
 
-        sources = [s.lower() for s in sources]
-
-        # Update each source
-        if "who" in sources:
-            self.update_who_data()
-
-        if "ssa" in sources:
-            self.update_ssa_data()
-
-        if "hld" in sources:
-            self.update_hld_data()
+        sources = [s.lower() for s in sources if s.lower() in SOURCES]
+
+        # Start one worker per source
+        running = {}
+        for source in sources:
+            future = Future()
+            future.set_running_or_notify_cancel()
+            thread = threading.Thread(
+                target=self._run_worker,
+                args=(source, future),
+                name=f"update-{source}",
+                daemon=True,
+            )
+            thread.start()
+            running[source] = (future, time.time())
+
+        # Collect results in request order, each against its own deadline
+        for source, (future, started) in running.items():
+            timeout = self.timeouts[source]
+            try:
+                result = future.result(timeout=max(0.0, started + timeout - time.time()))
+            except FutureTimeoutError:
+                self.cancel_source(source)
+                result = {
+                    "success": False,
+                    "status": "timeout",
+                    "message": f"Timed out after {timeout:g}s",
+                    "duration": time.time() - started,
+                    "bytes": 0,
+                }
+            self.results[SOURCES[source]["label"]] = result
+        self.end_time = datetime.now()
 
         # Print summary
         success_count, total_count = self.print_summary()
 
         return success_count == total_count
 
+    def _run_worker(self, source, future):
+        """Thread target: run a source and publish its result."""
+        future.set_result(self.run_source(source))
+
 
 def main():
     """Main function."""
@@ -179,6 +267,12 @@ def main():
         default=["all"],
         help="Data sources to update (default: all)",
     )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=None,
+        help="Seconds to wait for each source before giving up (default: per source)",
+    )
     parser.add_argument("--verbose", "-v", action="store_true", help="Verbose output")
 
     args = parser.parse_args()
@@ -212,7 +306,8 @@ def main():
         print()
 
     # Create updater and run
-    updater = MasterDataUpdater()
+    timeouts = None if args.timeout is None else dict.fromkeys(sources, args.timeout)
+    updater = MasterDataUpdater(timeouts=timeouts)
     success = updater.update_all(sources=sources)
 
     if success:
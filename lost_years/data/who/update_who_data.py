@@ -5,12 +5,15 @@ Attempts to fetch updated WHO life expectancy data from available sources.
 """
 
 import logging
-from datetime import datetime
 from pathlib import Path
 
 import pandas as pd
 import requests
 
+from lost_years.data.build import WHO_BLOCK_KEYS, WHO_KEYS, clean_who
+from lost_years.data.incremental import save_incremental
+from lost_years.utils import NOT_MODIFIED, CachedSession
+
 # Setup logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
@@ -23,10 +26,12 @@ class WHODataUpdater:
     """WHO data updater using various available methods."""
 
     def __init__(self):
-        self.session = requests.Session()
+        self.session = CachedSession()
         self.session.headers.update(
             {"User-Agent": "lost_years/0.4.0 (https://github.com/gojiplus/lost_years)"}
         )
+        # URL of the response the data was built from, cached on success
+        self.source_url = None
 
     def try_working_gho_api(self):
         """Try working GHO API endpoints."""
@@ -46,6 +51,9 @@ class WHODataUpdater:
                 logger.info(f"Trying: {url}")
                 response = self.session.get(url, timeout=30, allow_redirects=True)
 
+                if response.status_code == 304:
+                    return NOT_MODIFIED
+
                 if response.status_code == 200:
                     logger.info(f"Success! Got response from {url}")
 
@@ -55,6 +63,7 @@ class WHODataUpdater:
                     if "json" in content_type or url.endswith("/api/WHOSIS_000001"):
                         try:
                             data = response.json()
+                            self.source_url = url
                             return self.process_odata_json(data)
                         except (ValueError, requests.exceptions.JSONDecodeError):
                             # If JSON fails, try as CSV
@@ -63,6 +72,7 @@ class WHODataUpdater:
                     # Try as CSV
                     if "csv" in content_type or "csv" in url or response.text.startswith("GHO"):
                         logger.info("Processing as CSV data")
+                        self.source_url = url
                         return self.process_who_csv(response.text)
 
                 else:
@@ -89,8 +99,12 @@ class WHODataUpdater:
                 logger.info(f"Trying: {endpoint}")
                 response = self.session.get(endpoint, timeout=30)
 
+                if response.status_code == 304:
+                    return NOT_MODIFIED
+
                 if response.status_code == 200:
                     logger.info(f"Success! Got response from {endpoint}")
+                    self.source_url = endpoint
                     return response.json()
 
                 logger.warning(f"HTTP {response.status_code} from {endpoint}")
@@ -325,48 +339,26 @@ class WHODataUpdater:
 
         try:
             # Create clean schema-compliant dataframe
-            clean_df = pd.DataFrame(
-                {
-                    "country_code": df.get("COUNTRY (CODE)", df.get("SpatialDim", "")),
-                    "country_name": df.get("COUNTRY (DISPLAY)", df.get("ParentLocation", "")),
-                    "year": df.get("YEAR (CODE)", df.get("TimeDim", 0)),
-                    "sex_code": df.get("SEX (CODE)", df.get("Dim1", "")),
-                    "life_expectancy": df.get("Numeric", df.get("NumericValue", 0.0)),
-                    "low_ci": df.get("Low", 0.0),
-                    "high_ci": df.get("High", 0.0),
-                }
-            )
-
-            # Clean data
-            clean_df = clean_df.dropna(
-                subset=["country_code", "year", "sex_code", "life_expectancy"]
-            )
-            clean_df = clean_df[clean_df["life_expectancy"] > 0]  # Remove invalid values
-
-            # Fix sex codes (remove SEX_ prefix if present)
-            clean_df["sex_code"] = clean_df["sex_code"].str.replace("SEX_", "", regex=False)
+            clean_df = clean_who(df)
 
             logger.info(f"Clean DataFrame shape: {clean_df.shape}")
             logger.info(f"Fixed sex codes, now: {clean_df['sex_code'].unique()}")
             # Save both raw and clean formats
             raw_output_file = DATA_DIR / "who-lt.csv.gz"  # Keep raw for legacy
             clean_output_file = DATA_DIR / "who.csv.gz"  # New clean format
-            backup_file = DATA_DIR / f"who-lt-backup-{datetime.now().strftime('%Y%m%d')}.csv.gz"
 
-            # Backup original file
-            if raw_output_file.exists():
-                import shutil
-
-                shutil.copy2(raw_output_file, backup_file)
-                logger.info(f"Backed up original data to {backup_file}")
-
-            # Save raw data (for legacy compatibility)
-            df.to_csv(raw_output_file, index=False, compression="gzip")
-
-            # Save clean data (for new schema)
-            clean_df.to_csv(clean_output_file, index=False, compression="gzip")
+            # Save clean data (for new schema), only rewriting changed years;
+            # replaced partitions are kept as delta backups
+            summary = save_incremental(
+                clean_df, clean_output_file, WHO_KEYS, block_keys=WHO_BLOCK_KEYS
+            )
             logger.info(f"Saved {len(clean_df)} records to {clean_output_file}")
 
+            # Save raw data (for legacy compatibility), only when the data changed
+            if summary["mode"] != "unchanged" or not raw_output_file.exists():
+                df.to_csv(raw_output_file, index=False, compression="gzip")
+                logger.info(f"Saved raw data to {raw_output_file}")
+
             # Report data coverage
             years = clean_df["year"].dropna()
             if not years.empty:
@@ -392,6 +384,10 @@ class WHODataUpdater:
             # Try new platform as fallback
             data = self.try_new_who_platform()
 
+        if data is NOT_MODIFIED:
+            logger.info("WHO data unchanged upstream, nothing to update")
+            return True
+
         if data is None:
             logger.error("Failed to fetch WHO data from all sources")
             return False
@@ -401,7 +397,10 @@ class WHODataUpdater:
             # Convert dict to DataFrame if needed
             data = pd.DataFrame([data])
 
-        return self.save_who_data(data)
+        success = self.save_who_data(data)
+        if success:
+            self.session.commit(self.source_url)
+        return success
 
 
 def main():
@@ -0,0 +1,104 @@
+"""Life expectancy from the first of several sources that has it.
+
+:func:`lost_years_fallback` resolves every row against a chain of sources,
+e.g. HLD, then WHO, then SSA: each source is only asked about the rows the
+sources before it left unresolved, so the lookups shrink along the chain,
+and the values are coalesced into one column with the source of each.
+"""
+
+import logging
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+from .sources import SOURCES, lookup_kwargs
+from .utils import query_columns
+
+logger = logging.getLogger(__name__)
+
+# Country codes of the rows SSA resolves when the input has a country column
+SSA_COUNTRIES = ["USA", "US"]
+
+
+def lost_years_fallback(
+    df: pd.DataFrame,
+    fallback: list[str] | None = None,
+    cols: dict[str, str] | None = None,
+    **kwargs: Any,
+) -> pd.DataFrame:
+    """Appends life expectancy from the first source in a chain that has it.
+
+    Args:
+        df: Pandas DataFrame containing the input data.
+        fallback: Sources to try in order, any of 'hld', 'who' and 'ssa';
+            None for ['hld', 'who', 'ssa']. SSA only resolves rows whose
+            country is one of :data:`SSA_COUNTRIES` if ``df`` has a country
+            column; a source whose columns are missing is skipped.
+        cols: Column mapping for country, age, sex, and year (or the dates),
+            shared by all sources; None for the default names.
+        **kwargs: Passed on to each lookup function that takes them, e.g.
+            ``max_year_gap`` or ``discount_rate`` to all and ``uncertainty``
+            to WHO only; a row is unresolved by a source when its match is
+            dropped.
+
+    Returns:
+        Pandas DataFrame with columns 'life_expectancy', the first value
+        found for the row (NaN if none), 'life_expectancy_source', the
+        categorical source of that value (missing if none), and with
+        ``discount_rate`` or ``age_weighting``, 'discounted_yll' from the
+        same source.
+
+    Raises:
+        ValueError: If a source is unknown or repeated.
+    """
+    fallback = list(fallback or ["hld", "who", "ssa"])
+    unknown = [s for s in fallback if s not in SOURCES]
+    if unknown or len(set(fallback)) != len(fallback):
+        raise ValueError(
+            f"Invalid fallback {fallback}; expected distinct sources of {list(SOURCES)}"
+        )
+    discounted = kwargs.get("discount_rate") or kwargs.get("age_weighting")
+
+    life_expectancy = np.full(len(df), np.nan)
+    discounted_yll = np.full(len(df), np.nan)
+    codes = np.full(len(df), -1, dtype=np.int8)
+    country = (cols or {}).get("country", "country")
+    for code, source in enumerate(fallback):
+        lookup, fields = SOURCES[source]
+        df_cols = query_columns(df, cols, fields)
+        if df_cols is None:
+            logger.warning(f"Skipping {source.upper()} in the fallback chain")
+            continue
+        pending = codes < 0
+        if source == "ssa" and country in df.columns:
+            pending &= df[country].astype(str).str.upper().isin(SSA_COUNTRIES).to_numpy()
+        if not pending.any():
+            continue
+
+        # Only the query columns of the unresolved rows
+        rows = np.flatnonzero(pending)
+        result = lookup(
+            df.iloc[rows][list(dict.fromkeys(df_cols.values()))],
+            cols=df_cols,
+            **lookup_kwargs(source, kwargs),
+        )
+        column = f"{source}_life_expectancy"
+        if column not in result.columns:
+            continue
+        values = pd.to_numeric(result[column], errors="coerce").to_numpy(dtype="float64")
+        found = ~np.isnan(values)
+        life_expectancy[rows[found]] = values[found]
+        codes[rows[found]] = code
+        if discounted:
+            years = pd.to_numeric(result[f"{source}_discounted_yll"], errors="coerce")
+            discounted_yll[rows[found]] = years.to_numpy(dtype="float64")[found]
+        logger.info(f"{source.upper()} resolved {found.sum():,} of {len(rows):,} rows")
+
+    out = {
+        "life_expectancy": life_expectancy,
+        "life_expectancy_source": pd.Categorical.from_codes(codes, categories=fallback),
+    }
+    if discounted:
+        out["discounted_yll"] = discounted_yll
+    return df.assign(**out)
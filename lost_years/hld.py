@@ -11,209 +11,656 @@ import logging
 import sys
 from importlib.resources import files
 from pathlib import Path
+from typing import Any
 
+import numpy as np
+import numpy.typing as npt
 import pandas as pd
 
-from .utils import closest, column_exists, fixup_columns
+from .data.artifacts import check_artifact, fingerprint
+from .data.schemas import HLDSchema, load_table
+from .lifetable import SurvivalCurves, indexed_discounted_life_expectancy, life_table
+from .matching import LifeTableIndex, gather, match_quality
+from .types import HLDTablePreference
+from .utils import (
+    CSV_ENGINES,
+    DATE_COLUMNS,
+    column_exists,
+    fixup_columns,
+    query_ages_years,
+    query_columns,
+    read_csv,
+)
 
 # Setup logger
 logger = logging.getLogger(__name__)
 
 # HLD Configuration
 HLD_DATA = files("lost_years") / "data" / "hld" / "hld.csv.gz"
-HLD_COLS = [
-    "Country",
-    "Year1",
-    "Sex",
-    "Age",
-    "e(x)",
-]  # Essential columns for life expectancy
+HLD_COLS = HLDSchema.LAYOUT.columns  # Columns read for lookups
+HLD_TABLE_COLS = HLDSchema.TABLE_COLUMNS  # Columns identifying a life table among duplicates
+HLD_SUBPOPULATION_COLS = ["region", "residence", "ethnicity", "socdem"]
 
 
 class LostYearsHLDData:
     """HLD data handler for life table information."""
 
-    __df = None
+    __data: pd.DataFrame | None = None
+    __indexes: dict[HLDTablePreference, LifeTableIndex] = {}
+    __curves: dict[HLDTablePreference, SurvivalCurves] = {}
+    __cohorts: dict[HLDTablePreference, LifeTableIndex] = {}
+    __fingerprint: tuple[int, int] | None = None
 
     @classmethod
-    def lost_years_hld(cls, df: pd.DataFrame, cols: dict[str, str] | None = None) -> pd.DataFrame:
+    def lost_years_hld(
+        cls,
+        df: pd.DataFrame,
+        cols: dict[str, str] | None = None,
+        age_weight: float = 1.0,
+        year_weight: float = 1.0,
+        diagnostics: bool = False,
+        max_year_gap: float | None = None,
+        preference: HLDTablePreference | None = None,
+        interpolate: bool | None = None,
+        discount_rate: float = 0.0,
+        age_weighting: float = 0.0,
+        cohort: bool = False,
+        project: bool = False,
+        engine: str = "auto",
+    ) -> pd.DataFrame:
         """Appends Life expectancy column from HLD data to the input DataFrame
         based on country, age, sex and year in the specific cols mapping.
 
+        Within the country and sex, a request is resolved to the life table
+        whose year span (Year1-Year2) contains the year and to its row whose
+        age interval (Age, AgeInt) contains the age. Requests no table contains
+        are matched on age and year jointly: the row minimising
+        ``age_weight * |age gap| + year_weight * |year gap|`` is used, so a
+        slightly different age can win over a distant year.
+
+        Where HLD has several life tables for the same country, sex and year
+        span, one is chosen once at load time by the ``preference`` rules.
+
         Args:
             df: Pandas DataFrame containing the input data.
             cols: Column mapping for country, age, sex, and year in DataFrame.
                 None for default mapping: {'country': 'country', 'age': 'age',
                 'sex': 'sex', 'year': 'year'}.
+                With 'birth_date' and 'event_date' mapped instead of 'age' and
+                'year', the exact age and decimal year at the event are used.
+            age_weight: Cost of one year of difference between requested and
+                matched age.
+            year_weight: Cost of one calendar year of difference between
+                requested and matched year.
+            diagnostics: Also append 'hld_age_gap', 'hld_year_gap' and
+                'hld_match_kind' columns. The kind is 'fallback' when the
+                country was only found by partial code matching.
+            max_year_gap: Drop matches whose year is further than this from
+                the requested year; None for no limit.
+            preference: Rules for choosing among duplicate life tables; None
+                for the defaults of :class:`HLDTablePreference`.
+            interpolate: Interpolate life expectancy linearly between the ages
+                of the matched table instead of taking the matched row's value;
+                None to interpolate when ages are derived from dates.
+            discount_rate: Annual rate at which future years of life are
+                discounted in the 'hld_discounted_yll' column, e.g. 0.03.
+            age_weighting: Share of the GBD age weights in the
+                'hld_discounted_yll' column, from 0 (none) to 1. The column
+                is only added when this or ``discount_rate`` is not zero.
+            cohort: Use the cohort life expectancy of the birth cohort (year
+                less age) instead of the period life expectancy of the year,
+                see :meth:`cohort_life_expectancy_hld`. The matched birth
+                year is returned in 'hld_cohort' instead of 'hld_year'.
+            project: Extrapolate life expectancy to years after the last one
+                of the data along its log-linear trend over the latest years,
+                instead of using the last year's value; see
+                :meth:`lost_years.matching.LifeTableIndex.trend_factors`.
+            engine: CSV parser for loading the reference data, one of
+                'auto', 'c', 'pyarrow' or 'python'; only used on first load.
 
         Returns:
             Pandas DataFrame with HLD data columns:
-                'hld_country', 'hld_age', 'hld_sex', 'hld_year', 'hld_life_expectancy'.
+                'hld_country', 'hld_age', 'hld_sex', 'hld_year', 'hld_life_expectancy'
+                and optionally 'hld_discounted_yll': the remaining years of
+                life, discounted and age weighted over the survivors of the
+                matched table (l(x)), or in closed form where it has none.
         """
-        df_cols = {}
-        for col in ["country", "age", "sex", "year"]:
-            tcol = col if cols is None else cols[col]
-            if tcol not in df.columns:
-                logger.warning(f"No column `{tcol!s}` in the DataFrame")
-                return df
-            df_cols[col] = tcol
-
-        if cls.__df is None:
-            # Check if HLD data file exists
-            hld_path = Path(str(HLD_DATA))
-            if not hld_path.exists():
-                logger.error(f"HLD data file not found: {HLD_DATA}")
-                logger.info("Run: python lost_years/data/hld/update_hld_data.py")
-                logger.info("Or manually download from: https://www.lifetable.de/")
-                return df
-
-            try:
-                # Load HLD data
-                logger.info("Loading HLD data (this may take a moment for 2M+ records)...")
-                cls.__df = pd.read_csv(
-                    str(HLD_DATA), compression="gzip", usecols=HLD_COLS, low_memory=False
-                )
+        df_cols = query_columns(df, cols, ["country", "age", "sex", "year"])
+        if df_cols is None:
+            return df
 
-                if cls.__df.empty:
-                    logger.error("HLD data file is empty")
-                    return df
-
-                # Clean and standardize the data
-                cls.__df = cls.__df.dropna(subset=["Country", "Year1", "Sex", "e(x)"])
-
-                # Standardize column names for lookup
-                cls.__df = cls.__df.rename(
-                    columns={
-                        "Country": "country",
-                        "Year1": "year",
-                        "Sex": "sex",
-                        "Age": "age",
-                        "e(x)": "life_expectancy",
-                    }
+        match = cls._match(
+            df, df_cols, age_weight, year_weight, max_year_gap, preference, engine, cohort
+        )
+        if match is None:
+            return df
+        index, ages, years, rows, quality, keep = match
+        table = index.table
+        kept = np.where(keep, rows, -1)
+
+        out = {}
+        for src, dst in [
+            ("country", "hld_country"),
+            ("age", "hld_age"),
+            ("sex", "hld_sex"),
+            ("year", "hld_cohort" if cohort else "hld_year"),
+            ("life_expectancy", "hld_life_expectancy"),
+        ]:
+            # Replace misses with empty string for cleaner output
+            out[dst] = gather(table[src], rows, keep, df.index, other="")
+        if interpolate is None:
+            interpolate = DATE_COLUMNS[0] in df_cols
+        if interpolate:
+            life_expectancy = index.interpolate("life_expectancy", kept, ages)
+            out["hld_life_expectancy"] = pd.Series(life_expectancy, index=df.index).where(keep, "")
+        if project:
+            projected = pd.to_numeric(out["hld_life_expectancy"], errors="coerce") * (
+                index.trend_factors("life_expectancy", kept, years)
+            )
+            out["hld_life_expectancy"] = projected.where(keep, "")
+        if discount_rate or age_weighting:
+            values = indexed_discounted_life_expectancy(
+                index, "survivors", "life_expectancy", discount_rate, age_weighting
+            )
+            if interpolate:
+                adjusted = pd.Series(index.interpolate(values, kept, ages), index=df.index)
+            else:
+                adjusted = gather(pd.Series(values), rows, keep, df.index)
+            if project:
+                adjusted = pd.to_numeric(adjusted, errors="coerce") * (
+                    index.trend_factors(values, kept, years)
                 )
+            out["hld_discounted_yll"] = adjusted.where(keep, "")
+        if diagnostics:
+            out.update(quality)
 
-                # Convert sex codes: 1=Male, 2=Female -> M/F for consistency
-                cls.__df["sex"] = cls.__df["sex"].map({1: "M", 2: "F"})
+        return df.assign(**out)
 
-                # Convert data types
-                cls.__df["year"] = pd.to_numeric(cls.__df["year"], errors="coerce")
-                cls.__df["age"] = pd.to_numeric(cls.__df["age"], errors="coerce")
-                cls.__df["life_expectancy"] = pd.to_numeric(
-                    cls.__df["life_expectancy"], errors="coerce"
-                )
+    @classmethod
+    def survival_hld(
+        cls,
+        df: pd.DataFrame,
+        cols: dict[str, str] | None = None,
+        to_age: str | None = None,
+        age_weight: float = 1.0,
+        year_weight: float = 1.0,
+        max_year_gap: float | None = None,
+        preference: HLDTablePreference | None = None,
+        engine: str = "auto",
+    ) -> pd.DataFrame:
+        """Appends survival probability and expected age at death from HLD data.
+
+        Each row is matched to a life table as in :meth:`lost_years_hld`.
+        Survival between ages comes from the table's l(x) column,
+        interpolated between ages with a constant force of mortality, see
+        :class:`lost_years.lifetable.SurvivalCurves`.
+
+        Args:
+            df: Pandas DataFrame containing the input data.
+            cols: Column mapping for country, age, sex, and year in DataFrame.
+                None for default mapping: {'country': 'country', 'age': 'age',
+                'sex': 'sex', 'year': 'year'}.
+                With 'birth_date' and 'event_date' mapped instead of 'age' and
+                'year', the exact age and decimal year at the event are used.
+            to_age: Column holding the age to survive to; None to only append
+                the expected age at death.
+            age_weight: See :meth:`lost_years_hld`.
+            year_weight: See :meth:`lost_years_hld`.
+            max_year_gap: Leave rows whose matched year is further than this
+                from the requested year empty; None for no limit.
+            preference: See :meth:`lost_years_hld`.
+            engine: CSV parser for loading the reference data, one of
+                'auto', 'c', 'pyarrow' or 'python'; only used on first load.
+
+        Returns:
+            Pandas DataFrame with columns 'hld_year',
+            'hld_expected_age_at_death' and, with ``to_age``, 'hld_survival':
+            the probability of surviving from age to ``to_age`` (NaN where
+            the table has no l(x)).
+        """
+        df_cols = query_columns(df, cols, ["country", "age", "sex", "year"])
+        if df_cols is None:
+            return df
+        if to_age is not None and to_age not in df.columns:
+            logger.warning(f"No column `{to_age!s}` in the DataFrame")
+            return df
+
+        match = cls._match(df, df_cols, age_weight, year_weight, max_year_gap, preference, engine)
+        if match is None:
+            return df
+        index, ages, _, rows, _, keep = match
+        table = index.table
+
+        preference = preference or HLDTablePreference()
+        if preference not in cls.__curves:
+            # Tables are contiguous in the index, ages increasing within them
+            cls.__curves[preference] = SurvivalCurves(
+                pd.factorize(table["table_id"])[0],
+                table["age"],
+                table["survivors"],
+                table["life_expectancy"],
+            )
+        curves = cls.__curves[preference]
+        tables = np.where(keep, curves.table_codes[np.where(keep, rows, 0)], -1)
+
+        out = {
+            "hld_year": gather(table["year"], rows, keep, df.index, other=""),
+            "hld_expected_age_at_death": curves.expected_age_at_death(tables, ages),
+        }
+        if to_age is not None:
+            to_ages = pd.to_numeric(df[to_age], errors="coerce").to_numpy(dtype="float64")
+            out["hld_survival"] = curves.survival(tables, ages, to_ages)
+        return df.assign(**out)
+
+    @classmethod
+    def _match(
+        cls,
+        df: pd.DataFrame,
+        df_cols: dict[str, str],
+        age_weight: float,
+        year_weight: float,
+        max_year_gap: float | None,
+        preference: HLDTablePreference | None,
+        engine: str,
+        cohort: bool = False,
+    ) -> (
+        tuple[
+            LifeTableIndex,
+            npt.NDArray[np.float64],
+            npt.NDArray[np.float64],
+            npt.NDArray[np.intp],
+            dict[str, Any],
+            npt.NDArray[np.bool_],
+        ]
+        | None
+    ):
+        """Match every input row to a row of the chosen HLD tables.
 
-                # Remove invalid records
-                cls.__df = cls.__df.dropna()
-
-                logger.info(f"Loaded HLD data: {len(cls.__df):,} records")
-                logger.info(f"Countries: {cls.__df['country'].nunique()}")
-                year_min = cls.__df["year"].min()
-                year_max = cls.__df["year"].max()
-                logger.info(f"Year range: {year_min:.0f}-{year_max:.0f}")
-
-            except Exception as e:
-                logger.error(f"Error loading HLD data: {e}")
-                logger.error("The HLD data file may be corrupted or missing.")
-                logger.info("Run: python lost_years/data/hld/update_hld_data.py")
-                return df
-
-        # Process input data
-        # Convert sex to standard format
-        df_temp = df.copy()
-        df_temp["__temp_sex"] = df_temp[df_cols["sex"]].apply(
-            lambda x: "M" if str(x).lower() in ["m", "male", "1"] else "F"
+        Args:
+            df: Input DataFrame.
+            df_cols: Input columns, see :func:`lost_years.utils.query_columns`.
+            age_weight: See :meth:`lost_years_hld`.
+            year_weight: See :meth:`lost_years_hld`.
+            max_year_gap: See :meth:`lost_years_hld`.
+            preference: See :meth:`lost_years_hld`.
+            engine: See :meth:`lost_years_hld`.
+            cohort: Match birth cohorts (year less age) in the cohort tables
+                instead of years in the period tables.
+
+        Returns:
+            Tuple of (index, query ages, query years (birth years with
+            ``cohort``), matched row position per input row, diagnostic
+            columns, mask of matches to keep), or None if no data is loaded.
+        """
+        index = cls._cohort_index(preference, engine) if cohort else cls._index(preference, engine)
+        if index is None:
+            return None
+
+        # Resolve every input row to a (country, sex) group of the index
+        countries, fallback = cls._resolve_countries(index.table, df[df_cols["country"]])
+        sexes = np.where(
+            df[df_cols["sex"]].astype(str).str.lower().isin(["m", "male", "1"]), "M", "F"
+        )
+        group_ids = index.group_ids([pd.Series(countries), pd.Series(sexes)])
+
+        # Joint nearest (age, year) match, one vectorized query per group
+        ages, years = query_ages_years(df, df_cols)
+        if cohort:
+            years = years - ages
+        rows = index.lookup(group_ids, ages, years, age_weight, year_weight)
+
+        matched = rows >= 0
+        safe_rows = np.where(matched, rows, 0)
+        table = index.table
+        quality, keep = match_quality(
+            "hld",
+            ages,
+            years,
+            table["age"].to_numpy(dtype="float64")[safe_rows],
+            table["year"].to_numpy(dtype="float64")[safe_rows],
+            matched,
+            fallback=fallback,
+            max_year_gap=max_year_gap,
+            matched_age_ends=table["age_end"].to_numpy(dtype="float64")[safe_rows],
+            matched_year_ends=table["year_end"].to_numpy(dtype="float64")[safe_rows],
         )
+        return index, ages, years, rows, quality, keep
 
-        out_df = pd.DataFrame()
-        for i, r in df_temp.iterrows():
-            # Filter HLD data for this record
-            sdf = cls.__df.copy()
-
-            # Match country (try both exact and close matches)
-            country_val = str(r[df_cols["country"]]).upper()
-            country_matches = sdf[sdf["country"].str.upper() == country_val]
-
-            if country_matches.empty:
-                # Try partial matching for country codes
-                country_matches = sdf[
-                    sdf["country"].str.upper().str.contains(country_val, na=False)
-                ]
-
-            if country_matches.empty:
-                # No country match found, skip this record
-                empty_row = pd.DataFrame(
-                    {
-                        "hld_country": [None],
-                        "hld_age": [None],
-                        "hld_sex": [None],
-                        "hld_year": [None],
-                        "hld_life_expectancy": [None],
-                        "index": [i],
-                    }
-                )
-                out_df = pd.concat([out_df, empty_row])
-                continue
+    @classmethod
+    def _index(cls, preference: HLDTablePreference | None, engine: str) -> LifeTableIndex | None:
+        """Index of the HLD period tables chosen by the preference rules.
 
-            sdf = country_matches
-
-            # Match other dimensions
-            for c, col_name in [
-                ("sex", "__temp_sex"),
-                ("age", df_cols["age"]),
-                ("year", df_cols["year"]),
-            ]:
-                if c == "sex":
-                    target_val = r[col_name]
-                else:
-                    target_val = r[col_name]
-
-                if sdf[c].dtype in ["int32", "int64", "float64"]:
-                    # Numeric matching with closest value
-                    sdf = sdf[sdf[c] == closest(sdf[c].unique(), target_val)]
-                else:
-                    # String matching
-                    sdf = sdf[sdf[c].astype(str).str.upper() == str(target_val).upper()]
-
-            # Get the best match
-            if not sdf.empty:
-                # If multiple matches, take the first one
-                best_match = sdf.iloc[0]
-                odf = pd.DataFrame(
-                    {
-                        "hld_country": [best_match["country"]],
-                        "hld_age": [best_match["age"]],
-                        "hld_sex": [best_match["sex"]],
-                        "hld_year": [best_match["year"]],
-                        "hld_life_expectancy": [best_match["life_expectancy"]],
-                        "index": [i],
-                    }
-                )
-            else:
-                # No match found
-                odf = pd.DataFrame(
-                    {
-                        "hld_country": [None],
-                        "hld_age": [None],
-                        "hld_sex": [None],
-                        "hld_year": [None],
-                        "hld_life_expectancy": [None],
-                        "index": [i],
-                    }
-                )
+        Args:
+            preference: See :meth:`lost_years_hld`.
+            engine: See :meth:`lost_years_hld`.
+
+        Returns:
+            The cached index, or None if no data is loaded.
+        """
+        # Reload, and drop derived indexes, when the data file changed
+        current = fingerprint(str(HLD_DATA))
+        if cls.__data is not None and cls.__fingerprint != current:
+            cls.clear_cache()
+        if cls.__data is None:
+            check_artifact("hld", str(HLD_DATA))
+            cls.__data = cls._load_data(engine)
+            cls.__fingerprint = current
+            if cls.__data is None:
+                return None
+        preference = preference or HLDTablePreference()
+        if preference not in cls.__indexes:
+            hdf = cls._select_tables(cls.__data, preference)
+            cls.__indexes[preference] = LifeTableIndex(
+                hdf, ["country", "sex"], ["year_end", "table_id"]
+            )
+        return cls.__indexes[preference]
+
+    @classmethod
+    def cohort_life_expectancy_hld(
+        cls, preference: HLDTablePreference | None = None, engine: str = "auto"
+    ) -> pd.DataFrame:
+        """Cohort life expectancy of every HLD birth cohort.
+
+        A birth cohort lives its age x in the calendar year of birth + x, so
+        its death rates run diagonally through the period tables of
+        consecutive years. The chosen period tables are spread to single
+        ages and years, and the cohort life tables of all countries, sexes
+        and birth years are built together from that grid, see
+        :meth:`_cohort_tables`. The result is cached per preference.
+
+        Args:
+            preference: Rules for choosing among duplicate period tables; None
+                for the defaults of :class:`HLDTablePreference`.
+            engine: CSV parser for loading the reference data, one of
+                'auto', 'c', 'pyarrow' or 'python'; only used on first load.
+
+        Returns:
+            DataFrame with columns 'country', 'sex', 'cohort' (birth year),
+            'age' and 'life_expectancy', one row per cohort and age from
+            which the cohort's mortality is known up to the oldest age of
+            the data; empty if no data is loaded.
+        """
+        index = cls._cohort_index(preference, engine)
+        if index is None:
+            return pd.DataFrame(columns=["country", "sex", "cohort", "age", "life_expectancy"])
+        table = index.table.rename(columns={"year": "cohort"})
+        return table[["country", "sex", "cohort", "age", "life_expectancy"]].copy()
+
+    @classmethod
+    def _cohort_index(
+        cls, preference: HLDTablePreference | None, engine: str
+    ) -> LifeTableIndex | None:
+        """Index of the cohort tables, with the birth year as 'year'.
 
-            out_df = pd.concat([out_df, odf])
+        Args:
+            preference: See :meth:`lost_years_hld`.
+            engine: See :meth:`lost_years_hld`.
+
+        Returns:
+            The cached index, or None if no data is loaded.
+        """
+        periods = cls._index(preference, engine)
+        if periods is None:
+            return None
+        preference = preference or HLDTablePreference()
+        if preference not in cls.__cohorts:
+            cohorts = cls._cohort_tables(periods.table)
+            cls.__cohorts[preference] = LifeTableIndex(cohorts, ["country", "sex"])
+            logger.info(f"Built {len(cohorts):,} HLD cohort life table rows")
+        return cls.__cohorts[preference]
+
+    @classmethod
+    def _cohort_tables(cls, hdf: pd.DataFrame) -> pd.DataFrame:
+        """Build the cohort life tables of the period tables' birth cohorts.
+
+        Every period table is spread to a ``(country, sex) x year x age``
+        grid of single-age death rates m(x): the rate of an age interval
+        applies to each of its ages, and a table spanning several years to
+        each of its years (where tables overlap, the shortest span wins).
+        Death rates come from m(x), else from q(x), else, in the open age
+        interval, from 1 / e(x). A strided view of the grid turns the
+        diagonals into rows, one per (country, sex, birth year), and
+        :func:`lost_years.lifetable.life_table` builds them all at once.
+
+        Args:
+            hdf: Chosen HLD period tables, each a contiguous block of rows.
 
-        # Clean up and join with original data
-        out_df.set_index("index", drop=True, inplace=True)
-        out_df = out_df.fillna("")  # Replace NaN with empty string for cleaner output
+        Returns:
+            Cohort tables in the layout of the period tables, with the birth
+            year as 'year' and ages known through the oldest age of the data.
+        """
+        # Single-age death rate of every table row
+        age = hdf["age"].to_numpy(dtype="int64")
+        age_end = hdf["age_end"].to_numpy(dtype="float64")
+        width = age_end - age
+        rates = hdf["death_rate"].to_numpy(dtype="float64")
+        probs = hdf["death_prob"].to_numpy(dtype="float64")
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # Inverse of q = n m / (1 + n m / 2)
+            rates = np.where(np.isnan(rates), probs / (width * (1 - probs / 2)), rates)
+            open_rate = 1 / hdf["life_expectancy"].to_numpy(dtype="float64")
+        rates = np.where(np.isnan(rates) & np.isinf(width), open_rate, rates)
+
+        # Tables x single ages, the open interval running to the oldest age
+        top = int(age.max())
+        n_ages = top + 1
+        stop = np.minimum(age_end, n_ages).astype("int64")
+        counts = np.maximum(stop - age, 0)
+        row_of = np.repeat(np.arange(len(hdf)), counts)
+        age_of = (
+            age[row_of] + np.arange(len(row_of)) - np.repeat(np.cumsum(counts) - counts, counts)
+        )
+        table_of, _ = pd.factorize(hdf["table_id"])
+        by_table = np.full((table_of.max() + 1, n_ages), np.nan)
+        by_table[table_of[row_of], age_of] = rates[row_of]
+
+        # Calendar years of every table; the last one wins, so narrow spans go last
+        tables = hdf.drop_duplicates("table_id")
+        group_of, groups = pd.factorize(pd.MultiIndex.from_frame(tables[["country", "sex"]]))
+        first = tables["year"].to_numpy(dtype="int64")
+        spans = (tables["year_end"].to_numpy(dtype="float64") - first).astype("int64")
+        order = np.argsort(-spans, kind="stable")
+        table_years = np.repeat(order, spans[order])
+        years = (
+            first[table_years]
+            + np.arange(len(table_years))
+            - np.repeat(np.cumsum(spans[order]) - spans[order], spans[order])
+        )
 
-        # Join with original DataFrame
-        result_df = df.join(out_df)
-        return result_df
+        cells = pd.DataFrame({"group": group_of[table_years], "year": years})
+        last = ~cells.duplicated(keep="last").to_numpy()
+        table_years, years = table_years[last], years[last]
 
+        # Grid of rates, led by ``top`` empty years so every diagonal fits
+        y0 = int(years.min())
+        n_years = int(years.max()) - y0 + 1
+        grid = np.full((len(groups), top + n_years, n_ages), np.nan)
+        grid[group_of[table_years], top + years - y0] = by_table[table_years]
 
-# Export the function
+        # Cohort k, born in y0 - top + k, is at age x in grid year k + x
+        s_group, s_year, s_age = grid.strides
+        diagonals = np.lib.stride_tricks.as_strided(
+            grid, shape=(len(groups), n_years, n_ages), strides=(s_group, s_year, s_year + s_age)
+        )
+        # Only cohorts observed up to the oldest age; from the first age
+        # their rates are known through it
+        observed = ~np.isnan(diagonals[:, :, -1])
+        cohort_group, cohort_k = np.nonzero(observed)
+        mx = diagonals[cohort_group, cohort_k]
+        known = np.flip(np.logical_and.accumulate(np.flip(~np.isnan(mx), axis=1), axis=1), axis=1)
+        # No one dies at the unknown leading ages, so l(x) holds until the first known age
+        cohort = life_table(np.arange(n_ages), mx=np.where(known, mx, 0.0))
+
+        rows, ages = np.nonzero(known)
+        keys = groups[cohort_group[rows]]
+        birth_years = y0 - top + cohort_k[rows]
+        return pd.DataFrame(
+            {
+                "country": keys.get_level_values(0),
+                "sex": keys.get_level_values(1),
+                "year": birth_years,
+                "year_end": birth_years + 1,
+                "age": ages,
+                "age_end": np.where(ages == top, np.inf, ages + 1.0),
+                "life_expectancy": cohort.ex[rows, ages],
+                "survivors": cohort.lx[rows, ages],
+            }
+        )
+
+    @classmethod
+    def clear_cache(cls) -> None:
+        """Drop the loaded HLD data and every index derived from it."""
+        cls.__data = None
+        cls.__indexes = {}
+        cls.__curves = {}
+        cls.__cohorts = {}
+        cls.__fingerprint = None
+
+    @classmethod
+    def _load_data(cls, engine: str = "auto") -> pd.DataFrame | None:
+        """Load and clean the HLD data file.
+
+        Args:
+            engine: CSV parser, see :func:`lost_years.utils.resolve_engine`.
+
+        Returns:
+            Cleaned HLD DataFrame, or None if the file could not be loaded.
+        """
+        # Check if HLD data file exists
+        hld_path = Path(str(HLD_DATA))
+        if not hld_path.exists():
+            logger.error(f"HLD data file not found: {HLD_DATA}")
+            logger.info("Run: python lost_years/data/hld/update_hld_data.py")
+            logger.info("Or manually download from: https://www.lifetable.de/")
+            return None
+
+        try:
+            # Load HLD data
+            logger.info("Loading HLD data (this may take a moment for 2M+ records)...")
+            # Parsed into final types, with incomplete rows dropped and
+            # missing table identity columns filled (see HLDSchema.LAYOUT)
+            hdf = load_table("hld", str(HLD_DATA), engine)
+
+            # Convert sex codes: 1=Male, 2=Female -> M/F for consistency
+            hdf = hdf[hdf["sex"].isin([1, 2])]
+            if hdf.empty:
+                logger.error("HLD data file is empty")
+                return None
+            hdf["sex"] = hdf["sex"].map({1: "M", 2: "F"})
+
+            # Keep year spans [Year1, Year2] and age intervals [Age, Age + AgeInt)
+            # as half-open bounds; AgeInt 99 marks the open upper age interval
+            hdf["year_end"] = hdf["year_end"].fillna(hdf["year"]) + 1
+            age_interval = hdf.pop("age_interval")
+            hdf["age_end"] = (hdf["age"] + age_interval.fillna(1)).where(age_interval != 99, np.inf)
+
+            # Rows of one life table are contiguous in the file with increasing ages
+            keys = hdf[["country", "sex", "year", "year_end", *HLD_TABLE_COLS.values()]]
+            new_table = keys.ne(keys.shift()).any(axis=1) | hdf["age"].diff().le(0)
+            hdf["table_id"] = new_table.cumsum().to_numpy(dtype="int64")
+
+            logger.info(f"Loaded HLD data: {len(hdf):,} records")
+            logger.info(f"Countries: {hdf['country'].nunique()}")
+            year_min = hdf["year"].min()
+            year_max = hdf["year"].max()
+            logger.info(f"Year range: {year_min:.0f}-{year_max:.0f}")
+
+        except Exception as e:
+            logger.error(f"Error loading HLD data: {e}")
+            logger.error("The HLD data file may be corrupted or missing.")
+            logger.info("Run: python lost_years/data/hld/update_hld_data.py")
+            return None
+
+        return hdf
+
+    @classmethod
+    def _select_tables(cls, hdf: pd.DataFrame, preference: HLDTablePreference) -> pd.DataFrame:
+        """Keep one canonical life table per country, sex and year span.
+
+        Ranks every table once by the preference rules and drops the rest, so
+        lookups never see duplicates and the choice is reproducible.
+
+        Args:
+            hdf: Cleaned HLD DataFrame with a ``table_id`` per life table.
+            preference: Rules for choosing among duplicate tables.
+
+        Returns:
+            HLD DataFrame restricted to the chosen tables.
+        """
+        tables = hdf.drop_duplicates("table_id")
+        key = ["country", "sex", "year", "year_end"]
+
+        subpopulation = tables[HLD_SUBPOPULATION_COLS].ne(0).any(axis=1)
+        type_rank = tables["table_type"].map(
+            {t: rank for rank, t in enumerate(preference.type_order)}
+        )
+        source_rank = pd.Series(len(preference.sources), index=tables.index)
+        for rank, prefix in reversed(list(enumerate(preference.sources))):
+            source_rank = source_rank.mask(tables["source"].str.startswith(prefix), rank)
+
+        ranks = pd.DataFrame(
+            {
+                "subpopulation": subpopulation if preference.total_population else False,
+                "source_rank": source_rank,
+                "type": type_rank.fillna(len(preference.type_order)),
+                "version": -tables["version"] if preference.latest_version else 0,
+                "source": tables["source"],
+                "table_id": tables["table_id"],
+            }
+        )
+        ranked = pd.concat([tables[key], ranks], axis=1).sort_values(
+            [*key, *ranks.columns], kind="stable"
+        )
+        chosen = ranked.drop_duplicates(key)["table_id"]
+
+        dropped = len(tables) - len(chosen)
+        if dropped:
+            logger.info(f"Dropped {dropped:,} duplicate HLD life tables")
+        return hdf[hdf["table_id"].isin(chosen)]
+
+    @classmethod
+    def _resolve_countries(
+        cls, hdf: pd.DataFrame, values: pd.Series
+    ) -> tuple[npt.NDArray[np.object_], npt.NDArray[np.bool_]]:
+        """Map input country values to HLD country codes.
+
+        Exact (case-insensitive) matches win; otherwise the first HLD code
+        containing the input value is used. Resolution runs once per distinct
+        input value, not once per row.
+
+        Args:
+            hdf: Indexed HLD DataFrame.
+            values: Input country column.
+
+        Returns:
+            Tuple of (HLD country code per row, None where nothing matched;
+            whether the partial matching fallback was used for the row).
+        """
+        hld_countries = pd.Series(hdf["country"].unique())
+        hld_upper = hld_countries.str.upper()
+        exact = dict(zip(hld_upper[::-1], hld_countries[::-1], strict=True))
+
+        upper = values.astype(str).str.upper()
+        resolved = {}
+        partial_values = set()
+        for value in upper.unique():
+            if value in exact:
+                resolved[value] = exact[value]
+                continue
+            # Try partial matching for country codes
+            partial = hld_countries[hld_upper.str.contains(value, regex=False)]
+            if not partial.empty:
+                resolved[value] = partial.iloc[0]
+                partial_values.add(value)
+
+        codes = upper.map(resolved).to_numpy(dtype="object")
+        return codes, upper.isin(partial_values).to_numpy()
+
+
+# Export the functions
 lost_years_hld = LostYearsHLDData.lost_years_hld
+survival_hld = LostYearsHLDData.survival_hld
+cohort_life_expectancy_hld = LostYearsHLDData.cohort_life_expectancy_hld
 
 
 def main(argv: list[str] = sys.argv[1:]) -> int:
@@ -245,6 +692,61 @@ def main(argv: list[str] = sys.argv[1:]) -> int:
         default="year",
         help="Column name of year in the input file (default=`year`)",
     )
+    parser.add_argument(
+        "--age-weight",
+        type=float,
+        default=1.0,
+        help="Cost of one year of age difference when matching (default=1.0)",
+    )
+    parser.add_argument(
+        "--year-weight",
+        type=float,
+        default=1.0,
+        help="Cost of one calendar year of difference when matching (default=1.0)",
+    )
+    parser.add_argument(
+        "--birth-date",
+        default=None,
+        help="Column name of date of birth; with --event-date, used instead of age and year",
+    )
+    parser.add_argument(
+        "--event-date",
+        default=None,
+        help="Column name of the date (e.g. of death) at which age and year are taken",
+    )
+    parser.add_argument(
+        "--interpolate",
+        action="store_true",
+        default=None,
+        help="Interpolate life expectancy between ages (default with date columns)",
+    )
+    parser.add_argument(
+        "--diagnostics",
+        action="store_true",
+        help="Append hld_age_gap, hld_year_gap and hld_match_kind columns",
+    )
+    parser.add_argument(
+        "--cohort",
+        action="store_true",
+        help="Use the cohort life expectancy of the birth year (year less age)",
+    )
+    parser.add_argument(
+        "--project",
+        action="store_true",
+        help="Extrapolate life expectancy to years after the data along its recent trend",
+    )
+    parser.add_argument(
+        "--max-year-gap",
+        type=float,
+        default=None,
+        help="Drop matches further than this many years from the requested year",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=CSV_ENGINES,
+        default="auto",
+        help="CSV parser for the input and reference data (default=`auto`: pyarrow if installed)",
+    )
     parser.add_argument(
         "-o",
         "--output",
@@ -255,15 +757,25 @@ def main(argv: list[str] = sys.argv[1:]) -> int:
     args = parser.parse_args(argv)
     logger.debug(args)
 
-    df = pd.read_csv(args.input)
+    df = read_csv(args.input, args.engine)
+
+    dates = {}
+    if args.birth_date and args.event_date:
+        dates = {"birth_date": args.birth_date, "event_date": args.event_date}
+        for col_arg in dates.values():
+            if not column_exists(df, col_arg):
+                logger.error(f"Column: `{col_arg!s}` not found in the input file")
+                return -1
 
     # Validate columns
-    for _col_name, col_arg in [
+    for col_name, col_arg in [
         ("country", args.country),
         ("age", args.age),
         ("sex", args.sex),
         ("year", args.year),
     ]:
+        if dates and col_name in ("age", "year"):
+            continue
         if not column_exists(df, col_arg):
             logger.error(f"Column: `{col_arg!s}` not found in the input file")
             return -1
@@ -276,7 +788,16 @@ def main(argv: list[str] = sys.argv[1:]) -> int:
             "age": args.age,
             "sex": args.sex,
             "year": args.year,
+            **dates,
         },
+        age_weight=args.age_weight,
+        year_weight=args.year_weight,
+        diagnostics=args.diagnostics,
+        max_year_gap=args.max_year_gap,
+        project=args.project,
+        interpolate=args.interpolate,
+        cohort=args.cohort,
+        engine=args.engine,
     )
 
     # Save output
@@ -0,0 +1,521 @@
+"""Vectorized life table construction.
+
+The packaged data only carry the published life expectancy of each table,
+but the SSA and HLD tables also hold the mortality columns it was derived
+from: death probabilities q(x), central death rates m(x) or survivors l(x).
+The helpers here rebuild the full life table (l(x), d(x), L(x), T(x), e(x))
+from any one of those columns, for many tables at once: tables are rows of
+2-D ``tables x ages`` arrays and every column is computed with whole-array
+NumPy operations, so custom mortality scenarios can be evaluated without a
+Python loop per table. :class:`SurvivalCurves` answers survival and
+expected age at death queries from the l(x) column of the packaged tables.
+"""
+
+from dataclasses import dataclass
+from typing import Any
+
+import numpy as np
+import numpy.typing as npt
+import pandas as pd
+
+from .matching import LifeTableIndex, _combined_key
+
+RADIX = 100_000.0  # l(x) at the first age
+LIFE_TABLE_COLUMNS = ("qx", "lx", "dx", "Lx", "Tx", "ex")
+
+FloatArray = npt.NDArray[np.float64]
+
+
+@dataclass(frozen=True)
+class LifeTable:
+    """Columns of one or more life tables, as ``tables x ages`` arrays.
+
+    Tables shorter than ``ages`` are padded with NaN after their last,
+    open-ended age interval.
+
+    Attributes:
+        ages: Start of each age interval.
+        qx: Probability of dying within the interval.
+        lx: Survivors at the start of the interval, out of the radix.
+        dx: Deaths within the interval.
+        Lx: Person-years lived within the interval.
+        Tx: Person-years lived from the start of the interval on.
+        ex: Life expectancy at the start of the interval.
+    """
+
+    ages: FloatArray
+    qx: FloatArray
+    lx: FloatArray
+    dx: FloatArray
+    Lx: FloatArray
+    Tx: FloatArray
+    ex: FloatArray
+
+    def to_frame(self, keys: pd.DataFrame | None = None) -> pd.DataFrame:
+        """Long format: one row per table and age, without padding.
+
+        Args:
+            keys: Columns identifying each table, one row per table; they
+                are repeated for every age of the table.
+
+        Returns:
+            DataFrame with the ``keys`` columns, 'age' and the life table
+            columns.
+        """
+        n_tables, n_ages = self.ex.shape
+        valid = ~np.isnan(self.qx)
+        rows, cols = np.nonzero(valid)
+        data: dict[str, Any] = {}
+        if keys is not None:
+            if len(keys) != n_tables:
+                raise ValueError(f"Expected {n_tables} rows of keys, got {len(keys)}")
+            data.update({c: keys[c].to_numpy()[rows] for c in keys.columns})
+        data["age"] = self.ages[cols]
+        data.update({c: getattr(self, c)[valid] for c in LIFE_TABLE_COLUMNS})
+        return pd.DataFrame(data)
+
+
+def _as_2d(values: Any, n_ages: int, name: str) -> FloatArray:
+    array = np.atleast_2d(np.asarray(values, dtype="float64"))
+    if array.shape[-1] != n_ages:
+        raise ValueError(f"{name} has {array.shape[-1]} ages, expected {n_ages}")
+    return array
+
+
+def interval_widths(ages: npt.ArrayLike) -> FloatArray:
+    """Width of each age interval.
+
+    The last, open-ended interval gets the width of the one before it (1 for
+    a single age).
+
+    Raises:
+        ValueError: If ages are not strictly increasing.
+    """
+    ages = np.asarray(ages, dtype="float64")
+    widths = np.diff(ages)
+    if (widths <= 0).any():
+        raise ValueError("Ages must be strictly increasing")
+    return np.append(widths, widths[-1] if len(widths) else 1.0)
+
+
+def life_table(
+    ages: npt.ArrayLike,
+    qx: npt.ArrayLike | None = None,
+    mx: npt.ArrayLike | None = None,
+    lx: npt.ArrayLike | None = None,
+    ax: npt.ArrayLike | None = None,
+    radix: float = RADIX,
+) -> LifeTable:
+    """Build life tables from one mortality column.
+
+    Exactly one of ``qx``, ``mx`` and ``lx`` is given, either for one table
+    (1-D, one value per age) or for many (2-D, one row per table). A table
+    ends at its last non-NaN value; that age interval is open-ended, so
+    everyone alive at its start dies within it.
+
+    Death rates are converted with ``q = n m / (1 + (n - a) m)``, and the
+    open interval lives ``L = l / m`` person-years. Without death rates it
+    lives ``L = a l``.
+
+    Args:
+        ages: Start of each age interval, strictly increasing.
+        qx: Probabilities of dying within each interval.
+        mx: Central death rates.
+        lx: Survivors at the start of each interval; rescaled to ``radix``.
+        ax: Average years lived within the interval by those dying in it;
+            scalar, per age, or per table and age. Defaults to half the
+            interval.
+        radix: Survivors at the first age.
+
+    Returns:
+        LifeTable with 2-D columns, one row per table.
+
+    Raises:
+        ValueError: If not exactly one mortality column is given, or its
+            shape does not match ``ages``.
+    """
+    given = {name: v for name, v in (("qx", qx), ("mx", mx), ("lx", lx)) if v is not None}
+    if len(given) != 1:
+        raise ValueError("Give exactly one of qx, mx and lx")
+    ages = np.asarray(ages, dtype="float64")
+    n_ages = len(ages)
+    widths = interval_widths(ages)
+    name, values = given.popitem()
+    values = _as_2d(values, n_ages, name)
+    a = np.broadcast_to(widths / 2 if ax is None else np.asarray(ax, dtype="float64"), values.shape)
+
+    # A table ends at its last value; the padding after it stays NaN
+    valid = ~np.isnan(values)
+    last = valid.sum(axis=1) - 1
+    is_last = np.arange(n_ages) == last[:, None]
+    has_rows = last >= 0
+
+    if name == "lx":
+        l_next = np.concatenate([values[:, 1:], np.full((len(values), 1), np.nan)], axis=1)
+        q = 1 - l_next / values
+    elif name == "mx":
+        q = widths * values / (1 + (widths - a) * values)
+    else:
+        q = values.copy()
+    q = np.where(is_last, 1.0, np.clip(q, 0.0, 1.0))
+    q[~valid] = np.nan
+
+    # l(x): survivors out of the radix, a running product of survival
+    survival = np.where(valid, 1 - q, 1.0)
+    lx_ = radix * np.concatenate(
+        [np.ones((len(q), 1)), np.cumprod(survival[:, :-1], axis=1)], axis=1
+    )
+    dx = lx_ * q
+    l_next = np.concatenate([lx_[:, 1:], np.zeros((len(q), 1))], axis=1)
+    Lx = widths * np.where(is_last, 0.0, l_next) + a * dx
+    if name == "mx":
+        with np.errstate(divide="ignore", invalid="ignore"):
+            open_Lx = np.where(values > 0, lx_ / values, a * lx_)
+        Lx = np.where(is_last, open_Lx, Lx)
+
+    # T(x): person-years from x on, a reversed running sum
+    Lx = np.where(valid, Lx, 0.0)
+    Tx = np.cumsum(Lx[:, ::-1], axis=1)[:, ::-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ex = np.where(lx_ > 0, Tx / lx_, np.nan)
+
+    pad = ~valid | ~has_rows[:, None]
+    columns = [np.where(pad, np.nan, c) for c in (q, lx_, dx, Lx, Tx, ex)]
+    return LifeTable(ages, *columns)
+
+
+def life_tables(
+    df: pd.DataFrame,
+    column: str,
+    kind: str = "qx",
+    age: str = "age",
+    by: list[str] | None = None,
+    radix: float = RADIX,
+) -> pd.DataFrame:
+    """Build life tables from a long DataFrame with one row per table and age.
+
+    Tables sharing the same ages are built together as one 2-D array, so the
+    work is a handful of array operations whatever the number of tables.
+
+    Args:
+        df: Mortality data.
+        column: Column holding the mortality values.
+        kind: What ``column`` holds: 'qx', 'mx' or 'lx'.
+        age: Column holding the start of each age interval.
+        by: Columns identifying a table; None if ``df`` holds one table.
+        radix: Survivors at the first age.
+
+    Returns:
+        DataFrame with the ``by`` columns, 'age' and the life table columns,
+        in table and age order.
+
+    Raises:
+        ValueError: If ``kind`` is unknown or a table repeats an age.
+    """
+    if kind not in ("qx", "mx", "lx"):
+        raise ValueError(f"Unknown mortality column kind: {kind}")
+    by = by or []
+    data = df[[*by, age, column]].dropna(subset=[age, column])
+    data = data.sort_values([*by, age], kind="stable")
+    if data.duplicated([*by, age]).any():
+        raise ValueError("Life tables repeat an age")
+    if data.empty:
+        return pd.DataFrame(columns=[*by, "age", *LIFE_TABLE_COLUMNS])
+    if not by:
+        table = life_table(data[age], radix=radix, **{kind: data[column].to_numpy()})
+        return table.to_frame()
+
+    # Group the tables by their age grid
+    table_id = data.groupby(by, sort=False, observed=True).ngroup().to_numpy()
+    starts = np.flatnonzero(np.diff(table_id, prepend=-1))
+    ages = data[age].to_numpy(dtype="float64")
+    grids = pd.Series(np.split(ages, starts[1:])).map(tuple)
+    keys = data[by].iloc[starts].reset_index(drop=True)
+    values = data[column].to_numpy(dtype="float64")
+
+    frames = []
+    for grid, tables in grids.groupby(grids, sort=False).groups.items():
+        tables = np.asarray(tables)
+        rows = starts[tables, None] + np.arange(len(grid))
+        table = life_table(grid, radix=radix, **{kind: values[rows]})
+        frame = table.to_frame(keys.iloc[tables].reset_index(drop=True))
+        frame["_order"] = np.repeat(tables, len(grid))
+        frames.append(frame)
+    result = pd.concat(frames, ignore_index=True)
+    result = result.sort_values(["_order", "age"], kind="stable")
+    return result.drop(columns="_order").reset_index(drop=True)
+
+
+class SurvivalCurves:
+    """Survival between ages, from the l(x) column of many life tables.
+
+    Between the ages of a table, survivors are interpolated log-linearly,
+    i.e. with a constant force of mortality within each age interval; past
+    the last age of a table the force of mortality is ``1 / e(x)``, which
+    keeps the table's life expectancy. Every query is one binary search over
+    combined (table, age) keys and a few gathers, whatever the number of
+    tables.
+    """
+
+    def __init__(
+        self,
+        table_codes: npt.NDArray[np.integer[Any]],
+        ages: npt.ArrayLike,
+        lx: npt.ArrayLike,
+        ex: npt.ArrayLike,
+    ):
+        """Precompute log survivors and the force of mortality of every row.
+
+        Args:
+            table_codes: Table code per row, non-decreasing.
+            ages: Start of each row's age interval, increasing within a table.
+            lx: Survivors at each age; NaN where unknown.
+            ex: Life expectancy at each age.
+        """
+        self.table_codes = np.asarray(table_codes, dtype=np.intp)
+        self.ages = np.asarray(ages, dtype="float64")
+        self.ex = np.asarray(ex, dtype="float64")
+        self.keys = _combined_key(self.table_codes, self.ages)
+        with np.errstate(divide="ignore"):
+            self.log_lx = np.log(np.asarray(lx, dtype="float64"))
+
+        # Force of mortality within each interval; the open one uses e(x)
+        is_last = np.append(self.table_codes[1:] != self.table_codes[:-1], True)
+        next_log_lx = np.append(self.log_lx[1:], np.nan)
+        widths = np.append(np.diff(self.ages), np.nan)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.hazard = np.where(is_last, 1 / self.ex, (self.log_lx - next_log_lx) / widths).clip(
+                min=0
+            )
+
+    def locate(
+        self, tables: npt.NDArray[np.integer[Any]], ages: npt.NDArray[np.floating[Any]]
+    ) -> npt.NDArray[np.intp]:
+        """Find the row of each table whose age interval contains the age.
+
+        Args:
+            tables: Table code per query, -1 for none.
+            ages: Query ages; NaN means no row.
+
+        Returns:
+            Row position per query, -1 where the table does not cover the age.
+        """
+        tables = np.asarray(tables, dtype=np.intp)
+        ages = np.asarray(ages, dtype="float64")
+        if len(self.keys) == 0:
+            return np.full(len(tables), -1, dtype=np.intp)
+        rows = np.searchsorted(self.keys, _combined_key(tables, ages), side="right") - 1
+        rows = np.maximum(rows, 0)
+        found = (tables >= 0) & (self.table_codes[rows] == tables) & (ages >= self.ages[rows])
+        return np.where(found & np.isfinite(ages), rows, -1)
+
+    def _log_survivors(
+        self, rows: npt.NDArray[np.intp], ages: npt.NDArray[np.float64]
+    ) -> npt.NDArray[np.float64]:
+        """Log survivors at each age within its row's interval."""
+        safe = np.maximum(rows, 0)
+        elapsed = ages - self.ages[safe]
+        # Zero elapsed time counts nothing, even at an infinite force of mortality
+        with np.errstate(invalid="ignore"):
+            decline = np.where(elapsed > 0, self.hazard[safe] * elapsed, 0.0)
+        return np.where(rows >= 0, self.log_lx[safe] - decline, np.nan)
+
+    def survival(
+        self,
+        tables: npt.NDArray[np.integer[Any]],
+        from_ages: npt.ArrayLike,
+        to_ages: npt.ArrayLike,
+    ) -> npt.NDArray[np.float64]:
+        """Probability of surviving from one age to another.
+
+        Args:
+            tables: Table code per query, -1 for none.
+            from_ages: Age alive at.
+            to_ages: Age to survive to; not below ``from_ages``.
+
+        Returns:
+            Probability per query; NaN where a table does not cover an age,
+            ``to_ages`` is below ``from_ages`` or no one survives to
+            ``from_ages`` in the table.
+        """
+        from_ages = np.asarray(from_ages, dtype="float64")
+        to_ages = np.asarray(to_ages, dtype="float64")
+        log_from = self._log_survivors(self.locate(tables, from_ages), from_ages)
+        log_to = self._log_survivors(self.locate(tables, to_ages), to_ages)
+        with np.errstate(invalid="ignore"):
+            p = np.exp(log_to - log_from)
+        return np.where(np.isfinite(log_from) & (to_ages >= from_ages), p, np.nan)
+
+    def expected_age_at_death(
+        self, tables: npt.NDArray[np.integer[Any]], ages: npt.ArrayLike
+    ) -> npt.NDArray[np.float64]:
+        """Expected age at death of those alive at an age.
+
+        At the start of an interval this is ``x + e(x)``; within it, the
+        person-years lived since ``x`` under the interval's constant force of
+        mortality are taken off the table's ``T(x)``.
+
+        Args:
+            tables: Table code per query, -1 for none.
+            ages: Age alive at.
+
+        Returns:
+            Expected age at death per query, NaN where the table does not
+            cover the age.
+        """
+        ages = np.asarray(ages, dtype="float64")
+        rows = self.locate(tables, ages)
+        safe = np.maximum(rows, 0)
+        elapsed = ages - self.ages[safe]
+        hazard = self.hazard[safe]
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            # Survivors to `ages` (p) and years lived since x, per survivor at x
+            p = np.exp(-hazard * elapsed)
+            lived = np.where(hazard > 0, -np.expm1(-hazard * elapsed) / hazard, elapsed)
+            remaining = np.where(elapsed > 0, (self.ex[safe] - lived) / p, self.ex[safe])
+        return np.where(rows >= 0, ages + remaining, np.nan)
+
+
+# Age weights of the Global Burden of Disease study: C * x * exp(-BETA * x)
+AGE_WEIGHT_C = 0.1658
+AGE_WEIGHT_BETA = 0.04
+
+
+def _age_weights(ages: npt.ArrayLike, age_weighting: float) -> FloatArray:
+    ages = np.asarray(ages, dtype="float64")
+    return age_weighting * AGE_WEIGHT_C * ages * np.exp(-AGE_WEIGHT_BETA * ages) + (
+        1 - age_weighting
+    )
+
+
+def discounted_years(
+    ages: npt.ArrayLike,
+    expectancy: npt.ArrayLike,
+    discount_rate: float = 0.0,
+    age_weighting: float = 0.0,
+) -> FloatArray:
+    """Discounted, age-weighted years of life lost, in closed form.
+
+    The Global Burden of Disease formula: each of the ``expectancy`` years
+    lived after ``ages`` counts its age weight, discounted continuously to
+    the age at death. It treats the remaining life expectancy as certain;
+    :func:`discounted_life_expectancy` integrates over survival instead.
+
+    Args:
+        ages: Age at death.
+        expectancy: Remaining life expectancy at that age.
+        discount_rate: Annual discount rate, e.g. 0.03.
+        age_weighting: Share of the age weights, from 0 (none) to 1 (the
+            GBD weights ``0.1658 x exp(-0.04 x)``).
+
+    Returns:
+        Years of life lost per death.
+    """
+    a = np.asarray(ages, dtype="float64")
+    length = np.asarray(expectancy, dtype="float64")
+    r = np.log1p(discount_rate)
+    unweighted = length if r == 0 else -np.expm1(-r * length) / r
+    if age_weighting == 0:
+        return unweighted
+    k = r + AGE_WEIGHT_BETA
+    end = k * (length + a)
+    weighted = (
+        AGE_WEIGHT_C
+        * np.exp(r * a)
+        / k**2
+        * (np.exp(-end) * (-end - 1) - np.exp(-k * a) * (-k * a - 1))
+    )
+    return age_weighting * weighted + (1 - age_weighting) * unweighted
+
+
+def discounted_life_expectancy(
+    table_codes: npt.NDArray[np.integer[Any]],
+    ages: npt.ArrayLike,
+    lx: npt.ArrayLike,
+    ex: npt.ArrayLike,
+    discount_rate: float = 0.0,
+    age_weighting: float = 0.0,
+) -> FloatArray:
+    """Discounted, age-weighted remaining life expectancy of every table row.
+
+    Person-years lived in each interval, ``L(y) = T(y) - T(y')`` with
+    ``T = e l``, are discounted to the age at the middle of the interval
+    and weighted by its age weight; per-table reversed cumulative sums of
+    those terms then give every row's value at once, so looking up a
+    record is a single gather. The open last interval is integrated at its
+    constant force of mortality ``1 / e``. Without discounting or weighting
+    this is ``e(x)`` itself.
+
+    Rows whose survivors are missing or zero fall back to
+    :func:`discounted_years`.
+
+    Args:
+        table_codes: Table code per row, non-decreasing.
+        ages: Start of each row's age interval, increasing within a table.
+        lx: Survivors at each age.
+        ex: Life expectancy at each age.
+        discount_rate: Annual discount rate, e.g. 0.03.
+        age_weighting: Share of the age weights, see :func:`discounted_years`.
+
+    Returns:
+        Value per row.
+    """
+    codes = np.asarray(table_codes, dtype=np.intp)
+    ages = np.asarray(ages, dtype="float64")
+    lx = np.asarray(lx, dtype="float64")
+    ex = np.asarray(ex, dtype="float64")
+    r = np.log1p(discount_rate)
+
+    is_last = np.append(codes[1:] != codes[:-1], True)
+    tx = ex * lx
+    next_tx = np.append(tx[1:], np.nan)
+    next_ages = np.append(ages[1:], np.nan)
+    person_years = np.where(is_last, tx, tx - next_tx)
+    # Open interval: survivors decline at 1 / e, discounted at r
+    midpoints = np.where(is_last, ages + ex / 2, (ages + next_ages) / 2)
+    discount = np.where(is_last, 1 / (1 + r * ex), np.exp(-r * (midpoints - ages)))
+    terms = np.exp(-r * ages) * discount * _age_weights(midpoints, age_weighting) * person_years
+
+    # Reversed cumulative sum within each table
+    reversed_sums = pd.Series(terms[::-1]).groupby(codes[::-1]).cumsum().to_numpy()[::-1]
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        values = np.exp(r * ages) * reversed_sums / lx
+    usable = (lx > 0) & np.isfinite(values)
+    return np.where(usable, values, discounted_years(ages, ex, discount_rate, age_weighting))
+
+
+def indexed_discounted_life_expectancy(
+    index: LifeTableIndex,
+    lx: str,
+    ex: str,
+    discount_rate: float = 0.0,
+    age_weighting: float = 0.0,
+) -> FloatArray:
+    """:func:`discounted_life_expectancy` of every row of an index's tables.
+
+    The values are computed once per pair of columns, rate and weighting
+    and cached on the index, so they are dropped with it when the data
+    change; repeated lookups with the same options only gather them.
+
+    Args:
+        index: Index whose :attr:`~lost_years.matching.LifeTableIndex.table`
+            holds the life tables.
+        lx: Column of survivors at each age.
+        ex: Column of life expectancy at each age.
+        discount_rate: Annual discount rate, e.g. 0.03.
+        age_weighting: Share of the age weights, see :func:`discounted_years`.
+
+    Returns:
+        Value per row of the index's table.
+    """
+    key = (lx, ex, float(discount_rate), float(age_weighting))
+    if key not in index._discounted:
+        index._discounted[key] = discounted_life_expectancy(
+            index.table_codes,
+            index.table["age"],
+            index.table[lx],
+            index.table[ex],
+            discount_rate,
+            age_weighting,
+        )
+    return index._discounted[key]
@@ -0,0 +1,637 @@
+"""Vectorized matching helpers for life table lookups.
+
+The per-source lookups (SSA, WHO, HLD) resolve whole DataFrames at once by
+mapping every input row to a row position in a sorted reference table. The
+helpers here do the numeric part of that work with NumPy so that a batch of
+queries never falls back to a Python loop per row.
+"""
+
+from collections import OrderedDict
+from collections.abc import Iterator
+from typing import Any
+
+import numpy as np
+import numpy.typing as npt
+import pandas as pd
+
+# Match kinds reported by the diagnostic ``*_match_kind`` columns
+MATCH_EXACT = "exact"
+MATCH_NEAREST = "nearest"
+MATCH_FALLBACK = "fallback"
+MATCH_TOO_DISTANT = "too_distant"
+MATCH_NONE = "none"
+MATCH_KINDS = (MATCH_EXACT, MATCH_NEAREST, MATCH_FALLBACK, MATCH_TOO_DISTANT, MATCH_NONE)
+# Years before the last one of a group that projection trends are fitted over
+TREND_WINDOW = 10
+# Pairs of matching weights whose age/year grids an index keeps, least recently used evicted
+GRID_WEIGHTINGS = 4
+
+
+def _running_argmin(x: npt.NDArray[np.float64]) -> tuple[npt.NDArray, npt.NDArray]:
+    """Running minimum along the last axis together with the position it came from."""
+    run = np.minimum.accumulate(x, axis=-1)
+    prev = np.concatenate([np.full(x.shape[:-1] + (1,), np.inf), run[..., :-1]], axis=-1)
+    pos = np.arange(x.shape[-1])
+    arg = np.maximum.accumulate(np.where(x < prev, pos, 0), axis=-1)
+    return run, arg
+
+
+def _distance_transform(
+    cost: npt.NDArray[np.float64], weight: float
+) -> tuple[npt.NDArray[np.float64], npt.NDArray[np.intp]]:
+    """Weighted 1-D L1 distance transform along the last axis.
+
+    For every cell ``j`` finds ``min_k cost[k] + weight * |j - k|`` and the
+    ``k`` attaining it, using two running-minimum passes instead of a loop.
+    """
+    n = cost.shape[-1]
+    pos = np.arange(n)
+
+    fwd, fwd_arg = _running_argmin(cost - weight * pos)
+    fwd = fwd + weight * pos
+
+    bwd, bwd_arg = _running_argmin(cost[..., ::-1] - weight * pos)
+    bwd = (bwd + weight * pos)[..., ::-1]
+    bwd_arg = (n - 1 - bwd_arg)[..., ::-1]
+
+    take_bwd = bwd < fwd
+    return np.where(take_bwd, bwd, fwd), np.where(take_bwd, bwd_arg, fwd_arg)
+
+
+class AgeYearGrid:
+    """Joint nearest (age, year) matcher for the life tables of one group.
+
+    Matching age first and year second fixes the age before the year is looked
+    at, so sparse coverage can send a query to a distant year when a slightly
+    different age had a much closer table. This index instead minimises the
+    weighted distance ``age_weight * |age - a| + year_weight * |year - y|`` over
+    all (a, y) points of the group.
+
+    At build time the nearest point is precomputed for every integer cell of the
+    group's bounding box with a separable distance transform, so a batch query
+    costs one rounding, one clip and one gather per row. Clipping to the box is
+    exact because the distance is additive per axis.
+
+    Attributes:
+        age_min: Smallest age covered by the grid.
+        year_min: Smallest year covered by the grid.
+        grid: Array of shape (years, ages) holding, for every cell, the position
+            of the nearest point in the arrays passed to the constructor.
+    """
+
+    def __init__(
+        self,
+        ages: npt.NDArray[Any],
+        years: npt.NDArray[Any],
+        age_weight: float = 1.0,
+        year_weight: float = 1.0,
+    ):
+        """Build the grid from the (age, year) points of one group.
+
+        Args:
+            ages: Integer-valued ages of the points.
+            years: Integer-valued years of the points.
+            age_weight: Cost of one year of age difference.
+            year_weight: Cost of one calendar year of difference.
+
+        Raises:
+            ValueError: If no points are given or a weight is not positive.
+        """
+        if len(ages) == 0:
+            raise ValueError("AgeYearGrid needs at least one point")
+        if age_weight <= 0 or year_weight <= 0:
+            raise ValueError("Matching weights must be positive")
+
+        ages = np.rint(np.asarray(ages, dtype="float64")).astype(np.int64)
+        years = np.rint(np.asarray(years, dtype="float64")).astype(np.int64)
+        self.age_min = int(ages.min())
+        self.year_min = int(years.min())
+        n_ages = int(ages.max()) - self.age_min + 1
+        n_years = int(years.max()) - self.year_min + 1
+
+        # First point wins on duplicate cells, so earlier rows are preferred
+        points = np.full((n_years, n_ages), -1, dtype=np.intp)
+        order = np.arange(len(ages))[::-1]
+        points[years[order] - self.year_min, ages[order] - self.age_min] = order
+
+        occupied = np.where(points >= 0, 0.0, np.inf)
+        age_cost, age_arg = _distance_transform(occupied, age_weight)
+        _, year_arg = _distance_transform(age_cost.T, year_weight)
+        year_arg = year_arg.T
+
+        cols = np.arange(n_ages)
+        self.grid = points[year_arg, age_arg[year_arg, cols]]
+
+    def query(self, ages: npt.NDArray[Any], years: npt.NDArray[Any]) -> npt.NDArray[np.intp]:
+        """Find the nearest point for each (age, year) query.
+
+        Args:
+            ages: Query ages (must be finite).
+            years: Query years (must be finite).
+
+        Returns:
+            Positions into the point arrays given to the constructor.
+        """
+        n_years, n_ages = self.grid.shape
+        a = np.clip(np.rint(ages).astype(np.int64) - self.age_min, 0, n_ages - 1)
+        y = np.clip(np.rint(years).astype(np.int64) - self.year_min, 0, n_years - 1)
+        return self.grid[y, a]
+
+
+def iter_groups(codes: npt.NDArray[np.integer[Any]]) -> Iterator[tuple[int, npt.NDArray[np.intp]]]:
+    """Split query positions by group code.
+
+    Args:
+        codes: Group code per query row; negative codes are skipped.
+
+    Yields:
+        Tuples of (group code, positions of the rows in that group).
+    """
+    order = np.argsort(codes, kind="stable")
+    bounds = np.flatnonzero(np.diff(codes[order])) + 1
+    for positions in np.split(order, bounds):
+        if len(positions) and codes[positions[0]] >= 0:
+            yield int(codes[positions[0]]), positions
+
+
+# Scale of the combined (code, value) keys used to binary search many groups
+# at once; values are clipped into [0, _KEY_SCALE) so groups never overlap
+_KEY_SCALE = 100_000.0
+
+
+def _combined_key(codes: npt.NDArray[Any], values: npt.NDArray[Any]) -> npt.NDArray[np.float64]:
+    """Build keys that sort by code first and by value within a code."""
+    return codes * _KEY_SCALE + np.clip(values, 0.0, _KEY_SCALE - 1)
+
+
+class SpanIndex:
+    """Containment lookup over life tables that cover year spans and age intervals.
+
+    Each life table covers the years ``[year_start, year_end)`` and each of its
+    rows the ages ``[age_start, age_end)``. Overlapping year spans of a group
+    are flattened into disjoint segments, each assigned the narrowest table
+    covering it (ties go to the later start, then the earlier table). A batch
+    query is then two binary searches over combined (group, year) and
+    (table, age) keys for all rows at once.
+    """
+
+    def __init__(
+        self,
+        group_codes: npt.NDArray[np.intp],
+        table_codes: npt.NDArray[np.intp],
+        year_starts: npt.NDArray[np.floating[Any]],
+        year_ends: npt.NDArray[np.floating[Any]],
+        age_starts: npt.NDArray[np.floating[Any]],
+        age_ends: npt.NDArray[np.floating[Any]],
+    ):
+        """Build the segment and interval arrays.
+
+        Args:
+            group_codes: Group code per row, non-decreasing.
+            table_codes: Table code per row, non-decreasing and nested in groups.
+            year_starts: First year covered by the row's table.
+            year_ends: Exclusive end of the year span of the row's table.
+            age_starts: Lower age limit of the row, increasing within a table.
+            age_ends: Exclusive upper age limit of the row (inf if open).
+        """
+        n_tables = int(table_codes[-1]) + 1 if len(table_codes) else 0
+        first = np.searchsorted(table_codes, np.arange(n_tables))
+        t_group = group_codes[first]
+        t_start = year_starts[first]
+        t_end = year_ends[first]
+
+        # Segment boundaries: every span start and end of the group
+        start_keys = _combined_key(t_group, t_start)
+        end_keys = _combined_key(t_group, t_end)
+        self.seg_keys = np.unique(np.concatenate([start_keys, end_keys]))
+        self.seg_group = np.floor(self.seg_keys / _KEY_SCALE).astype(np.intp)
+
+        # Expand (table, segment) pairs for every segment a table covers
+        lo = np.searchsorted(self.seg_keys, start_keys)
+        counts = np.searchsorted(self.seg_keys, end_keys) - lo
+        pair_table = np.repeat(np.arange(n_tables), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        pair_seg = np.repeat(lo, counts) + offsets
+
+        # Narrowest span first, then latest start, then earliest table
+        width = (t_end - t_start)[pair_table]
+        order = np.lexsort((pair_table, -t_start[pair_table], width, pair_seg))
+        segs, first_pair = np.unique(pair_seg[order], return_index=True)
+        self.seg_table = np.full(len(self.seg_keys), -1, dtype=np.intp)
+        self.seg_table[segs] = pair_table[order][first_pair]
+
+        self.row_keys = _combined_key(table_codes, age_starts)
+        self.row_table = table_codes
+        self.age_ends = age_ends
+
+    def query(
+        self,
+        group_ids: npt.NDArray[np.intp],
+        ages: npt.NDArray[np.floating[Any]],
+        years: npt.NDArray[np.floating[Any]],
+    ) -> npt.NDArray[np.intp]:
+        """Find the row whose year span and age interval contain each query.
+
+        Args:
+            group_ids: Group code per query, -1 for none.
+            ages: Query ages.
+            years: Query years.
+
+        Returns:
+            Row position per query, -1 where no table contains the query.
+        """
+        if len(self.seg_keys) == 0:
+            return np.full(len(group_ids), -1, dtype=np.intp)
+
+        seg = np.searchsorted(self.seg_keys, _combined_key(group_ids, years), side="right") - 1
+        seg = np.maximum(seg, 0)
+        tables = np.where(self.seg_group[seg] == group_ids, self.seg_table[seg], -1)
+
+        rows = np.searchsorted(self.row_keys, _combined_key(tables, ages), side="right") - 1
+        rows = np.maximum(rows, 0)
+        found = (
+            (group_ids >= 0)
+            & (tables >= 0)
+            & (self.row_table[rows] == tables)
+            & (ages < self.age_ends[rows])
+            & np.isfinite(years)
+        )
+        return np.where(found, rows, -1)
+
+
+def _group_keys(parts: list[pd.Series]) -> pd.Series:
+    """Join several key columns into one string key per row."""
+    if not parts:
+        raise ValueError("At least one key column is required")
+    key = parts[0].astype(str)
+    for part in parts[1:]:
+        key = key + "|" + part.astype(str)
+    return key
+
+
+class LifeTableIndex:
+    """Batch lookup index over a life table with ``age`` and ``year`` columns.
+
+    The table is sorted so that every group (e.g. country and sex) is a
+    contiguous block. Lookups resolve the group of each query row with one
+    hash join and then run a joint nearest (age, year) search per group with
+    :class:`AgeYearGrid`; grids are built on first use and cached per weights.
+
+    If the table also has ``year_end`` and ``age_end`` columns (exclusive ends
+    of the year span and age interval of each row), queries are first
+    resolved to the row whose intervals contain them through a
+    :class:`SpanIndex`, and only the misses fall back to nearest matching.
+
+    Attributes:
+        table: The sorted reference table; positions returned by
+            :meth:`lookup` refer to its rows.
+        group_cols: Columns that define a group.
+        table_cols: Columns that, with ``year``, identify a table in a group.
+        table_codes: Life table code per row of :attr:`table`, non-decreasing.
+        group_codes: Group code per row of :attr:`table`, non-decreasing.
+    """
+
+    def __init__(
+        self, table: pd.DataFrame, group_cols: list[str], table_cols: list[str] | None = None
+    ):
+        """Sort and group the reference table.
+
+        Args:
+            table: Reference table with numeric ``age`` and ``year`` columns.
+            group_cols: Columns identifying a group; empty for a single group.
+            table_cols: Extra columns identifying a life table within a group
+                and start year; rows of one table must have increasing ages.
+        """
+        self.group_cols = group_cols
+        self.table_cols = table_cols or []
+
+        # Stable sort keeps file order among duplicate (year, age) rows
+        table = table.sort_values([*group_cols, "year", *self.table_cols, "age"], kind="stable")
+        self.table = table.reset_index(drop=True)
+
+        if group_cols:
+            codes, keys = pd.factorize(_group_keys([self.table[c] for c in group_cols]))
+        else:
+            codes, keys = np.zeros(len(self.table), dtype=np.intp), [""]
+        self.group_keys = pd.Index(keys)
+        self.group_starts = np.searchsorted(codes, np.arange(len(keys) + 1))
+        self.group_codes = codes
+        self._grids: OrderedDict[tuple[float, float], dict[int, AgeYearGrid]] = OrderedDict()
+        self._trends: dict[tuple[str, int], npt.NDArray[np.float64]] = {}
+        # Discounted life expectancy per row, see lifetable.indexed_discounted_life_expectancy
+        self._discounted: dict[tuple[str, str, float, float], npt.NDArray[np.float64]] = {}
+
+        # Life tables: rows of one group, start year and table columns
+        boundary = np.diff(codes, prepend=-1) != 0
+        for col in ["year", *self.table_cols]:
+            boundary |= self.table[col].ne(self.table[col].shift()).to_numpy()
+        self.table_codes = np.cumsum(boundary) - 1
+
+        self._spans: SpanIndex | None = None
+        if {"year_end", "age_end"} <= set(self.table.columns):
+            self._spans = SpanIndex(
+                codes,
+                self.table_codes,
+                self.table["year"].to_numpy(dtype="float64"),
+                self.table["year_end"].to_numpy(dtype="float64"),
+                self.table["age"].to_numpy(dtype="float64"),
+                self.table["age_end"].to_numpy(dtype="float64"),
+            )
+
+    def group_ids(self, parts: list[pd.Series]) -> npt.NDArray[np.intp]:
+        """Resolve query key columns to group ids.
+
+        Args:
+            parts: Query columns, in the same order as ``group_cols``.
+
+        Returns:
+            Group id per query row, -1 where the group does not exist.
+        """
+        return self.group_keys.get_indexer(_group_keys(parts))
+
+    def lookup(
+        self,
+        group_ids: npt.NDArray[np.intp],
+        ages: npt.NDArray[np.floating[Any]],
+        years: npt.NDArray[np.floating[Any]],
+        age_weight: float = 1.0,
+        year_weight: float = 1.0,
+    ) -> npt.NDArray[np.intp]:
+        """Find the containing, or else the nearest, table row for every query.
+
+        Args:
+            group_ids: Group id per query row (see :meth:`group_ids`).
+            ages: Query ages; NaN means no match.
+            years: Query years; NaN means no match.
+            age_weight: Cost of one year of age difference.
+            year_weight: Cost of one calendar year of difference.
+
+        Returns:
+            Row position in :attr:`table` per query, -1 where nothing matched.
+        """
+        group_ids = np.where(np.isfinite(ages) & np.isfinite(years), group_ids, -1)
+        rows = np.full(len(group_ids), -1, dtype=np.intp)
+        if self._spans is not None:
+            rows = self._spans.query(group_ids, ages, years)
+            group_ids = np.where(rows < 0, group_ids, -1)
+        for gid, pos in iter_groups(group_ids):
+            grid = self._grid(gid, age_weight, year_weight)
+            rows[pos] = self.group_starts[gid] + grid.query(ages[pos], years[pos])
+        return rows
+
+    def interpolate(
+        self,
+        column: str | npt.NDArray[np.floating[Any]],
+        rows: npt.NDArray[np.intp],
+        ages: npt.NDArray[np.floating[Any]],
+    ) -> npt.NDArray[np.float64]:
+        """Interpolate a column linearly between the ages of the matched tables.
+
+        The value at the row starting at or before the requested age is moved
+        towards the next row of the same life table by the age's share of the
+        distance between their ages. Ages before a table's first row or in its
+        last, open-ended row keep that row's value.
+
+        Args:
+            column: Numeric column of :attr:`table`, e.g. life expectancy, or
+                an array of values per row of :attr:`table`.
+            rows: Row position per query (see :meth:`lookup`).
+            ages: Query ages.
+
+        Returns:
+            Interpolated value per query, NaN where ``rows`` is -1.
+        """
+        values = (
+            self.table[column].to_numpy(dtype="float64")
+            if isinstance(column, str)
+            else np.asarray(column, dtype="float64")
+        )
+        table_ages = self.table["age"].to_numpy(dtype="float64")
+        if len(values) == 0:
+            return np.full(len(rows), np.nan)
+        safe = np.maximum(rows, 0)
+        # Nearest matching may pick the row after the age; start from the one before
+        previous = np.maximum(safe - 1, 0)
+        step_back = (
+            (ages < table_ages[safe])
+            & (previous != safe)
+            & (self.table_codes[previous] == self.table_codes[safe])
+        )
+        safe = np.where(step_back, previous, safe)
+        following = np.minimum(safe + 1, len(values) - 1)
+        has_next = (following != safe) & (self.table_codes[following] == self.table_codes[safe])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            share = (ages - table_ages[safe]) / (table_ages[following] - table_ages[safe])
+        share = np.where(has_next, np.clip(np.nan_to_num(share), 0.0, 1.0), 0.0)
+        interpolated = values[safe] + share * (values[following] - values[safe])
+        return np.where(rows >= 0, interpolated, np.nan)
+
+    def trend_factors(
+        self,
+        column: str | npt.NDArray[np.floating[Any]],
+        rows: npt.NDArray[np.intp],
+        years: npt.NDArray[np.floating[Any]],
+        window: int = TREND_WINDOW,
+    ) -> npt.NDArray[np.float64]:
+        """Factors projecting matched values to years after their group's data.
+
+        Matching snaps a year after the last one of its group to the last
+        table. Instead, the value can follow the trend of its series: the
+        rows of the group with the same age from ``window`` years before the
+        group's last year on. The trend is log-linear, a constant yearly rate of change
+        fitted by least squares to the logarithm of the values; it is fitted
+        once per column and window, for all series at once, and cached.
+
+        Args:
+            column: Positive numeric column of :attr:`table`, e.g. life
+                expectancy, or an array of values per row (not cached).
+            rows: Row position per query (see :meth:`lookup`).
+            years: Query years.
+            window: Years before each group's last year the trend is fitted over.
+
+        Returns:
+            Per query, ``exp(rate x years after the matched row)`` if the
+            year is after the last year of its group, else 1.
+        """
+        last_years = self._last_years()
+        key = (column, window) if isinstance(column, str) else None
+        if key is not None and key in self._trends:
+            rates = self._trends[key]
+        else:
+            values = (
+                self.table[column].to_numpy(dtype="float64")
+                if isinstance(column, str)
+                else np.asarray(column, dtype="float64")
+            )
+            rates = self._fit_trends(values, last_years, window)
+            if key is not None:
+                self._trends[key] = rates
+        if len(rates) == 0:
+            return np.ones(len(rows))
+
+        safe = np.maximum(rows, 0)
+        group_last = np.maximum.reduceat(last_years, self.group_starts[:-1])
+        after = (rows >= 0) & (years > group_last[self.group_codes[safe]])
+        with np.errstate(invalid="ignore"):
+            return np.where(after, np.exp(rates[safe] * (years - last_years[safe])), 1.0)
+
+    def _last_years(self) -> npt.NDArray[np.float64]:
+        """Last calendar year covered by each row of :attr:`table`."""
+        years = self.table["year"].to_numpy(dtype="float64")
+        if "year_end" in self.table.columns:
+            return np.maximum(self.table["year_end"].to_numpy(dtype="float64") - 1, years)
+        return years
+
+    def _fit_trends(
+        self, values: npt.NDArray[np.float64], last_years: npt.NDArray[np.float64], window: int
+    ) -> npt.NDArray[np.float64]:
+        """Yearly log-linear rate of each row's (group, age) series; 0 if flat or unknown."""
+        if len(values) == 0:
+            return np.zeros(0)
+        group_last = np.maximum.reduceat(last_years, self.group_starts[:-1])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            log_values = np.log(values)
+        points = pd.DataFrame(
+            {
+                "group": self.group_codes,
+                "age": self.table["age"].to_numpy(dtype="float64"),
+                # Middle of the year span of the row
+                "x": (self.table["year"].to_numpy(dtype="float64") + last_years) / 2,
+                "y": log_values,
+            }
+        )
+        recent = points[
+            (last_years >= group_last[self.group_codes] - window) & np.isfinite(log_values)
+        ]
+        series = recent.groupby(["group", "age"])
+        dx = recent["x"] - series["x"].transform("mean")
+        dy = recent["y"] - series["y"].transform("mean")
+        products = pd.DataFrame({"xy": dx * dy, "xx": dx * dx})
+        sums = products.groupby([recent["group"], recent["age"]]).sum()
+        if sums.empty:
+            return np.zeros(len(values))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            slopes = np.where(sums["xx"] > 0, sums["xy"] / sums["xx"], 0.0)
+        positions = sums.index.get_indexer(pd.MultiIndex.from_frame(points[["group", "age"]]))
+        return np.where(positions >= 0, slopes[np.maximum(positions, 0)], 0.0)
+
+    def _grid(self, gid: int, age_weight: float, year_weight: float) -> AgeYearGrid:
+        """Get (building on first use) the joint age/year grid of one group.
+
+        Grids are kept for the :data:`GRID_WEIGHTINGS` most recently used
+        pairs of weights, so callers varying the weights do not keep a grid
+        per group and pair alive.
+        """
+        weights = (age_weight, year_weight)
+        if weights in self._grids:
+            self._grids.move_to_end(weights)
+        else:
+            self._grids[weights] = {}
+            if len(self._grids) > GRID_WEIGHTINGS:
+                self._grids.popitem(last=False)
+        grids = self._grids[weights]
+        if gid not in grids:
+            block = self.table.iloc[self.group_starts[gid] : self.group_starts[gid + 1]]
+            grids[gid] = AgeYearGrid(
+                block["age"].to_numpy(), block["year"].to_numpy(), age_weight, year_weight
+            )
+        return grids[gid]
+
+
+def _interval_gap(
+    values: npt.NDArray[np.floating[Any]],
+    starts: npt.NDArray[np.floating[Any]],
+    ends: npt.NDArray[np.floating[Any]],
+) -> npt.NDArray[np.float64]:
+    """Signed distance from each value to the interval ``[start, end)``."""
+    with np.errstate(invalid="ignore"):
+        return np.where(
+            values < starts, starts - values, np.where(values >= ends, ends - 1 - values, 0.0)
+        )
+
+
+def match_quality(
+    prefix: str,
+    ages: npt.NDArray[np.floating[Any]],
+    years: npt.NDArray[np.floating[Any]],
+    matched_ages: npt.NDArray[np.floating[Any]],
+    matched_years: npt.NDArray[np.floating[Any]],
+    matched: npt.NDArray[np.bool_],
+    fallback: npt.NDArray[np.bool_] | None = None,
+    max_year_gap: float | None = None,
+    matched_age_ends: npt.NDArray[np.floating[Any]] | None = None,
+    matched_year_ends: npt.NDArray[np.floating[Any]] | None = None,
+) -> tuple[dict[str, npt.NDArray[Any]], npt.NDArray[np.bool_]]:
+    """Compute match diagnostics and apply the year gap threshold.
+
+    Gaps are signed (matched minus requested) and measured to the matched
+    row's age interval and year span, so a request inside them has no gap.
+    Rows without explicit ends cover one year of age and one calendar year.
+    The match kind is one of
+    ``MATCH_KINDS``: an exact hit, a nearest-value match, a match that needed
+    a fallback on the group key, a match dropped for exceeding
+    ``max_year_gap``, or no match at all.
+
+    Args:
+        prefix: Output column prefix, e.g. ``"ssa"``.
+        ages: Requested ages.
+        years: Requested years.
+        matched_ages: Ages of the matched rows (ignored where not matched).
+        matched_years: Years of the matched rows (ignored where not matched).
+        matched: Whether a row was matched.
+        fallback: Whether a fallback was used to find the group of a row.
+        max_year_gap: Largest accepted absolute year gap; None for no limit.
+        matched_age_ends: Exclusive upper age limits of the matched rows.
+        matched_year_ends: Exclusive ends of the matched rows' year spans.
+
+    Returns:
+        Tuple of (diagnostic columns by name, mask of matches to keep).
+    """
+    if matched_age_ends is None:
+        matched_age_ends = matched_ages + 1
+    if matched_year_ends is None:
+        matched_year_ends = matched_years + 1
+    age_gap = np.where(matched, _interval_gap(ages, matched_ages, matched_age_ends), np.nan)
+    year_gap = np.where(matched, _interval_gap(years, matched_years, matched_year_ends), np.nan)
+
+    keep = matched.copy()
+    if max_year_gap is not None:
+        keep &= np.abs(year_gap) <= max_year_gap
+
+    kind = np.where((age_gap == 0) & (year_gap == 0), MATCH_EXACT, MATCH_NEAREST)
+    if fallback is not None:
+        kind = np.where(fallback, MATCH_FALLBACK, kind)
+    kind = np.where(matched & ~keep, MATCH_TOO_DISTANT, kind)
+    kind = np.where(matched, kind, MATCH_NONE)
+
+    columns = {
+        f"{prefix}_age_gap": age_gap,
+        f"{prefix}_year_gap": year_gap,
+        f"{prefix}_match_kind": kind.astype(object),
+    }
+    return columns, keep
+
+
+def gather(
+    column: pd.Series,
+    rows: npt.NDArray[np.intp],
+    keep: npt.NDArray[np.bool_],
+    index: pd.Index,
+    other: Any = np.nan,
+) -> pd.Series:
+    """Take reference table values for a batch of matched rows.
+
+    Args:
+        column: Reference table column.
+        rows: Row position per query (see :meth:`LifeTableIndex.lookup`).
+        keep: Which queries have a usable match.
+        index: Index of the input DataFrame the result is aligned to.
+        other: Value used where there is no match.
+
+    Returns:
+        Series aligned to ``index`` with the matched values.
+    """
+    if len(column) == 0:
+        return pd.Series(other, index=index)
+    values = pd.Series(column.to_numpy()[np.where(keep, rows, 0)], index=index)
+    return values.where(keep, other)
@@ -0,0 +1,32 @@
+"""Registry of the life table sources and their lookup functions."""
+
+import inspect
+from collections.abc import Callable
+from typing import Any
+
+import pandas as pd
+
+from .hld import lost_years_hld
+from .ssa import lost_years_ssa
+from .who import lost_years_who
+
+# Lookup function and query fields of each source
+SOURCES: dict[str, tuple[Callable[..., pd.DataFrame], list[str]]] = {
+    "ssa": (lost_years_ssa, ["age", "sex", "year"]),
+    "who": (lost_years_who, ["country", "age", "sex", "year"]),
+    "hld": (lost_years_hld, ["country", "age", "sex", "year"]),
+}
+
+
+def lookup_kwargs(source: str, kwargs: dict[str, Any]) -> dict[str, Any]:
+    """Keep the keyword arguments the source's lookup function accepts.
+
+    Args:
+        source: Key of :data:`SOURCES`.
+        kwargs: Keyword arguments meant for one or more sources.
+
+    Returns:
+        The subset of ``kwargs`` that are parameters of the lookup.
+    """
+    parameters = inspect.signature(SOURCES[source][0]).parameters
+    return {name: value for name, value in kwargs.items() if name in parameters}
@@ -5,22 +5,76 @@ import logging
 import sys
 from importlib.resources import files
 
+import numpy as np
 import pandas as pd
 
-from .utils import closest, column_exists, fixup_columns
+from .data.artifacts import check_artifact, fingerprint
+from .data.schemas import SSASchema, load_table
+from .lifetable import SurvivalCurves, indexed_discounted_life_expectancy
+from .matching import LifeTableIndex, gather, match_quality
+from .utils import (
+    CSV_ENGINES,
+    DATE_COLUMNS,
+    column_exists,
+    fixup_columns,
+    query_ages_years,
+    query_columns,
+    read_csv,
+)
 
 # Setup logger
 logger = logging.getLogger(__name__)
 
 SSA_DATA = files("lost_years") / "data" / "ssa" / "ssa.csv"
-SSA_COLS = ["age", "male_life_expectancy", "female_life_expectancy", "year"]
+SSA_COLS = SSASchema.LAYOUT.columns
 
 
 class LostYearsSSAData:
-    __df = None
+    __index: LifeTableIndex | None = None
+    __curves: dict[str, SurvivalCurves] = {}
+    __fingerprint: tuple[int, int] | None = None
 
     @classmethod
-    def lost_years_ssa(cls, df: pd.DataFrame, cols: dict[str, str] | None = None) -> pd.DataFrame:
+    def _load_index(cls, engine: str = "auto") -> LifeTableIndex:
+        """Get the lookup index, reloading it when the data file changed."""
+        current = fingerprint(str(SSA_DATA))
+        if cls.__index is None or cls.__fingerprint != current:
+            check_artifact("ssa", str(SSA_DATA))
+            cls.__index = LifeTableIndex(load_table("ssa", str(SSA_DATA), engine), [])
+            cls.__curves = {}
+            cls.__fingerprint = current
+        return cls.__index
+
+    @classmethod
+    def _survival_curves(cls, engine: str = "auto") -> dict[str, SurvivalCurves]:
+        """Get the survival curves of each sex, one table per year."""
+        table = cls._load_index(engine).table
+        if not cls.__curves:
+            codes = pd.factorize(table["year"])[0]
+            cls.__curves = {
+                sex: SurvivalCurves(
+                    codes,
+                    table["age"],
+                    table[f"{sex}_n_lives"],
+                    table[f"{sex}_life_expectancy"],
+                )
+                for sex in ["male", "female"]
+            }
+        return cls.__curves
+
+    @classmethod
+    def lost_years_ssa(
+        cls,
+        df: pd.DataFrame,
+        cols: dict[str, str] | None = None,
+        diagnostics: bool = False,
+        max_year_gap: float | None = None,
+        interpolate: bool | None = None,
+        discount_rate: float = 0.0,
+        age_weighting: float = 0.0,
+        project: bool = False,
+        engine: str = "auto",
+    ) -> pd.DataFrame:
         """Appends Life expectancycolumn from SSA data to the input DataFrame
         based on age, sex and year in the specific cols mapping
 
@@ -28,49 +82,177 @@ class LostYearsSSAData:
             df: Pandas DataFrame containing the input data.
             cols: Column mapping for age, sex, and year in DataFrame.
                 If None, uses default mapping: {'age': 'age', 'sex': 'sex', 'year': 'year'}
+                With 'birth_date' and 'event_date' mapped instead of 'age' and
+                'year', the exact age and decimal year at the event are used.
+            diagnostics: Also append 'ssa_age_gap', 'ssa_year_gap' and
+                'ssa_match_kind' columns describing how far the matched table
+                row is from the request.
+            max_year_gap: Drop matches whose year is further than this from
+                the requested year; None for no limit.
+            interpolate: Interpolate life expectancy linearly between the ages
+                of the matched table instead of taking the matched row's value;
+                None to interpolate when ages are derived from dates.
+            discount_rate: Annual rate at which future years of life are
+                discounted in the 'ssa_discounted_yll' column, e.g. 0.03.
+            age_weighting: Share of the GBD age weights in the
+                'ssa_discounted_yll' column, from 0 (none) to 1. The column
+                is only added when this or ``discount_rate`` is not zero.
+            project: Extrapolate life expectancy to years after the last one
+                of the data along its log-linear trend over the latest years,
+                instead of using the last year's value; see
+                :meth:`lost_years.matching.LifeTableIndex.trend_factors`.
+            engine: CSV parser for loading the reference data, one of
+                'auto', 'c', 'pyarrow' or 'python'; only used on first load.
 
         Returns:
             Pandas DataFrame with life expectancy columns:
-                'ssa_age', 'ssa_year', 'ssa_life_expectancy'
+                'ssa_age', 'ssa_year', 'ssa_life_expectancy' and optionally
+                'ssa_discounted_yll': the remaining years of life, discounted
+                and age weighted over the survivors of the matched table.
         """
-        df_cols = {}
-        for col in ["age", "sex", "year"]:
-            tcol = col if cols is None else cols[col]
-            if tcol not in df.columns:
-                logger.warning(f"No column `{tcol!s}` in the DataFrame")
-                return df
-            df_cols[col] = tcol
-
-        if cls.__df is None:
-            cls.__df = pd.read_csv(str(SSA_DATA), usecols=SSA_COLS)
-
-        out_list = []
-        index_list = []
-        for i, r in df.iterrows():
-            if r[df_cols["sex"]].lower() in ["m", "male"]:
-                ecol = "male_life_expectancy"
-            else:
-                ecol = "female_life_expectancy"
-            sdf = cls.__df[["age", "year", ecol]]
-            for c in ["age", "year"]:
-                sdf = sdf[sdf[c] == closest(sdf[c].unique(), r[df_cols[c]])]
-            if not sdf.empty:
-                odf = sdf[["age", "year", ecol]].copy()
-                odf.columns = ["ssa_age", "ssa_year", "ssa_life_expectancy"]
-                out_list.append(odf)
-                index_list.append(i)
-
-        if out_list:
-            out_df = pd.concat(out_list, ignore_index=True)
-            out_df["original_index"] = index_list
-            out_df.set_index("original_index", drop=True, inplace=True)
+        df_cols = query_columns(df, cols, ["age", "sex", "year"])
+        if df_cols is None:
+            return df
+
+        index = cls._load_index(engine)
+        table = index.table
+
+        ages, years = query_ages_years(df, df_cols)
+        rows = index.lookup(np.zeros(len(df), dtype=np.intp), ages, years)
+
+        matched = rows >= 0
+        safe_rows = np.where(matched, rows, 0)
+        quality, keep = match_quality(
+            "ssa",
+            ages,
+            years,
+            table["age"].to_numpy(dtype="float64")[safe_rows],
+            table["year"].to_numpy(dtype="float64")[safe_rows],
+            matched,
+            max_year_gap=max_year_gap,
+        )
+
+        is_male = df[df_cols["sex"]].astype(str).str.lower().isin(["m", "male"])
+        if interpolate is None:
+            interpolate = DATE_COLUMNS[0] in df_cols
+        kept = np.where(keep, rows, -1)
+        if interpolate:
+            male, female = (
+                pd.Series(index.interpolate(f"{sex}_life_expectancy", kept, ages), index=df.index)
+                for sex in ["male", "female"]
+            )
         else:
-            out_df = pd.DataFrame()
-        rdf = df.join(out_df)
-        return rdf
+            male = gather(table["male_life_expectancy"], rows, keep, df.index)
+            female = gather(table["female_life_expectancy"], rows, keep, df.index)
+        if project:
+            male = male * index.trend_factors("male_life_expectancy", kept, years)
+            female = female * index.trend_factors("female_life_expectancy", kept, years)
+
+        out = {
+            "ssa_age": gather(table["age"], rows, keep, df.index),
+            "ssa_year": gather(table["year"], rows, keep, df.index),
+            "ssa_life_expectancy": male.where(is_male, female),
+        }
+        if discount_rate or age_weighting:
+            adjusted = []
+            for sex in ["male", "female"]:
+                values = indexed_discounted_life_expectancy(
+                    index,
+                    f"{sex}_n_lives",
+                    f"{sex}_life_expectancy",
+                    discount_rate,
+                    age_weighting,
+                )
+                if interpolate:
+                    sex_adjusted = pd.Series(index.interpolate(values, kept, ages), df.index)
+                else:
+                    sex_adjusted = gather(pd.Series(values), rows, keep, df.index)
+                if project:
+                    sex_adjusted = sex_adjusted * index.trend_factors(values, kept, years)
+                adjusted.append(sex_adjusted)
+            out["ssa_discounted_yll"] = adjusted[0].where(is_male, adjusted[1])
+        if diagnostics:
+            out.update(quality)
+        return df.assign(**out)
+
+    @classmethod
+    def survival_ssa(
+        cls,
+        df: pd.DataFrame,
+        cols: dict[str, str] | None = None,
+        to_age: str | None = None,
+        max_year_gap: float | None = None,
+        engine: str = "auto",
+    ) -> pd.DataFrame:
+        """Appends survival probability and expected age at death from SSA data.
+
+        Each row is matched to the SSA table of the nearest year, as in
+        :meth:`lost_years_ssa`. Survival between ages comes from the table's
+        survivors column (``*_n_lives``), interpolated between ages with a
+        constant force of mortality, see :class:`lost_years.lifetable.SurvivalCurves`.
+
+        Args:
+            df: Pandas DataFrame containing the input data.
+            cols: Column mapping for age, sex, and year in DataFrame.
+                If None, uses default mapping: {'age': 'age', 'sex': 'sex', 'year': 'year'}
+                With 'birth_date' and 'event_date' mapped instead of 'age' and
+                'year', the exact age and decimal year at the event are used.
+            to_age: Column holding the age to survive to; None to only append
+                the expected age at death.
+            max_year_gap: Leave rows whose matched year is further than this
+                from the requested year empty; None for no limit.
+            engine: CSV parser for loading the reference data, one of
+                'auto', 'c', 'pyarrow' or 'python'; only used on first load.
+
+        Returns:
+            Pandas DataFrame with columns 'ssa_year',
+            'ssa_expected_age_at_death' and, with ``to_age``, 'ssa_survival':
+            the probability of surviving from age to ``to_age``.
+        """
+        df_cols = query_columns(df, cols, ["age", "sex", "year"])
+        if df_cols is None:
+            return df
+        if to_age is not None and to_age not in df.columns:
+            logger.warning(f"No column `{to_age!s}` in the DataFrame")
+            return df
+
+        index = cls._load_index(engine)
+        curves = cls._survival_curves(engine)
+        table = index.table
+
+        ages, years = query_ages_years(df, df_cols)
+        rows = index.lookup(np.zeros(len(df), dtype=np.intp), ages, years)
+        matched = rows >= 0
+        safe_rows = np.where(matched, rows, 0)
+        matched_years = table["year"].to_numpy(dtype="float64")[safe_rows]
+        _, keep = match_quality(
+            "ssa", ages, years, ages, matched_years, matched, max_year_gap=max_year_gap
+        )
+        tables = np.where(keep, curves["male"].table_codes[safe_rows], -1)
+
+        is_male = (
+            df[df_cols["sex"]].astype(str).str.lower().isin(["m", "male"]).to_numpy(dtype=bool)
+        )
+        out = {
+            "ssa_year": gather(table["year"], rows, keep, df.index),
+            "ssa_expected_age_at_death": np.where(
+                is_male,
+                curves["male"].expected_age_at_death(tables, ages),
+                curves["female"].expected_age_at_death(tables, ages),
+            ),
+        }
+        if to_age is not None:
+            to_ages = pd.to_numeric(df[to_age], errors="coerce").to_numpy(dtype="float64")
+            out["ssa_survival"] = np.where(
+                is_male,
+                curves["male"].survival(tables, ages, to_ages),
+                curves["female"].survival(tables, ages, to_ages),
+            )
+        return df.assign(**out)
 
 
 lost_years_ssa = LostYearsSSAData.lost_years_ssa
+survival_ssa = LostYearsSSAData.survival_ssa
 
 
 def main(argv: list[str] = sys.argv[1:]) -> int:
@@ -95,6 +277,44 @@ def main(argv: list[str] = sys.argv[1:]) -> int:
         default="year",
         help="Columns name of year in the input file(default=`year`)",
     )
+    parser.add_argument(
+        "--birth-date",
+        default=None,
+        help="Column name of date of birth; with --event-date, used instead of age and year",
+    )
+    parser.add_argument(
+        "--event-date",
+        default=None,
+        help="Column name of the date (e.g. of death) at which age and year are taken",
+    )
+    parser.add_argument(
+        "--interpolate",
+        action="store_true",
+        default=None,
+        help="Interpolate life expectancy between ages (default with date columns)",
+    )
+    parser.add_argument(
+        "--diagnostics",
+        action="store_true",
+        help="Append ssa_age_gap, ssa_year_gap and ssa_match_kind columns",
+    )
+    parser.add_argument(
+        "--project",
+        action="store_true",
+        help="Extrapolate life expectancy to years after the data along its recent trend",
+    )
+    parser.add_argument(
+        "--max-year-gap",
+        type=float,
+        default=None,
+        help="Drop matches further than this many years from the requested year",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=CSV_ENGINES,
+        default="auto",
+        help="CSV parser for the input and reference data (default=`auto`: pyarrow if installed)",
+    )
     parser.add_argument(
         "-o",
         "--output",
@@ -106,9 +326,17 @@ def main(argv: list[str] = sys.argv[1:]) -> int:
 
     logger.debug(args)
 
-    df = pd.read_csv(args.input)
+    df = read_csv(args.input, args.engine)
 
-    if not column_exists(df, args.age):
+    dates = {}
+    if args.birth_date and args.event_date:
+        dates = {"birth_date": args.birth_date, "event_date": args.event_date}
+        for col_arg in dates.values():
+            if not column_exists(df, col_arg):
+                logger.error(f"Column: `{col_arg!s}` not found in the input file")
+                return -1
+
+    if not dates and not column_exists(df, args.age):
         logger.error(f"Column: `{args.age!s}` not found in the input file")
         return -1
 
@@ -116,11 +344,19 @@ def main(argv: list[str] = sys.argv[1:]) -> int:
         logger.error(f"Column: `{args.sex!s}` not found in the input file")
         return -1
 
-    if not column_exists(df, args.year):
+    if not dates and not column_exists(df, args.year):
         logger.error(f"Column: `{args.year!s}` not found in the input file")
         return -1
 
-    rdf = lost_years_ssa(df, cols={"age": args.age, "sex": args.sex, "year": args.year})
+    rdf = lost_years_ssa(
+        df,
+        cols={"age": args.age, "sex": args.sex, "year": args.year, **dates},
+        diagnostics=args.diagnostics,
+        max_year_gap=args.max_year_gap,
+        project=args.project,
+        interpolate=args.interpolate,
+        engine=args.engine,
+    )
 
     logger.info(f"Saving output to file: `{args.output:s}`")
     rdf.columns = fixup_columns(rdf.columns)  # type: ignore[arg-type]
@@ -62,3 +62,28 @@ class LifeExpectancyResult:
     life_expectancy: float
     data_source: str
     source_country: str | None = None
+
+
+@dataclass(slots=True, frozen=True)
+class HLDTablePreference:
+    """Rules for choosing one HLD life table when several cover the same
+    country, sex and year span.
+
+    Rules are applied in the order listed; remaining ties go to the
+    lexicographically smallest source code, so the choice does not depend on
+    the order of rows in the data file.
+
+    Attributes:
+        total_population: Prefer tables for the whole population (Region,
+            Residence, Ethnicity and SocDem all 0) over sub-populations.
+        sources: Ref-ID prefixes in order of preference; other sources rank
+            after them.
+        type_order: TypeLT codes from most to least preferred (1 complete,
+            2 abridged from a complete table, 4 abridged from a published one).
+        latest_version: Prefer the highest Version of a table.
+    """
+
+    total_population: bool = True
+    sources: tuple[str, ...] = ()
+    type_order: tuple[int, ...] = (1, 2, 4)
+    latest_version: bool = True
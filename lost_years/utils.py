@@ -1,12 +1,20 @@
+import hashlib
+import importlib.util
+import io
+import json
 import logging
+import os
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import TYPE_CHECKING, Any
 
+import numpy as np
 import pandas as pd
 import requests
 
 if TYPE_CHECKING:
-    import numpy as np
     import numpy.typing as npt
 
 # Setup logger
@@ -73,7 +81,204 @@ def closest(lst: "list[float] | npt.NDArray[np.floating[Any]]", c: float) -> flo
     return working_list[min(range(len(working_list)), key=lambda i: abs(working_list[i] - c))]
 
 
-def download_file(url: str, local_path: str | Path | None = None) -> None:
+# Input columns from which exact ages and years are derived instead of 'age' and 'year'
+DATE_COLUMNS = ("birth_date", "event_date")
+
+
+def exact_age(birth: pd.Series, event: pd.Series) -> "npt.NDArray[np.float64]":
+    """Exact age in years, with the fraction of the year since the last birthday.
+
+    Someone born on 29 February has their birthday on 28 February in common
+    years.
+
+    Args:
+        birth: Dates of birth (anything `pd.to_datetime` parses).
+        event: Dates at which the age is taken.
+
+    Returns:
+        Fractional age per row; NaN where a date is missing or unparseable.
+    """
+    birth = pd.to_datetime(pd.Series(birth).reset_index(drop=True), errors="coerce")
+    event = pd.to_datetime(pd.Series(event).reset_index(drop=True), errors="coerce")
+    birth, event = birth.dt.normalize(), event.dt.normalize()
+    missing = (birth.isna() | event.isna()).to_numpy()
+    birth = birth.fillna(pd.Timestamp(2000, 1, 1))
+    event = event.fillna(pd.Timestamp(2000, 1, 1))
+
+    month, day = birth.dt.month.to_numpy(), birth.dt.day.to_numpy()
+    before_birthday = event.dt.month.to_numpy() * 100 + event.dt.day.to_numpy() < month * 100 + day
+    whole = event.dt.year.to_numpy() - birth.dt.year.to_numpy() - before_birthday
+
+    def birthday(years: "npt.NDArray[np.int64]") -> "npt.NDArray[np.datetime64]":
+        leap = (years % 4 == 0) & ((years % 100 != 0) | (years % 400 == 0))
+        days = np.where((month == 2) & (day == 29) & ~leap, 28, day)
+        return pd.to_datetime(pd.DataFrame({"year": years, "month": month, "day": days})).to_numpy()
+
+    last = birthday(birth.dt.year.to_numpy() + whole)
+    next_ = birthday(birth.dt.year.to_numpy() + whole + 1)
+    fraction = (event.to_numpy() - last) / (next_ - last)
+    return np.where(missing, np.nan, whole + fraction)
+
+
+def decimal_year(dates: pd.Series) -> "npt.NDArray[np.float64]":
+    """Calendar year with the fraction of the year elapsed, e.g. 2020.5 in early July.
+
+    Args:
+        dates: Dates (anything `pd.to_datetime` parses).
+
+    Returns:
+        Decimal year per row; NaN where a date is missing or unparseable.
+    """
+    dates = pd.to_datetime(pd.Series(dates).reset_index(drop=True), errors="coerce").dt.normalize()
+    days = np.where(dates.dt.is_leap_year, 366.0, 365.0)
+    return (dates.dt.year + (dates.dt.dayofyear - 1) / days).to_numpy(
+        dtype="float64", na_value=np.nan
+    )
+
+
+def query_columns(
+    df: pd.DataFrame, cols: dict[str, str] | None, names: list[str]
+) -> dict[str, str] | None:
+    """Resolve the input column of each query field.
+
+    'age' and 'year' need not be mapped when `cols` maps both `DATE_COLUMNS`;
+    they are then derived from the dates, see `query_ages_years`.
+
+    Args:
+        df: Input DataFrame.
+        cols: Column mapping; None for the field names themselves.
+        names: Query fields, e.g. ['age', 'sex', 'year'].
+
+    Returns:
+        Input column per field, or None (after logging a warning) if one is
+        missing from `df`.
+    """
+    cols = cols or {}
+    if all(c in cols for c in DATE_COLUMNS):
+        names = [n for n in names if n not in ("age", "year")] + list(DATE_COLUMNS)
+    df_cols = {}
+    for col in names:
+        tcol = cols.get(col, col)
+        if tcol not in df.columns:
+            logger.warning(f"No column `{tcol!s}` in the DataFrame")
+            return None
+        df_cols[col] = tcol
+    return df_cols
+
+
+def query_ages_years(
+    df: pd.DataFrame, df_cols: dict[str, str]
+) -> tuple["npt.NDArray[np.float64]", "npt.NDArray[np.float64]"]:
+    """Numeric ages and years of the query rows.
+
+    Args:
+        df: Input DataFrame.
+        df_cols: Input columns from `query_columns`.
+
+    Returns:
+        Tuple of (ages, years): exact age and decimal year of the event when
+        `df_cols` has date columns, else the 'age' and 'year' columns; NaN
+        where missing.
+    """
+    birth, event = DATE_COLUMNS
+    if birth in df_cols:
+        return exact_age(df[df_cols[birth]], df[df_cols[event]]), decimal_year(df[df_cols[event]])
+    ages = pd.to_numeric(df[df_cols["age"]], errors="coerce").to_numpy(dtype="float64")
+    years = pd.to_numeric(df[df_cols["year"]], errors="coerce").to_numpy(dtype="float64")
+    return ages, years
+
+
+DOWNLOAD_CHUNK_SIZE = 512 * 1024
+RETRY_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+HTTP_CACHE_DIR = Path(
+    os.environ.get("LOST_YEARS_HTTP_CACHE", Path.home() / ".cache" / "lost_years" / "http")
+)
+# Returned by the data updaters when the upstream data has not changed
+NOT_MODIFIED = object()
+
+
+def file_sha256(path: str | Path, chunk_size: int = DOWNLOAD_CHUNK_SIZE) -> str:
+    """Compute the SHA-256 hex digest of a file without loading it into memory.
+
+    Args:
+        path: File to hash.
+        chunk_size: Number of bytes read at a time.
+
+    Returns:
+        Lower-case hex digest.
+    """
+    digest = hashlib.sha256()
+    with Path(path).open("rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_sha256_manifest(path: str | Path) -> dict[str, str]:
+    """Read a checksum manifest in `sha256sum` format.
+
+    Each line holds a hex digest and a file name separated by whitespace; an
+    optional `*` before the name (binary mode) is ignored, as are blank lines
+    and lines starting with `#`.
+
+    Args:
+        path: Manifest file.
+
+    Returns:
+        Mapping of file name to lower-case hex digest.
+    """
+    checksums = {}
+    for line in Path(path).read_text().splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        digest, name = line.split(maxsplit=1)
+        checksums[name.lstrip("*")] = digest.lower()
+    return checksums
+
+
+def download_file(
+    url: str,
+    local_path: str | Path | None = None,
+    sha256: str | None = None,
+    manifest: str | Path | None = None,
+    retries: int = 3,
+    backoff: float = 1.0,
+    timeout: float = 30.0,
+    chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+    session: requests.Session | None = None,
+) -> Path:
+    """Download a file in a streaming, resumable and verifiable way.
+
+    The body is streamed to `<local_path>.part` in `chunk_size` blocks, so
+    memory use does not depend on the file size. An existing partial file is
+    resumed with an HTTP Range request; servers that ignore the range restart
+    the download from scratch. Connection errors, timeouts and transient
+    HTTP statuses are retried with exponential backoff. The partial file is
+    renamed to `local_path` only once it is complete and its checksum matches.
+
+    Args:
+        url: URL to download.
+        local_path: Destination file; None for the last component of the URL
+            in the current directory.
+        sha256: Expected SHA-256 hex digest of the file.
+        manifest: `sha256sum` style manifest to look the expected digest up
+            in by the destination file name; ignored if `sha256` is given.
+        retries: Number of retries after the first attempt.
+        backoff: Seconds to wait before the first retry, doubled after each.
+        timeout: Connect and read timeout in seconds.
+        chunk_size: Number of bytes written at a time.
+        session: Session to issue the requests with; None for a plain request.
+
+    Returns:
+        Path of the downloaded file.
+
+    Raises:
+        requests.RequestException: If the download still fails after all
+            retries or the server rejects the request.
+        ValueError: If the downloaded file does not match the expected digest
+            after all retries.
+    """
     match local_path:
         case None:
             local_path = Path(url.split("/")[-1])
@@ -82,8 +287,286 @@ def download_file(url: str, local_path: str | Path | None = None) -> None:
         case _:
             pass  # Already a Path object
 
-    r = requests.get(url)
-    with local_path.open("wb") as f:
-        for chunk in r.iter_content(chunk_size=512 * 1024):
-            if chunk:  # filter out keep-alive new chunks
-                f.write(chunk)
+    if sha256 is None and manifest is not None:
+        sha256 = read_sha256_manifest(manifest).get(local_path.name)
+        if sha256 is None:
+            logger.warning(f"No checksum for `{local_path.name}` in manifest `{manifest!s}`")
+    if sha256 is not None:
+        sha256 = sha256.lower()
+        if local_path.exists() and file_sha256(local_path, chunk_size) == sha256:
+            logger.info(f"`{local_path!s}` is already up to date")
+            return local_path
+
+    part_path = local_path.with_name(local_path.name + ".part")
+    for attempt in range(retries + 1):
+        try:
+            _download_part(url, part_path, timeout, chunk_size, session)
+            if sha256 is not None:
+                actual = file_sha256(part_path, chunk_size)
+                if actual != sha256:
+                    # A corrupt partial file must not be resumed
+                    part_path.unlink()
+                    raise ValueError(
+                        f"Checksum mismatch for `{url}`: expected {sha256}, got {actual}"
+                    )
+            part_path.replace(local_path)
+            return local_path
+        except (requests.RequestException, ValueError) as e:
+            response = getattr(e, "response", None)
+            status = getattr(response, "status_code", None)
+            if status is not None and status not in RETRY_STATUS_CODES:
+                raise
+            if attempt == retries:
+                raise
+            delay = backoff * 2**attempt
+            logger.warning(f"Download of `{url}` failed ({e}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+    return local_path
+
+
+def _download_part(
+    url: str,
+    part_path: Path,
+    timeout: float,
+    chunk_size: int,
+    session: requests.Session | None,
+) -> None:
+    """Stream `url` into `part_path`, resuming from its current size."""
+    offset = part_path.stat().st_size if part_path.exists() else 0
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+    get = session.get if session is not None else requests.get
+    response = get(url, headers=headers, stream=True, timeout=timeout)
+    try:
+        if offset and response.status_code == 416:
+            # Nothing left to fetch: the partial file already holds the body
+            return
+        response.raise_for_status()
+        resumed = offset and response.status_code == 206
+        if offset and not resumed:
+            logger.info(f"Server ignored the range request, restarting `{url}`")
+        with part_path.open("ab" if resumed else "wb") as f:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                if chunk:  # filter out keep-alive new chunks
+                    f.write(chunk)
+    finally:
+        response.close()
+
+
+class CachedSession(requests.Session):
+    """Session with an on-disk conditional-GET cache.
+
+    GET requests for URLs with a stored entry carry `If-None-Match` and
+    `If-Modified-Since` headers built from the stored validators. When the
+    server answers 304 Not Modified the stored body is filled into the
+    response, which keeps its 304 status and has `from_cache` set, so callers
+    can skip re-processing unchanged data.
+
+    Responses are only written to the cache by `commit`, once the caller has
+    processed them successfully; a failed run therefore never marks the data
+    as up to date. Sessions sharing a cache directory share the entries.
+    """
+
+    def __init__(self, cache_dir: str | Path | None = None) -> None:
+        super().__init__()
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else HTTP_CACHE_DIR
+        self.pending: dict[str, requests.Response] = {}
+
+    def _entry_paths(self, url: str) -> tuple[Path, Path]:
+        key = hashlib.sha256(url.encode()).hexdigest()
+        return self.cache_dir / f"{key}.json", self.cache_dir / f"{key}.body"
+
+    def get(self, url: str | bytes, **kwargs: Any) -> requests.Response:  # type: ignore[override]
+        url = url.decode() if isinstance(url, bytes) else url
+        meta_path, body_path = self._entry_paths(url)
+        meta = None
+        if meta_path.exists() and body_path.exists():
+            meta = json.loads(meta_path.read_text())
+            headers = dict(kwargs.pop("headers", None) or {})
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+            kwargs["headers"] = headers
+
+        response = super().get(url, **kwargs)
+        response.from_cache = False  # type: ignore[attr-defined]
+        if response.status_code == 304 and meta is not None:
+            logger.info(f"Not modified since last fetch: {url}")
+            response._content = body_path.read_bytes()
+            response.encoding = meta.get("encoding")
+            if meta.get("content_type"):
+                response.headers.setdefault("Content-Type", meta["content_type"])
+            response.from_cache = True  # type: ignore[attr-defined]
+        elif response.status_code == 200 and not kwargs.get("stream"):
+            if "ETag" in response.headers or "Last-Modified" in response.headers:
+                self.pending[url] = response
+        return response
+
+    def commit(self, url: str | None) -> None:
+        """Store the validators and body of a response fetched from `url`.
+
+        Args:
+            url: URL passed to `get`; None or a URL without a cacheable
+                response is ignored.
+        """
+        response = self.pending.pop(url, None) if url is not None else None
+        if response is None:
+            return
+        meta_path, body_path = self._entry_paths(url)  # type: ignore[arg-type]
+        meta = {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "content_type": response.headers.get("Content-Type"),
+            "encoding": response.encoding,
+        }
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        # Write the body first so an entry never points to a missing body
+        for path, data in [(body_path, response.content), (meta_path, json.dumps(meta).encode())]:
+            tmp_path = path.with_name(path.name + ".tmp")
+            tmp_path.write_bytes(data)
+            tmp_path.replace(path)
+
+
+def manifest_path(data_file: Path) -> Path:
+    """Path of the manifest describing a partitioned gzip CSV data file."""
+    return data_file.with_name(data_file.name.removesuffix(".csv.gz") + ".manifest.json")
+
+
+CSV_ENGINES = ("auto", "c", "pyarrow", "python")
+
+
+def resolve_engine(engine: str = "auto") -> str:
+    """Pick the pandas CSV parser for `engine`.
+
+    Args:
+        engine: One of `CSV_ENGINES`. 'auto' uses the multi-threaded pyarrow
+            parser when pyarrow is installed and the C parser otherwise.
+
+    Returns:
+        The pandas `read_csv` engine name.
+
+    Raises:
+        ValueError: If `engine` is not one of `CSV_ENGINES`.
+        ImportError: If 'pyarrow' is requested but not installed.
+    """
+    if engine not in CSV_ENGINES:
+        raise ValueError(f"Unknown CSV engine {engine!r}, expected one of {CSV_ENGINES}")
+    has_pyarrow = importlib.util.find_spec("pyarrow") is not None
+    if engine == "auto":
+        return "pyarrow" if has_pyarrow else "c"
+    if engine == "pyarrow" and not has_pyarrow:
+        raise ImportError("The pyarrow CSV engine requires pyarrow: pip install pyarrow")
+    return engine
+
+
+def read_csv(source: Any, engine: str = "auto", **kwargs: Any) -> pd.DataFrame:
+    """Read a CSV with a selectable parser.
+
+    Options the pyarrow parser does not support are adapted: a callable
+    `usecols` is resolved against the header first and `low_memory` is
+    dropped, as pyarrow always parses the whole file at once.
+
+    Args:
+        source: Path or file-like object, as for `pandas.read_csv`.
+        engine: Parser, see `resolve_engine`.
+        **kwargs: Passed on to `pandas.read_csv`.
+
+    Returns:
+        The parsed DataFrame.
+    """
+    engine = resolve_engine(engine)
+    if engine == "pyarrow":
+        kwargs.pop("low_memory", None)
+        usecols = kwargs.get("usecols")
+        if callable(usecols):
+            if kwargs.get("names") is not None:
+                header = list(kwargs["names"])
+            else:
+                header = list(
+                    pd.read_csv(
+                        source, nrows=0, compression=kwargs.get("compression", "infer")
+                    ).columns
+                )
+                if hasattr(source, "seek"):
+                    source.seek(0)
+            kwargs["usecols"] = [c for c in header if usecols(c)]
+    return pd.read_csv(source, engine=engine, **kwargs)
+
+
+def gunzip_members(data: bytes) -> bytes:
+    """Decompress gzip data that may consist of several concatenated members."""
+    parts = []
+    while data:
+        decompressor = zlib.decompressobj(wbits=31)
+        parts.append(decompressor.decompress(data))
+        data = decompressor.unused_data
+    return b"".join(parts)
+
+
+def read_csv_blocks(
+    path: str | Path, workers: int | None = None, engine: str = "auto", **kwargs: Any
+) -> pd.DataFrame:
+    """Read a CSV, decompressing and parsing its gzip blocks in parallel.
+
+    Files written by the data updaters consist of one gzip member per block
+    and a manifest with each block's byte range. Each block is then
+    decompressed and parsed in a worker thread; zlib and the pandas
+    tokenizer release the GIL, so this scales with the number of cores.
+    Files without a matching manifest are read with a single `read_csv`
+    call.
+
+    Args:
+        path: Gzip CSV file.
+        workers: Number of worker threads; None for the number of CPUs.
+        engine: CSV parser, see `resolve_engine`.
+        **kwargs: Passed on to `pandas.read_csv` (e.g. `usecols`, `dtype`).
+
+    Returns:
+        The file's contents, in file order.
+    """
+    path = Path(path)
+    blocks: list[dict[str, Any]] = []
+    columns: list[str] = []
+    index_path = manifest_path(path)
+    if index_path.exists():
+        try:
+            manifest = json.loads(index_path.read_text())
+            if manifest.get("file_size") == path.stat().st_size:
+                blocks, columns = manifest["blocks"], manifest["columns"]
+            else:
+                logger.warning(f"Ignoring out of date manifest: {index_path}")
+        except (ValueError, KeyError):
+            logger.warning(f"Ignoring unreadable manifest: {index_path}")
+    if len(blocks) < 2:
+        return read_csv(path, engine=engine, **kwargs)
+
+    def read_block(block: dict[str, Any], dtype: Any = None) -> pd.DataFrame:
+        with path.open("rb") as f:
+            f.seek(block["offset"])
+            data = gunzip_members(f.read(block["length"]))
+        options = kwargs if dtype is None else {**kwargs, "dtype": dtype}
+        return read_csv(io.BytesIO(data), engine, header=None, names=columns, **options)
+
+    ordered = sorted(blocks, key=lambda block: block["offset"])
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        frames = list(executor.map(read_block, ordered))
+        # Types are inferred per block: a column that is text in one block but
+        # numeric or empty in another is re-read as text, as a single read would
+        numeric = [{c for c in df.columns if pd.api.types.is_numeric_dtype(df[c])} for df in frames]
+        mixed = set.union(*numeric) - set.intersection(*numeric)
+        if mixed:
+            dtype = dict.fromkeys(mixed, str)
+            if isinstance(kwargs.get("dtype"), dict):
+                dtype.update(kwargs["dtype"])
+            redo = [i for i, cols in enumerate(numeric) if cols & mixed]
+            reread = executor.map(lambda i: read_block(ordered[i], dtype), redo)
+            for i, df in zip(redo, reread, strict=True):
+                frames[i] = df
+    df = pd.concat(frames, ignore_index=True)
+    # Blocks with different categories concatenate to plain objects
+    if isinstance(kwargs.get("dtype"), dict):
+        for col, dtype in kwargs["dtype"].items():
+            if dtype == "category" and col in df.columns:
+                df[col] = df[col].astype("category")
+    return df
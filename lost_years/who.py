@@ -2,27 +2,53 @@
 
 import argparse
 import logging
-import re
 import sys
 from importlib.resources import files
 
+import numpy as np
 import pandas as pd
 
-from .utils import closest, column_exists, fixup_columns
+from .data.artifacts import check_artifact, fingerprint
+from .data.schemas import WHOSchema, load_table
+from .lifetable import discounted_years
+from .matching import LifeTableIndex, gather, match_quality
+from .utils import (
+    CSV_ENGINES,
+    DATE_COLUMNS,
+    column_exists,
+    fixup_columns,
+    query_ages_years,
+    query_columns,
+    read_csv,
+)
 
 # Setup logger
 logger = logging.getLogger(__name__)
 
 WHO_DATA = files("lost_years") / "data" / "who" / "who.csv.gz"
-WHO_COLS = ["country_code", "year", "sex_code", "life_expectancy", "low_ci", "high_ci"]
+WHO_COLS = WHOSchema.LAYOUT.columns
+# GHO age group codes: AGELT1, AGE1-4, ..., AGE85PLUS, AGE100+
+WHO_AGEGROUP_RE = r"^AGE(?:LT(?P<under>\d+)|(?P<start>\d+)(?:-(?P<last>\d+)|(?P<open>PLUS|\+)))$"
 
 
 class LostYearsWHOData:
-    __df = None
-    __who_trans: dict[str, str] = {}
+    __index: LifeTableIndex | None = None
+    __fingerprint: tuple[int, int] | None = None
 
     @classmethod
-    def lost_years_who(cls, df: pd.DataFrame, cols: dict[str, str] | None = None) -> pd.DataFrame:
+    def lost_years_who(
+        cls,
+        df: pd.DataFrame,
+        cols: dict[str, str] | None = None,
+        diagnostics: bool = False,
+        max_year_gap: float | None = None,
+        interpolate: bool | None = None,
+        discount_rate: float = 0.0,
+        age_weighting: float = 0.0,
+        uncertainty: bool = False,
+        project: bool = False,
+        engine: str = "auto",
+    ) -> pd.DataFrame:
         """Appends Life expectancy column from WHO data to the input DataFrame
         based on country, age, sex and year in the specific cols mapping.
 
@@ -31,69 +57,167 @@ class LostYearsWHOData:
             cols: Column mapping for country, age, sex, and year in DataFrame.
                 None for default mapping: {'country': 'country', 'age': 'age',
                 'sex': 'sex', 'year': 'year'}.
+                With 'birth_date' and 'event_date' mapped instead of 'age' and
+                'year', the exact age and decimal year at the event are used.
+            diagnostics: Also append 'who_age_gap', 'who_year_gap' and
+                'who_match_kind' columns describing how far the matched table
+                row is from the request.
+            max_year_gap: Drop matches whose year is further than this from
+                the requested year; None for no limit.
+            interpolate: Interpolate life expectancy linearly between the first
+                ages of the matched table's age groups instead of taking the
+                matched group's value; None to interpolate when ages are
+                derived from dates.
+            discount_rate: Annual rate at which future years of life are
+                discounted in the 'who_discounted_yll' column, e.g. 0.03.
+            age_weighting: Share of the GBD age weights in the
+                'who_discounted_yll' column, from 0 (none) to 1. The column
+                is only added when this or ``discount_rate`` is not zero.
+            uncertainty: Also append the 'who_low_ci' and 'who_high_ci'
+                bounds of the life expectancy's uncertainty interval.
+            project: Extrapolate life expectancy to years after the last one
+                of the data along its log-linear trend over the latest years,
+                instead of using the last year's value; see
+                :meth:`lost_years.matching.LifeTableIndex.trend_factors`.
+            engine: CSV parser for loading the reference data, one of
+                'auto', 'c', 'pyarrow' or 'python'; only used on first load.
 
         Returns:
             Pandas DataFrame with WHO data columns:
                 'who_country', 'who_age', 'who_sex', 'who_year', ...
+                and optionally 'who_discounted_yll'. WHO tables carry no
+                survivors, so it uses the closed-form GBD formula on the
+                remaining life expectancy.
         """
-        df_cols = {}
-        for col in ["country", "age", "sex", "year"]:
-            tcol = col if cols is None else cols[col]
-            if tcol not in df.columns:
-                logger.warning(f"No column `{tcol!s}` in the DataFrame")
-                return df
-            df_cols[col] = tcol
-
-        if cls.__df is None:
-            cls.__df = pd.read_csv(str(WHO_DATA), compression="gzip")
-            # Data is already clean with schema-compliant columns
-            # Add age column (WHO data is life expectancy at birth)
-            cls.__df["age"] = 1  # Life expectancy at birth maps to age 1 for lookup
-            # Rename for consistency with existing interface
-            cls.__df = cls.__df.rename(columns={"country_code": "country", "sex_code": "sex"})
-
-        # Create a working copy to avoid modifying the original DataFrame
-        df_work = df.copy()
-
-        # Create normalized sex column for lookup
-        df_work["__normalized_sex"] = df_work[df_cols["sex"]].apply(
-            lambda c: "MLE" if c.lower() in ["m", "male", "mle"] else "FMLE"
+        df_cols = query_columns(df, cols, ["country", "age", "sex", "year"])
+        if df_cols is None:
+            return df
+
+        # Reload when the data file changed since it was indexed
+        current = fingerprint(str(WHO_DATA))
+        if cls.__index is None or cls.__fingerprint != current:
+            check_artifact("who", str(WHO_DATA))
+            wdf = load_table("who", str(WHO_DATA), engine)
+            wdf[["age", "age_end"]] = cls.convert_agegroup(wdf["age_group"])
+            unknown = wdf["age"].isna()
+            if unknown.any():
+                logger.warning(f"Dropping {unknown.sum()} WHO rows with unknown age groups")
+                wdf = wdf[~unknown]
+            wdf["age"] = wdf["age"].astype("int64")
+            wdf["year_end"] = wdf["year"] + 1
+            # Case-insensitive lookup key
+            wdf["__country_key"] = wdf["country"].str.lower()
+            cls.__index = LifeTableIndex(wdf, ["__country_key", "sex"])
+            cls.__fingerprint = current
+        index = cls.__index
+        table = index.table
+
+        # Normalized country and sex for lookup
+        countries = df[df_cols["country"]].astype(str).str.lower().reset_index(drop=True)
+        sexes = pd.Series(
+            np.where(
+                df[df_cols["sex"]].astype(str).str.lower().isin(["m", "male", "mle"]),
+                "MLE",
+                "FMLE",
+            )
         )
+        group_ids = index.group_ids([countries, sexes])
+
+        ages, years = query_ages_years(df, df_cols)
+        rows = index.lookup(group_ids, ages, years)
+
+        matched = rows >= 0
+        safe_rows = np.where(matched, rows, 0)
+        quality, keep = match_quality(
+            "who",
+            ages,
+            years,
+            table["age"].to_numpy(dtype="float64")[safe_rows],
+            table["year"].to_numpy(dtype="float64")[safe_rows],
+            matched,
+            max_year_gap=max_year_gap,
+            matched_age_ends=table["age_end"].to_numpy(dtype="float64")[safe_rows],
+            matched_year_ends=table["year_end"].to_numpy(dtype="float64")[safe_rows],
+        )
+
+        out = {
+            f"who_{c}": gather(table[c], rows, keep, df.index)
+            for c in ["age", "country", "sex", "year", "life_expectancy"]
+        }
+        if interpolate is None:
+            interpolate = DATE_COLUMNS[0] in df_cols
+        kept = np.where(keep, rows, -1)
+        if interpolate:
+            out["who_life_expectancy"] = pd.Series(
+                index.interpolate("life_expectancy", kept, ages), index=df.index
+            )
+        if uncertainty:
+            for c in ["low_ci", "high_ci"]:
+                out[f"who_{c}"] = (
+                    pd.Series(index.interpolate(c, kept, ages), df.index)
+                    if interpolate
+                    else gather(table[c], rows, keep, df.index)
+                )
+        if project:
+            # The uncertainty interval keeps its width relative to the value
+            factors = index.trend_factors("life_expectancy", kept, years)
+            for c in ["life_expectancy", "low_ci", "high_ci"]:
+                if f"who_{c}" in out:
+                    out[f"who_{c}"] = out[f"who_{c}"] * factors
+        if discount_rate or age_weighting:
+            out["who_discounted_yll"] = pd.Series(
+                discounted_years(
+                    ages,
+                    out["who_life_expectancy"].to_numpy(dtype="float64"),
+                    discount_rate,
+                    age_weighting,
+                ),
+                index=df.index,
+            )
+        if diagnostics:
+            out.update(quality)
+        return df.assign(**out)
 
-        out_df = pd.DataFrame()
-        for i, r in df_work.iterrows():
-            sdf = cls.__df
-            for c in ["country", "age", "year"]:
-                if sdf[c].dtype in ["int32", "int64", "float64"]:
-                    sdf = sdf[sdf[c] == closest(sdf[c].unique(), r[df_cols[c]])]
-                else:
-                    sdf = sdf[sdf[c].str.lower() == r[df_cols[c]].lower()]
-            # Handle sex column separately using normalized value
-            sdf = sdf[sdf["sex"].str.lower() == r["__normalized_sex"].lower()]
-
-            # Select relevant columns and rename for output
-            odf = sdf[["age", "country", "sex", "year", "life_expectancy"]].copy()
-            odf["index"] = i  # type: ignore[call-overload]
-            out_df = pd.concat([out_df, odf])
-        out_df.set_index("index", drop=True, inplace=True)
-        out_df.columns = ["who_" + c for c in out_df.columns]
-        rdf = df.join(out_df)
-
-        return rdf
+    @classmethod
+    def clear_cache(cls) -> None:
+        """Drop the loaded WHO data index."""
+        cls.__index = None
+        cls.__fingerprint = None
 
     @classmethod
-    def convert_agegroup(cls, ag):
-        if ag == "AGE100+":
-            return 100
-        if ag == "AGE85PLUS":
-            return 85
-        if ag == "AGELT1":
-            return 1
-        m = re.match(r"AGE(\d+)\-(\d+)", ag)
-        if m:
-            return int(m.group(1))
-        else:
-            return 0
+    def convert_agegroup(cls, agegroups: pd.Series) -> pd.DataFrame:
+        """Converts WHO GHO age group codes to half-open age intervals.
+
+        Each distinct code is parsed once, so the cost does not grow with the
+        number of rows sharing it.
+
+        Args:
+            agegroups: Series of age group codes, e.g. 'AGELT1', 'AGE5-9',
+                'AGE85PLUS' or 'AGE100+'.
+
+        Returns:
+            DataFrame aligned to `agegroups` with 'age' (first age in the group)
+            and 'age_end' (exclusive end, inf for open groups) columns; NaN for
+            codes that are not age groups.
+        """
+        codes = agegroups.astype("category")
+        parts = codes.cat.categories.to_series().astype(str).str.extract(WHO_AGEGROUP_RE)
+        under = parts["under"].astype("float64")
+        start = parts["start"].astype("float64")
+        starts = start.where(under.isna(), 0.0)
+        ends = (parts["last"].astype("float64") + 1).fillna(under)
+        ends = ends.mask(parts["open"].notna(), np.inf)
+
+        positions = codes.cat.codes.to_numpy()
+        found = positions >= 0
+        safe = np.where(found, positions, 0)
+        return pd.DataFrame(
+            {
+                "age": np.where(found, starts.to_numpy()[safe], np.nan),
+                "age_end": np.where(found, ends.to_numpy()[safe], np.nan),
+            },
+            index=agegroups.index,
+        )
 
 
 lost_years_who = LostYearsWHOData.lost_years_who
@@ -127,6 +251,49 @@ def main(argv: list[str] = sys.argv[1:]) -> int:
         default="year",
         help="Columns name of year in the input file(default=`year`)",
     )
+    parser.add_argument(
+        "--birth-date",
+        default=None,
+        help="Column name of date of birth; with --event-date, used instead of age and year",
+    )
+    parser.add_argument(
+        "--event-date",
+        default=None,
+        help="Column name of the date (e.g. of death) at which age and year are taken",
+    )
+    parser.add_argument(
+        "--interpolate",
+        action="store_true",
+        default=None,
+        help="Interpolate life expectancy between ages (default with date columns)",
+    )
+    parser.add_argument(
+        "--diagnostics",
+        action="store_true",
+        help="Append who_age_gap, who_year_gap and who_match_kind columns",
+    )
+    parser.add_argument(
+        "--uncertainty",
+        action="store_true",
+        help="Append the who_low_ci and who_high_ci uncertainty interval columns",
+    )
+    parser.add_argument(
+        "--project",
+        action="store_true",
+        help="Extrapolate life expectancy to years after the data along its recent trend",
+    )
+    parser.add_argument(
+        "--max-year-gap",
+        type=float,
+        default=None,
+        help="Drop matches further than this many years from the requested year",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=CSV_ENGINES,
+        default="auto",
+        help="CSV parser for the input and reference data (default=`auto`: pyarrow if installed)",
+    )
     parser.add_argument(
         "-o",
         "--output",
@@ -138,13 +305,21 @@ def main(argv: list[str] = sys.argv[1:]) -> int:
 
     logger.debug(args)
 
-    df = pd.read_csv(args.input)
+    df = read_csv(args.input, args.engine)
+
+    dates = {}
+    if args.birth_date and args.event_date:
+        dates = {"birth_date": args.birth_date, "event_date": args.event_date}
+        for col_arg in dates.values():
+            if not column_exists(df, col_arg):
+                logger.error(f"Column: `{col_arg!s}` not found in the input file")
+                return -1
 
     if not column_exists(df, args.country):
         logger.error(f"Column: `{args.country!s}` not found in the input file")
         return -1
 
-    if not column_exists(df, args.age):
+    if not dates and not column_exists(df, args.age):
         logger.error(f"Column: `{args.age!s}` not found in the input file")
         return -1
 
@@ -152,7 +327,7 @@ def main(argv: list[str] = sys.argv[1:]) -> int:
         logger.error(f"Column: `{args.sex!s}` not found in the input file")
         return -1
 
-    if not column_exists(df, args.year):
+    if not dates and not column_exists(df, args.year):
         logger.error(f"Column: `{args.year!s}` not found in the input file")
         return -1
 
@@ -163,7 +338,14 @@ def main(argv: list[str] = sys.argv[1:]) -> int:
             "age": args.age,
             "sex": args.sex,
             "year": args.year,
+            **dates,
         },
+        diagnostics=args.diagnostics,
+        max_year_gap=args.max_year_gap,
+        project=args.project,
+        interpolate=args.interpolate,
+        uncertainty=args.uncertainty,
+        engine=args.engine,
     )
 
     logger.info(f"Saving output to file: `{args.output:s}`")
@@ -0,0 +1,104 @@
+"""Shared fixtures: synthetic HLD and WHO data files."""
+
+import pandas as pd
+import pytest
+
+import lost_years.hld
+import lost_years.who
+from lost_years.data import artifacts
+from lost_years.hld import LostYearsHLDData
+from lost_years.who import LostYearsWHOData
+
+
+@pytest.fixture(autouse=True)
+def verified_cache(tmp_path, monkeypatch):
+    """Keep the hashes of verified data files out of the user's cache."""
+    path = tmp_path / "verified.json"
+    monkeypatch.setattr(artifacts, "VERIFIED_FILE", path)
+    return path
+
+
+def make_hld_sample() -> pd.DataFrame:
+    """Build a small synthetic HLD extract with irregular coverage.
+
+    Males have a complete table for 1950, an abridged one for 1951-1955 and
+    another for 1990; females only the complete 1950 table.
+    """
+    abridged = [0, 1, *range(5, 41, 5)]
+    complete = list(range(0, 41))
+    # (sex, year1, year2, ages, TypeLT, Ref-ID, Version, e(x) shift)
+    tables = [
+        # Duplicates of the male 1950 table, listed first in the file
+        (1, 1950, 1950, abridged, 2, "AAA.01", 1, 100.0),
+        (1, 1950, 1950, complete, 1, "BBB.01", 1, 200.0),
+        (1, 1950, 1950, complete, 1, "BBB.01", 2, 0.0),
+        (1, 1951, 1955, abridged, 4, "BBB.01", 1, 0.0),
+        (1, 1990, 1990, abridged, 4, "BBB.01", 1, 0.0),
+        (2, 1950, 1950, complete, 1, "BBB.01", 1, 0.0),
+    ]
+    rows = []
+    for sex, year1, year2, ages, type_lt, ref_id, version, shift in tables:
+        for age, next_age in zip(ages, [*ages[1:], None], strict=True):
+            rows.append(
+                {
+                    "Country": "XXX",
+                    "Region": 0,
+                    "Residence": 0,
+                    "Ethnicity": 0,
+                    "SocDem": 0,
+                    "Version": version,
+                    "Ref-ID": ref_id,
+                    "Year1": year1,
+                    "Year2": year2,
+                    "TypeLT": type_lt,
+                    "Sex": sex,
+                    "Age": age,
+                    "AgeInt": 99 if next_age is None else next_age - age,
+                    "e(x)": 70.0 - age + (year1 - 1950) / 10 + (sex - 1) * 5 + shift,
+                }
+            )
+    return pd.DataFrame(rows)
+
+
+@pytest.fixture
+def hld_sample(tmp_path, monkeypatch):
+    """Point the HLD loader at a synthetic data file."""
+    path = tmp_path / "hld.csv.gz"
+    make_hld_sample().to_csv(path, compression="gzip", index=False)
+    monkeypatch.setattr(lost_years.hld, "HLD_DATA", path)
+    LostYearsHLDData.clear_cache()
+    yield path
+    LostYearsHLDData.clear_cache()
+
+
+def make_who_sample() -> pd.DataFrame:
+    """Build a small synthetic WHO extract with age-grouped life tables."""
+    agegroups = {"AGELT1": 0, "AGE1-4": 1, "AGE5-9": 5, "AGE10-84": 10, "AGE85PLUS": 85}
+    rows = []
+    for year in [2000, 2010]:
+        for sex, offset in [("MLE", 0.0), ("FMLE", 5.0)]:
+            for code, start in agegroups.items():
+                rows.append(
+                    {
+                        "country_code": "XXX",
+                        "country_name": "Nowhere",
+                        "year": year,
+                        "sex_code": sex,
+                        "age_group": code,
+                        "life_expectancy": 80.0 - start + offset + (year - 2000) / 10,
+                        "low_ci": 0.0,
+                        "high_ci": 0.0,
+                    }
+                )
+    return pd.DataFrame(rows)
+
+
+@pytest.fixture
+def who_sample(tmp_path, monkeypatch):
+    """Point the WHO loader at a synthetic age-grouped data file."""
+    path = tmp_path / "who.csv.gz"
+    make_who_sample().to_csv(path, compression="gzip", index=False)
+    monkeypatch.setattr(lost_years.who, "WHO_DATA", path)
+    LostYearsWHOData.clear_cache()
+    yield path
+    LostYearsWHOData.clear_cache()
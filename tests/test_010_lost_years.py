@@ -5,7 +5,11 @@ import logging
 import pandas as pd
 import pytest
 
-from lost_years import lost_years_hld, lost_years_ssa, lost_years_who
+import lost_years.ssa
+from lost_years import HLDTablePreference, lost_years_hld, lost_years_ssa, lost_years_who
+from lost_years.who import LostYearsWHOData
+
+from .conftest import make_hld_sample
 
 
 class TestLostYears:
@@ -40,6 +44,44 @@ class TestLostYears:
         assert result.iloc[0].who_year >= 2003  # WHO data may be updated
 
 
+class TestMatchDiagnostics:
+    """Test match quality columns and the year gap threshold."""
+
+    def test_ssa_diagnostics(self):
+        """Gaps are signed and exact hits are labelled."""
+        df = pd.DataFrame(
+            {"age": [30, 30, 200], "sex": ["M", "F", "M"], "year": [2022, 2020, 2022]}
+        )
+        result = lost_years_ssa(df, diagnostics=True)
+        assert result.ssa_match_kind.tolist() == ["exact", "nearest", "nearest"]
+        assert result.ssa_year_gap.tolist() == [0, 2, 0]
+        assert result.iloc[2].ssa_age_gap < 0
+
+    def test_max_year_gap(self):
+        """Matches further than the threshold are dropped."""
+        df = pd.DataFrame({"age": [30, 30], "sex": ["M", "M"], "year": [2022, 1990]})
+        result = lost_years_ssa(df, diagnostics=True, max_year_gap=5)
+        assert result.ssa_life_expectancy.notna().tolist() == [True, False]
+        assert result.ssa_match_kind.tolist() == ["exact", "too_distant"]
+
+    def test_who_diagnostics(self):
+        """Unknown countries are reported as unmatched."""
+        df = pd.DataFrame(
+            {"country": ["USA", "ZZZ"], "age": [0, 0], "sex": ["M", "M"], "year": [2010, 2010]}
+        )
+        result = lost_years_who(df, diagnostics=True)
+        assert result.who_match_kind.tolist() == ["exact", "none"]
+        assert pd.isna(result.iloc[1].who_life_expectancy)
+
+    def test_hld_fallback_kind(self, hld_sample):
+        """Partial country matches are flagged as fallback."""
+        df = pd.DataFrame(
+            {"country": ["XX", "XXX"], "age": [10, 10], "sex": ["M", "M"], "year": [1950, 1950]}
+        )
+        result = lost_years_hld(df, diagnostics=True)
+        assert result.hld_match_kind.tolist() == ["fallback", "exact"]
+
+
 class TestErrorHandling:
     """Test error handling and edge cases."""
 
@@ -174,3 +216,189 @@ class TestDataValidation:
 
         assert isinstance(result_ssa, pd.DataFrame)
         assert isinstance(result_who, pd.DataFrame)
+
+
+class TestHLDMatching:
+    """Test HLD lookups against a synthetic data file."""
+
+    def test_missing_age(self, hld_sample):
+        """A row without an age is dropped instead of failing the whole load."""
+        df = make_hld_sample()
+        df["Age"] = df["Age"].astype(object)
+        df.loc[0, "Age"] = None
+        df.to_csv(hld_sample, compression="gzip", index=False)
+        query = pd.DataFrame({"country": ["XXX"], "age": [10], "sex": ["F"], "year": [1950]})
+        result = lost_years_hld(query)
+        assert result["hld_life_expectancy"].iloc[0] == 65.0
+
+    def test_joint_age_year_match(self, hld_sample):
+        """A nearby age in a nearby year beats the exact age in a distant year."""
+        df = pd.DataFrame({"country": ["XXX"], "age": [37], "sex": ["M"], "year": [1989]})
+        result = lost_years_hld(df)
+        assert result.iloc[0].hld_year == 1990
+        assert result.iloc[0].hld_age == 35
+
+    def test_match_weights(self, hld_sample):
+        """A heavy age weight keeps the exact age at the cost of the year."""
+        df = pd.DataFrame({"country": ["XXX"], "age": [37], "sex": ["M"], "year": [1989]})
+        result = lost_years_hld(df, age_weight=100.0)
+        assert result.iloc[0].hld_year == 1950
+        assert result.iloc[0].hld_age == 37
+
+    def test_interval_containment(self, hld_sample):
+        """Requests inside a table's year span and age interval resolve to it."""
+        df = pd.DataFrame({"country": ["XXX"] * 3, "age": [37, 37, 80], "sex": ["M"] * 3})
+        df["year"] = [1953, 1950, 1950]
+        result = lost_years_hld(df, diagnostics=True)
+        assert result.hld_year.tolist() == [1951, 1950, 1950]
+        assert result.hld_age.tolist() == [35, 37, 40]
+        assert result.hld_match_kind.tolist() == ["exact", "exact", "exact"]
+
+    def test_duplicate_table_preference(self, hld_sample):
+        """Duplicate tables resolve to the latest complete one by default."""
+        df = pd.DataFrame({"country": ["XXX"], "age": [10], "sex": ["M"], "year": [1950]})
+        assert lost_years_hld(df).iloc[0].hld_life_expectancy == 60.0
+
+        oldest = HLDTablePreference(latest_version=False)
+        assert lost_years_hld(df, preference=oldest).iloc[0].hld_life_expectancy == 260.0
+
+        source = HLDTablePreference(sources=("AAA",))
+        assert lost_years_hld(df, preference=source).iloc[0].hld_life_expectancy == 160.0
+
+    def test_country_and_sex(self, hld_sample):
+        """Rows are matched within country and sex; unknown countries stay empty."""
+        df = pd.DataFrame(
+            {
+                "country": ["xxx", "XX", "ZZZ"],
+                "age": [10, 10, 10],
+                "sex": ["female", "M", "M"],
+                "year": [1990, 1950, 1950],
+            }
+        )
+        result = lost_years_hld(df)
+        assert result.hld_sex.tolist() == ["F", "M", ""]
+        assert result.hld_year.tolist()[:2] == [1950, 1950]
+        assert result.iloc[0].hld_life_expectancy == 65.0
+        assert result.iloc[2].hld_country == ""
+
+
+class TestDateQueries:
+    """Ages and years derived from dates, with interpolated life expectancy."""
+
+    def test_ssa_dates(self):
+        df = pd.DataFrame(
+            {
+                "sex": ["M", "M"],
+                "birth_date": ["1992-01-01", "1991-07-02"],
+                "death_date": ["2022-01-01", "2022-01-01"],
+            }
+        )
+        cols = {"sex": "sex", "birth_date": "birth_date", "event_date": "death_date"}
+        result = lost_years_ssa(df, cols=cols)
+        whole = lost_years_ssa(pd.DataFrame({"age": [30, 31], "sex": "M", "year": 2022}))
+        e30, e31 = whole["ssa_life_expectancy"]
+        assert result["ssa_life_expectancy"].iloc[0] == pytest.approx(e30)
+        assert result["ssa_life_expectancy"].iloc[1] == pytest.approx((e30 + e31) / 2, abs=0.01)
+        # Without interpolation the containing row's value is used
+        rounded = lost_years_ssa(df, cols=cols, interpolate=False)
+        assert rounded["ssa_life_expectancy"].iloc[1] in (e30, e31)
+
+    def test_who_interpolation(self, who_sample):
+        df = pd.DataFrame({"country": "XXX", "age": [7.5, 90], "sex": "M", "year": 2000})
+        result = lost_years_who(df, interpolate=True)
+        # Between the AGE5-9 (75) and AGE10-84 (70) groups; the open group is kept
+        assert list(result["who_life_expectancy"]) == [72.5, -5.0]
+
+    def test_hld_dates(self, hld_sample):
+        df = pd.DataFrame(
+            {
+                "country": "XXX",
+                "sex": "F",
+                "birth_date": ["1920-01-01"],
+                "event_date": ["1950-07-02"],
+            }
+        )
+        cols = {"country": "country", "sex": "sex", "birth_date": "birth_date"}
+        cols["event_date"] = "event_date"
+        result = lost_years_hld(df, cols=cols)
+        assert result["hld_life_expectancy"].iloc[0] == pytest.approx(75.0 - 30.5, abs=0.01)
+
+
+class TestWHOAgeGroups:
+    """Tests for age-grouped WHO life tables."""
+
+    def test_convert_agegroup(self):
+        """Codes are parsed into half-open age intervals."""
+        codes = pd.Series(["AGE5-9", "AGELT1", "AGE85PLUS", "AGE100+", "AGE5-9", "BTSX"])
+        bounds = LostYearsWHOData.convert_agegroup(codes)
+        assert bounds.age.tolist()[:5] == [5, 0, 85, 100, 5]
+        assert bounds.age_end.tolist()[:5] == [10, 1, float("inf"), float("inf"), 10]
+        assert bounds.iloc[5].isna().all()
+
+    def test_age_resolves_to_group(self, who_sample):
+        """Ages are matched to the group containing them."""
+        df = pd.DataFrame(
+            {
+                "country": ["xxx"] * 5,
+                "age": [0, 3, 9, 42, 101],
+                "sex": ["M", "M", "M", "F", "M"],
+                "year": [2000, 2000, 2000, 2010, 2000],
+            }
+        )
+        result = lost_years_who(df, diagnostics=True)
+        assert result.who_age.tolist() == [0, 1, 5, 10, 85]
+        assert result.who_life_expectancy.tolist() == [80.0, 79.0, 75.0, 76.0, -5.0]
+        assert result.who_match_kind.tolist() == ["exact"] * 5
+        assert result.who_age_gap.tolist() == [0] * 5
+
+
+class TestProjection:
+    """Tests for projecting life expectancy past the last year of the data."""
+
+    def test_who(self, who_sample):
+        """Years after the data follow the trend instead of the last year."""
+        df = pd.DataFrame({"country": "XXX", "age": [0, 0], "sex": "M", "year": [2020, 2005]})
+        assert lost_years_who(df).who_life_expectancy.tolist() == [81.0, 80.0]
+        result = lost_years_who(df, project=True)
+        # 80 in 2000 and 81 in 2010: the same growth again by 2020
+        assert result.who_life_expectancy.tolist() == pytest.approx([81.0 * 81 / 80, 80.0])
+        assert result.who_year.tolist() == [2010, 2000]
+
+    def test_hld(self, hld_sample):
+        # A male 1985 table half a year below the 1990 one sets the trend
+        df = make_hld_sample()
+        extra = df[(df["Sex"] == 1) & (df["Year1"] == 1990)].assign(Year1=1985, Year2=1985)
+        extra["e(x)"] -= 0.5
+        pd.concat([df, extra]).to_csv(hld_sample, compression="gzip", index=False)
+        query = pd.DataFrame(
+            {
+                "country": "XXX",
+                "age": [0, 0, 10],
+                "sex": ["M", "M", "F"],
+                "year": [2000, 1985, 2000],
+            }
+        )
+        assert lost_years_hld(query).hld_life_expectancy.tolist() == [74.0, 73.5, 65.0]
+        result = lost_years_hld(query, project=True, discount_rate=0.03)
+        # 0.5 lower five years before 1990: that growth twice over by 2000;
+        # females have a single table and no trend to follow
+        expected = [74.0 * (74 / 73.5) ** 2, 73.5, 65.0]
+        assert result.hld_life_expectancy.tolist() == pytest.approx(expected)
+        assert result.hld_year.tolist() == [1990, 1985, 1950]
+        discounted = lost_years_hld(query, discount_rate=0.03).hld_discounted_yll
+        assert result.hld_discounted_yll.iloc[0] > discounted.iloc[0]
+        assert result.hld_discounted_yll.iloc[1:].tolist() == discounted.iloc[1:].tolist()
+
+    def test_ssa(self, tmp_path, monkeypatch):
+        # The 2022 tables preceded by 2012 ones 1% lower
+        table = pd.read_csv(lost_years.ssa.SSA_DATA)
+        earlier = table.assign(year=2012)
+        for sex in ["male", "female"]:
+            earlier[f"{sex}_life_expectancy"] *= 0.99
+        path = tmp_path / "ssa.csv"
+        pd.concat([earlier, table]).to_csv(path, index=False)
+        monkeypatch.setattr(lost_years.ssa, "SSA_DATA", path)
+        df = pd.DataFrame({"age": [30, 30, 30], "sex": ["M", "F", "M"], "year": [2032, 2032, 2022]})
+        plain = lost_years_ssa(df).ssa_life_expectancy.to_numpy()
+        result = lost_years_ssa(df, project=True).ssa_life_expectancy.to_numpy()
+        assert result == pytest.approx(plain * [1 / 0.99, 1 / 0.99, 1])
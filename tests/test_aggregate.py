@@ -0,0 +1,122 @@
+"""Tests for years of life lost aggregation."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import lost_years.hld
+from lost_years import lost_years_ssa, lost_years_who, yll
+from lost_years.aggregate import YLL_COLUMNS
+from lost_years.hld import LostYearsHLDData
+
+
+class TestYLL:
+    """Tests for grouped YLL sums."""
+
+    def test_matches_per_row_sum(self):
+        rng = np.random.default_rng(0)
+        df = pd.DataFrame(
+            {
+                "age": rng.integers(0, 100, 500),
+                "sex": rng.choice(["M", "F"], 500),
+                "year": 2022,
+                "region": rng.choice(["north", "south"], 500),
+                "count": rng.integers(0, 5, 500),
+            }
+        )
+        result = yll(df, deaths="count", by=["region", "sex"])
+        assert len(result) == 4
+
+        enriched = lost_years_ssa(df)
+        enriched["yll"] = enriched["count"] * enriched["ssa_life_expectancy"]
+        expected = enriched.groupby(["region", "sex"])[["count", "yll"]].sum().reset_index()
+        merged = result.merge(expected, on=["region", "sex"])
+        np.testing.assert_allclose(merged["deaths"], merged["count"])
+        np.testing.assert_allclose(merged["yll_x"], merged["yll_y"])
+        assert (result["unmatched_deaths"] == 0).all()
+
+    def test_total_and_unmatched(self, who_sample):
+        df = pd.DataFrame(
+            {"country": ["XXX", "XXX", "YYY"], "age": [0, 0, 30], "sex": "M", "year": 2000}
+        )
+        result = yll(df, source="who")
+        e0 = lost_years_who(df.head(1))["who_life_expectancy"].iloc[0]
+        assert result.to_dict("records") == [
+            {"deaths": 3.0, "yll": 2 * e0, "unmatched_deaths": 1.0}
+        ]
+
+    def test_discounted(self):
+        df = pd.DataFrame({"age": [30, 60], "sex": "M", "year": 2022})
+        plain = yll(df)["yll"].iloc[0]
+        discounted = yll(df, discount_rate=0.03)["yll"].iloc[0]
+        expected = lost_years_ssa(df, discount_rate=0.03)["ssa_discounted_yll"].sum()
+        assert discounted == pytest.approx(expected)
+        assert discounted < plain
+
+    def test_invalid(self):
+        df = pd.DataFrame({"age": [30], "sex": ["M"], "year": [2022]})
+        with pytest.raises(ValueError, match="Unknown source"):
+            yll(df, source="xyz")
+        with pytest.raises(ValueError, match="Missing columns"):
+            yll(df, by=["region"])
+
+    def test_missing_data(self, tmp_path, monkeypatch):
+        """A source whose data cannot be loaded is reported, not a KeyError."""
+        monkeypatch.setattr(lost_years.hld, "HLD_DATA", tmp_path / "missing.csv.gz")
+        LostYearsHLDData.clear_cache()
+        df = pd.DataFrame({"country": ["XXX"], "age": [30], "sex": ["M"], "year": [2000]})
+        with pytest.raises(ValueError, match="HLD lookup returned no"):
+            yll(df, source="hld")
+        LostYearsHLDData.clear_cache()
+
+
+class TestYLLSamples:
+    """Tests for Monte Carlo intervals of the WHO years of life lost."""
+
+    @pytest.fixture
+    def deaths(self):
+        return pd.DataFrame(
+            {
+                "country": ["USA", "USA", "BRA", "BRA", "XXX"],
+                "age": [0, 45, 30, 70, 30],
+                "sex": ["M", "F", "M", "F", "M"],
+                "year": 2015,
+                "region": ["north", "north", "south", "south", "south"],
+            }
+        )
+
+    def test_uncertainty_columns(self, deaths):
+        result = lost_years_who(deaths, uncertainty=True)
+        matched = result.head(4)
+        assert (matched["who_low_ci"] <= matched["who_life_expectancy"]).all()
+        assert (matched["who_life_expectancy"] <= matched["who_high_ci"]).all()
+        assert result[["who_low_ci", "who_high_ci"]].iloc[4].isna().all()
+        assert "who_low_ci" not in lost_years_who(deaths).columns
+
+    def test_interval(self, deaths):
+        result = yll(deaths, by=["region"], source="who", samples=500, seed=1)
+        assert list(result.columns) == ["region", *YLL_COLUMNS, "yll_low", "yll_high"]
+        assert (result["yll_low"] < result["yll"]).all()
+        assert (result["yll"] < result["yll_high"]).all()
+        np.testing.assert_allclose(result["yll"], yll(deaths, by=["region"], source="who")["yll"])
+
+    def test_reproducible(self, deaths):
+        kwargs = {"source": "who", "samples": 150, "seed": 7, "discount_rate": 0.03}
+        one = yll(deaths, workers=1, **kwargs)
+        many = yll(deaths, workers=4, **kwargs)
+        pd.testing.assert_frame_equal(one, many)
+        assert one["yll_low"].iloc[0] < one["yll"].iloc[0] < one["yll_high"].iloc[0]
+        other = yll(deaths, **{**kwargs, "seed": 8})
+        assert other["yll_low"].iloc[0] != one["yll_low"].iloc[0]
+
+    def test_without_uncertainty(self, who_sample):
+        """Intervals of zero width give the point estimate."""
+        df = pd.DataFrame({"country": "XXX", "age": [0, 30], "sex": "M", "year": 2000})
+        result = yll(df, source="who", samples=10)
+        assert result["yll_low"].iloc[0] == pytest.approx(result["yll"].iloc[0])
+        assert result["yll_high"].iloc[0] == pytest.approx(result["yll"].iloc[0])
+
+    def test_invalid(self):
+        df = pd.DataFrame({"age": [30], "sex": ["M"], "year": [2022]})
+        with pytest.raises(ValueError, match="uncertainty intervals"):
+            yll(df, samples=10)
@@ -0,0 +1,92 @@
+"""Tests for the data artifact manifest."""
+
+import json
+import os
+
+import pandas as pd
+
+from lost_years import lost_years_who
+from lost_years.data import artifacts
+from lost_years.data.artifacts import artifact_status, load_manifest, record_artifacts
+
+from .conftest import make_who_sample
+
+
+def touch(path, seconds=10):
+    """Move a file's modification time forward without changing it."""
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + seconds * 10**9))
+
+
+class TestArtifactManifest:
+    """Tests for recording and checking artifacts."""
+
+    def test_record_and_check(self, tmp_path, monkeypatch):
+        data_file = tmp_path / "who.csv.gz"
+        make_who_sample().to_csv(data_file, index=False)
+        manifest_file = tmp_path / "artifacts.json"
+        paths = {"who": data_file}
+
+        manifest = record_artifacts(["who"], paths, manifest_file)
+        entry = manifest["artifacts"]["who"]
+        assert entry["rows"] == 20
+        assert entry["year_range"] == [2000, 2010]
+        assert entry["countries"] == 1
+        assert json.loads(manifest_file.read_text()) == manifest
+        assert artifact_status("who", data_file, manifest) == "current"
+
+        # A new modification time alone is verified by hash, not re-described
+        touch(data_file)
+        assert artifact_status("who", data_file, manifest) == "modified"
+        assert artifact_status("who", data_file, manifest, verify=True) == "current"
+        monkeypatch.setattr(artifacts, "describe_artifact", None)
+        recorded = manifest_file.read_bytes()
+        manifest = record_artifacts(["who"], paths, manifest_file)
+        assert artifact_status("who", data_file, load_manifest(manifest_file)) == "current"
+        assert manifest_file.read_bytes() == recorded
+
+    def test_checkout_mtime(self, tmp_path, monkeypatch, verified_cache):
+        """A file of another modification time is hashed once, then checked by stat."""
+        data_file = tmp_path / "who.csv.gz"
+        make_who_sample().to_csv(data_file, index=False)
+        manifest = record_artifacts(["who"], {"who": data_file}, tmp_path / "artifacts.json")
+        touch(data_file)
+        assert artifact_status("who", data_file, manifest, verify=True) == "current"
+        assert verified_cache.exists()
+
+        monkeypatch.setattr(artifacts, "file_sha256", None)
+        assert artifact_status("who", data_file, manifest) == "current"
+        # Changed contents of the same size are not taken from the cache
+        data_file.write_bytes(data_file.read_bytes().replace(b"Nowhere", b"Nowhare"))
+        assert artifact_status("who", data_file, manifest) == "modified"
+
+    def test_schema_version(self, tmp_path, monkeypatch):
+        data_file = tmp_path / "who.csv.gz"
+        make_who_sample().to_csv(data_file, index=False)
+        manifest = record_artifacts(["who"], {"who": data_file}, tmp_path / "artifacts.json")
+        monkeypatch.setattr(artifacts.SCHEMAS["who"], "VERSION", 99)
+        assert artifact_status("who", data_file, manifest) == "schema"
+
+    def test_missing(self, tmp_path):
+        manifest_file = tmp_path / "artifacts.json"
+        assert artifact_status("ssa", tmp_path / "none.csv", load_manifest(manifest_file)) == (
+            "missing"
+        )
+        assert record_artifacts(["ssa"], {"ssa": tmp_path / "none.csv"}, manifest_file) == {
+            "format": 1,
+            "artifacts": {},
+        }
+
+
+class TestLoaderCache:
+    """Loaders reload when their data file changes."""
+
+    def test_reload_on_change(self, who_sample):
+        query = pd.DataFrame({"country": ["XXX"], "age": [0], "sex": ["M"], "year": [2000]})
+        assert lost_years_who(query)["who_life_expectancy"].iloc[0] == 80.0
+
+        df = make_who_sample()
+        df["life_expectancy"] += 1
+        df.to_csv(who_sample, compression="gzip", index=False)
+        touch(who_sample)
+        assert lost_years_who(query)["who_life_expectancy"].iloc[0] == 81.0
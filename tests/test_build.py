@@ -0,0 +1,123 @@
+"""Tests for the data build pipeline."""
+
+import io
+import json
+import zipfile
+
+import pandas as pd
+import pytest
+
+from lost_years.data.build import Pipeline, Step, save_hld
+from lost_years.data.schemas import load_table
+
+from .conftest import make_hld_sample
+from .test_artifacts import touch
+
+
+def make_raw_who(life_expectancy: float = 80.0) -> pd.DataFrame:
+    """Raw WHO GHO rows as downloaded."""
+    return pd.DataFrame(
+        {
+            "COUNTRY (CODE)": "XXX",
+            "COUNTRY (DISPLAY)": "Testland",
+            "YEAR (CODE)": [2000, 2000, 2010, 2010],
+            "SEX (CODE)": ["SEX_MLE", "SEX_FMLE", "SEX_MLE", "SEX_FMLE"],
+            "AGEGROUP (CODE)": "AGEGROUP_AGELT1",
+            "Numeric": life_expectancy,
+            "Low": life_expectancy - 1,
+            "High": life_expectancy + 1,
+        }
+    )
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    (tmp_path / "who").mkdir()
+    make_raw_who().to_csv(tmp_path / "who" / "who-lt.csv.gz", index=False)
+    return tmp_path
+
+
+class TestPipeline:
+    """Tests for building and caching steps."""
+
+    def test_build_who(self, data_dir):
+        statuses = Pipeline(data_dir=data_dir).run(["who"])
+        assert statuses == dict.fromkeys(
+            ["who.clean", "who.typed", "who.indexed", "who.bundle"], "built"
+        )
+        wdf = load_table("who", data_dir / "who" / "who.csv.gz")
+        assert sorted(wdf["sex"].unique()) == ["FMLE", "MLE"]
+        assert (wdf["life_expectancy"] == 80.0).all()
+        manifest = json.loads((data_dir / "artifacts.json").read_text())
+        assert manifest["artifacts"]["who"]["rows"] == 4
+
+    def test_build_hld(self, tmp_path):
+        """The HLD zip is cleaned into the data directory the pipeline builds."""
+        (tmp_path / "hld").mkdir()
+        with zipfile.ZipFile(tmp_path / "hld" / "hld.zip", "w") as zf:
+            zf.writestr("res", make_hld_sample().to_csv(index=False))
+        assert Pipeline(data_dir=tmp_path).run(["hld"]) == {"hld.bundle": "built"}
+        hdf = load_table("hld", tmp_path / "hld" / "hld.csv.gz")
+        assert len(hdf) == len(make_hld_sample())
+
+    def test_empty_hld_keeps_data(self, tmp_path):
+        """A source without usable rows does not replace the existing file."""
+        path = tmp_path / "hld.csv.gz"
+        save_hld(io.BytesIO(make_hld_sample().to_csv(index=False).encode()), path)
+        before = path.read_bytes()
+        raw = make_hld_sample().assign(**{"e(x)": "."})
+        with pytest.raises(ValueError, match="No HLD records"):
+            save_hld(io.BytesIO(raw.to_csv(index=False).encode()), path)
+        assert path.read_bytes() == before
+        assert list(tmp_path.glob("*-delta-*")) == []
+
+    def test_changed_only(self, data_dir):
+        """A rebuild with unchanged inputs does no work."""
+        Pipeline(data_dir=data_dir).run(["who"])
+        raw = data_dir / "who" / "who-lt.csv.gz"
+        touch(raw)  # Same contents: the key is unchanged
+        statuses = Pipeline(data_dir=data_dir).run(["who"], changed_only=True)
+        assert set(statuses.values()) == {"cached"}
+
+        make_raw_who(81.0).to_csv(raw, index=False)
+        assert set(Pipeline(data_dir=data_dir).run(["who"], dry_run=True).values()) == {
+            "would build"
+        }
+        statuses = Pipeline(data_dir=data_dir).run(["who"], changed_only=True)
+        assert set(statuses.values()) == {"built"}
+        wdf = load_table("who", data_dir / "who" / "who.csv.gz")
+        assert (wdf["life_expectancy"] == 81.0).all()
+        # Replaced intermediate tables are removed
+        assert len(list((data_dir / ".build").glob("who.clean-*.pkl"))) == 1
+
+    def test_modified_output(self, data_dir):
+        """An output changed outside the build is rebuilt."""
+        Pipeline(data_dir=data_dir).run(["who"])
+        (data_dir / "who" / "who.csv.gz").write_bytes(b"")
+        statuses = Pipeline(data_dir=data_dir).run(["who"], changed_only=True)
+        assert statuses["who.indexed"] == "cached"
+        assert statuses["who.bundle"] == "built"
+
+    def test_missing_input(self, tmp_path):
+        statuses = Pipeline(data_dir=tmp_path).run()
+        assert set(statuses.values()) == {"missing input"}
+
+    def test_failed_step(self, data_dir):
+        def fail(inputs, output):
+            raise ValueError("bad input")
+
+        steps = [
+            Step("x.first", ("who/who-lt.csv.gz",), fail),
+            Step("x.second", ("x.first",), fail),
+        ]
+        statuses = Pipeline(steps, data_dir=data_dir).run()
+        assert statuses == {"x.first": "failed", "x.second": "missing input"}
+
+    def test_invalid_graph(self, tmp_path):
+        def run(inputs, output):
+            pass
+
+        with pytest.raises(ValueError, match="cycle"):
+            Pipeline([Step("a.x", ("a.y",), run), Step("a.y", ("a.x",), run)], tmp_path)
+        with pytest.raises(ValueError, match="Unknown build step"):
+            Pipeline(data_dir=tmp_path).run(["xyz"])
@@ -0,0 +1,76 @@
+"""Tests for resolving life expectancy along a chain of sources."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from lost_years import lost_years_fallback, lost_years_hld, lost_years_ssa, lost_years_who
+
+
+@pytest.fixture
+def chain_sample(hld_sample, who_sample):
+    return pd.DataFrame(
+        {
+            "country": ["XXX", "XXX", "usa", "YYY"],
+            "age": [10, 10, 30, 30],
+            "sex": ["M", "M", "F", "F"],
+            "year": [1950, 2000, 2020, 2020],
+        },
+        index=[4, 3, 2, 1],
+    )
+
+
+class TestFallback:
+    """Tests for the fallback chain."""
+
+    def test_chain(self, chain_sample):
+        result = lost_years_fallback(chain_sample, max_year_gap=5)
+        assert list(result.index) == [4, 3, 2, 1]
+        assert list(result["life_expectancy_source"].astype(object).fillna("")) == [
+            "hld",
+            "who",
+            "ssa",
+            "",
+        ]
+        expected = [
+            lost_years_hld(chain_sample.head(1))["hld_life_expectancy"].iloc[0],
+            lost_years_who(chain_sample.iloc[[1]])["who_life_expectancy"].iloc[0],
+            lost_years_ssa(chain_sample.iloc[[2]])["ssa_life_expectancy"].iloc[0],
+            np.nan,
+        ]
+        np.testing.assert_allclose(result["life_expectancy"], expected)
+
+    def test_order_and_options(self, chain_sample):
+        # Without a year limit HLD resolves both XXX rows
+        result = lost_years_fallback(chain_sample, ["who", "hld"])
+        assert list(result["life_expectancy_source"].astype(object).fillna("")) == [
+            "who",
+            "who",
+            "",
+            "",
+        ]
+        discounted = lost_years_fallback(chain_sample, discount_rate=0.03)
+        assert (discounted["discounted_yll"] < discounted["life_expectancy"]).iloc[:3].all()
+        assert "discounted_yll" not in result.columns
+
+    def test_source_options(self, chain_sample):
+        # A WHO only option is not passed on to HLD and SSA
+        result = lost_years_fallback(chain_sample, ["hld", "ssa", "who"], uncertainty=True)
+        assert list(result["life_expectancy_source"].astype(object).fillna("")) == [
+            "hld",
+            "hld",
+            "ssa",
+            "",
+        ]
+        assert "who_low_ci" not in result.columns
+
+    def test_without_country(self):
+        df = pd.DataFrame({"age": [30], "sex": ["M"], "year": [2020]})
+        result = lost_years_fallback(df)
+        assert result["life_expectancy_source"].iloc[0] == "ssa"
+
+    def test_invalid(self, chain_sample):
+        with pytest.raises(ValueError, match="Invalid fallback"):
+            lost_years_fallback(chain_sample, ["who", "who"])
+        with pytest.raises(ValueError, match="Invalid fallback"):
+            lost_years_fallback(chain_sample, ["xyz"])
@@ -0,0 +1,223 @@
+"""Tests for incremental partitioned data file updates."""
+
+import json
+import zipfile
+
+import pandas as pd
+import pytest
+
+from lost_years.data.hld import update_hld_data
+from lost_years.data.incremental import PartitionedWriter, manifest_path, save_incremental
+from lost_years.data.who import update_who_data
+from lost_years.utils import read_csv_blocks
+
+from .conftest import make_hld_sample
+from .test_build import make_raw_who
+
+KEYS = ["country", "year", "sex"]
+
+
+def make_data(years=(2000, 2001)) -> pd.DataFrame:
+    rows = [
+        {"country": country, "year": year, "sex": sex, "age": age, "ex": 70.0 - age}
+        for year in years
+        for country in ["AAA", "BBB"]
+        for sex in ["M", "F"]
+        for age in [0, 1, 5]
+    ]
+    return pd.DataFrame(rows)
+
+
+def read_sorted(path) -> pd.DataFrame:
+    return pd.read_csv(path).sort_values([*KEYS, "age"]).reset_index(drop=True)
+
+
+@pytest.fixture
+def saved(tmp_path):
+    """A data file written once by save_incremental."""
+    path = tmp_path / "data.csv.gz"
+    summary = save_incremental(make_data(), path, KEYS, block_keys=["year"])
+    assert summary["mode"] == "full"
+    return path
+
+
+class TestSaveIncremental:
+    """Tests for save_incremental."""
+
+    def test_round_trip(self, saved):
+        """The partitioned file reads back as an ordinary gzip CSV."""
+        expected = make_data().sort_values([*KEYS, "age"]).reset_index(drop=True)
+        pd.testing.assert_frame_equal(read_sorted(saved), expected)
+        manifest = json.loads(manifest_path(saved).read_text())
+        assert manifest["version"] == 1
+        assert [b["key"] for b in manifest["blocks"]] == ["2000", "2001"]
+
+    def test_unchanged(self, saved):
+        """Identical data does not touch the file."""
+        before = saved.stat().st_mtime_ns
+        summary = save_incremental(make_data(), saved, KEYS, block_keys=["year"])
+        assert summary["mode"] == "unchanged"
+        assert summary["bytes_written"] == 0
+        assert summary["version"] == 1
+        assert saved.stat().st_mtime_ns == before
+
+    def test_append_new_block(self, saved):
+        """A new year is appended without rewriting existing blocks."""
+        size = saved.stat().st_size
+        summary = save_incremental(
+            make_data(years=(2000, 2001, 2002)), saved, KEYS, block_keys=["year"]
+        )
+        assert summary["mode"] == "append"
+        assert summary["added"] == 4
+        assert summary["bytes_written"] == saved.stat().st_size - size
+        assert len(read_sorted(saved)) == len(make_data(years=(2000, 2001, 2002)))
+
+    def test_failed_append(self, saved, monkeypatch):
+        """An append that fails midway leaves the file as it was."""
+        before = saved.read_bytes()
+
+        def failing(writer, blocks):
+            yield writer._compress_block(blocks[0])
+            raise OSError("disk full")
+
+        monkeypatch.setattr(PartitionedWriter, "_compressed_blocks", failing)
+        with pytest.raises(OSError, match="disk full"):
+            save_incremental(make_data(years=(2000, 2001, 2002, 2003)), saved, KEYS, ["year"])
+        assert saved.read_bytes() == before
+
+        monkeypatch.undo()
+        summary = save_incremental(make_data(years=(2000, 2001, 2002)), saved, KEYS, ["year"])
+        assert summary["mode"] == "append"
+
+    def test_changed_partition(self, saved):
+        """Only the changed block is recompressed and the old one kept as a delta."""
+        df = make_data()
+        df.loc[(df.year == 2001) & (df.country == "BBB") & (df.sex == "F"), "ex"] += 1
+        df = df[~((df.year == 2000) & (df.country == "AAA"))]
+        summary = save_incremental(df, saved, KEYS, block_keys=["year"])
+        assert summary["mode"] == "rewrite"
+        assert (summary["changed"], summary["removed"], summary["unchanged"]) == (1, 2, 5)
+        assert summary["blocks_written"] == 2
+        pd.testing.assert_frame_equal(
+            read_sorted(saved), df.sort_values([*KEYS, "age"]).reset_index(drop=True)
+        )
+
+        delta = pd.read_csv(saved.with_name(summary["delta"]))
+        assert sorted(delta.year.unique()) == [2000, 2001]
+        history = json.loads(manifest_path(saved).read_text())["history"]
+        assert history[-1]["changed"] == ["BBB|2001|F"]
+        assert history[-1]["version"] == 2
+
+    def test_unmanaged_file_kept_as_base(self, tmp_path):
+        """A file written without a manifest is kept once as the base backup."""
+        path = tmp_path / "data.csv.gz"
+        make_data().to_csv(path, index=False, compression="gzip")
+        summary = save_incremental(make_data(), path, KEYS)
+        assert summary["delta"] == "data-base.csv.gz"
+        assert (tmp_path / "data-base.csv.gz").exists()
+
+    def test_chunks_keep_partitions_together(self, tmp_path):
+        """Rows of a partition split across chunks are written contiguously."""
+        df = make_data()
+        path = tmp_path / "data.csv.gz"
+        with PartitionedWriter(path, KEYS, ["year"]) as writer:
+            # Interleave partitions across chunk boundaries
+            for chunk in [df.iloc[::2], df.iloc[1::2]]:
+                writer.write(chunk)
+        assert writer.rows == len(df)
+        result = pd.read_csv(path)
+        keys = result[KEYS].astype(str).agg("|".join, axis=1)
+        assert (keys != keys.shift()).sum() == keys.nunique()
+
+
+class TestParallelBlocks:
+    """Tests for parallel block compression and reading."""
+
+    def test_workers_do_not_change_output(self, tmp_path):
+        """Compressing blocks in threads writes the same bytes."""
+        data = make_data(years=range(2000, 2010))
+        serial, parallel = tmp_path / "serial.csv.gz", tmp_path / "parallel.csv.gz"
+        save_incremental(data, serial, KEYS, block_keys=["year"], workers=1)
+        save_incremental(data, parallel, KEYS, block_keys=["year"], workers=4)
+        assert serial.read_bytes() == parallel.read_bytes()
+
+        data.loc[data["year"] == 2003, "ex"] += 1
+        save_incremental(data, serial, KEYS, block_keys=["year"], workers=1)
+        save_incremental(data, parallel, KEYS, block_keys=["year"], workers=4)
+        assert serial.read_bytes() == parallel.read_bytes()
+
+    def test_read_csv_blocks(self, saved):
+        """Reading blocks in parallel matches a single read."""
+        expected = pd.read_csv(saved, usecols=["country", "age", "ex"])
+        result = read_csv_blocks(saved, workers=2, usecols=["country", "age", "ex"])
+        pd.testing.assert_frame_equal(result, expected)
+
+    def test_mixed_types_across_blocks(self, tmp_path):
+        """A column that is text in only some blocks reads back as text."""
+        data = make_data()
+        data["note"] = data["year"].map({2000: "1", 2001: "x"})
+        path = tmp_path / "data.csv.gz"
+        save_incremental(data, path, KEYS, block_keys=["year"])
+        pd.testing.assert_frame_equal(read_csv_blocks(path), pd.read_csv(path))
+
+    def test_stale_manifest_ignored(self, saved):
+        """A file changed behind the manifest's back is read whole."""
+        data = make_data(years=[2005])
+        data.to_csv(saved, index=False, compression="gzip")
+        pd.testing.assert_frame_equal(read_csv_blocks(saved), data)
+
+
+class TestHLDIngestion:
+    """Tests for streaming HLD ingestion from the zip file."""
+
+    def test_stream_from_zip(self, tmp_path, monkeypatch):
+        """The raw file is cleaned chunk by chunk straight from the zip."""
+        monkeypatch.setattr(update_hld_data, "DATA_DIR", tmp_path)
+        raw = make_hld_sample().astype(str)
+        # Rows missing the life expectancy or the age are dropped
+        raw.loc[raw.index[-1], "e(x)"] = "."
+        raw.loc[3, "Age"] = ""
+        zip_path = tmp_path / "hld.zip"
+        with zipfile.ZipFile(zip_path, "w") as zf:
+            zf.writestr("res", raw.to_csv(index=False))
+
+        updater = update_hld_data.HLDDataUpdater()
+        with zipfile.ZipFile(zip_path) as zf, zf.open("res") as f:
+            assert updater.clean_and_save_hld_data(f, chunk_size=7)
+        assert not (tmp_path / "res").exists()
+
+        result = pd.read_csv(tmp_path / "hld.csv.gz")
+        assert len(result) == len(raw) - 2
+        assert result[["e(x)", "Age"]].notna().all().all()
+        assert result["Sex"].dtype == "int64"
+        assert result["Age"].dtype == "int64"
+        # Tables stay contiguous and in their original row order
+        expected = make_hld_sample().drop(index=[3, raw.index[-1]])
+        for col in ["Ref-ID", "Version", "Age"]:
+            assert result.sort_values(["Sex", "Year1"], kind="stable")[col].tolist() == (
+                expected.sort_values(["Sex", "Year1"], kind="stable")[col].tolist()
+            )
+
+        # Reprocessing the same zip finds nothing to rewrite
+        assert updater.process_hld_zip(zip_path)
+        manifest = json.loads((tmp_path / "hld.manifest.json").read_text())
+        assert manifest["version"] == 1
+
+
+class TestWHOUpdate:
+    """Tests for saving updated WHO data."""
+
+    def test_unchanged_data_not_rewritten(self, tmp_path, monkeypatch):
+        """Neither the clean nor the raw file is rewritten for the same data."""
+        monkeypatch.setattr(update_who_data, "DATA_DIR", tmp_path)
+        raw = make_raw_who()
+        updater = update_who_data.WHODataUpdater()
+        assert updater.save_who_data(raw)
+        files = [tmp_path / "who-lt.csv.gz", tmp_path / "who.csv.gz"]
+        before = [path.stat().st_mtime_ns for path in files]
+
+        assert updater.save_who_data(raw)
+        assert [path.stat().st_mtime_ns for path in files] == before
+
+        assert updater.save_who_data(make_raw_who(81.0))
+        assert pd.read_csv(files[0])["Numeric"].eq(81.0).all()
@@ -0,0 +1,291 @@
+"""Tests for vectorized life table construction."""
+
+from importlib.resources import files
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from lost_years import (
+    cohort_life_expectancy_hld,
+    lost_years_hld,
+    lost_years_ssa,
+    lost_years_who,
+    survival_hld,
+    survival_ssa,
+)
+from lost_years.lifetable import (
+    SurvivalCurves,
+    discounted_life_expectancy,
+    discounted_years,
+    indexed_discounted_life_expectancy,
+    life_table,
+    life_tables,
+)
+from lost_years.matching import LifeTableIndex
+
+from .conftest import make_hld_sample
+
+SSA_DATA = files("lost_years") / "data" / "ssa" / "ssa.csv"
+
+
+@pytest.fixture(scope="module")
+def ssa():
+    return pd.read_csv(SSA_DATA)
+
+
+class TestLifeTable:
+    """Tests for building life tables from one mortality column."""
+
+    def test_ssa_life_expectancy(self, ssa):
+        """Published SSA life expectancy is recovered from q(x) up to rounding."""
+        for sex in ["male", "female"]:
+            table = life_table(ssa["age"], qx=ssa[f"{sex}_death_prob"])
+            assert table.ex.shape == (1, len(ssa))
+            np.testing.assert_allclose(table.ex[0], ssa[f"{sex}_life_expectancy"], atol=0.006)
+            np.testing.assert_allclose(table.lx[0], ssa[f"{sex}_n_lives"], atol=1)
+
+    def test_columns_agree(self, ssa):
+        """Tables built from q(x), l(x) and m(x) of the same mortality agree."""
+        table = life_table(ssa["age"], qx=ssa["male_death_prob"])
+        from_lx = life_table(ssa["age"], lx=table.lx)
+        from_mx = life_table(ssa["age"], mx=table.dx / table.Lx)
+        np.testing.assert_allclose(from_lx.ex, table.ex)
+        np.testing.assert_allclose(from_mx.ex, table.ex)
+        assert table.Tx[0, 0] == pytest.approx(table.Lx.sum())
+
+    def test_many_tables(self):
+        """Rows are tables; shorter tables end early and are NaN-padded."""
+        qx = np.array([[0.1, 0.2, 0.5, 1.0], [0.1, 0.2, np.nan, np.nan]])
+        table = life_table([0, 1, 2, 3], qx=qx, radix=1.0)
+        np.testing.assert_allclose(table.lx[0], [1.0, 0.9, 0.72, 0.36])
+        # The second table's open interval starts at age 1: q is 1
+        np.testing.assert_allclose(table.qx[1, :2], [0.1, 1.0])
+        assert np.isnan(table.ex[1, 2:]).all()
+        assert table.ex[1, 1] == pytest.approx(0.5)
+        assert table.ex[1, 0] == pytest.approx(0.9 + 0.05 + 0.9 * 0.5)
+
+    def test_invalid(self):
+        with pytest.raises(ValueError, match="exactly one"):
+            life_table([0, 1], qx=[0.1, 1], mx=[0.1, 1])
+        with pytest.raises(ValueError, match="3 ages"):
+            life_table([0, 1], qx=[0.1, 0.2, 1])
+        with pytest.raises(ValueError, match="increasing"):
+            life_table([0, 0], qx=[0.1, 1])
+
+
+class TestLifeTables:
+    """Tests for building life tables from long data."""
+
+    def test_mixed_age_grids(self, ssa):
+        """Complete and abridged tables are built together."""
+        complete = ssa.assign(table=1, q=ssa["male_death_prob"])
+        abridged = pd.DataFrame({"table": 0, "age": [0, 1, 5], "q": [0.01, 0.02, 1.0]})
+        df = pd.concat([complete, abridged])[["table", "age", "q"]]
+        result = life_tables(df, "q", by=["table"])
+        assert len(result) == len(df)
+        assert list(result["table"].unique()) == [0, 1]
+
+        single = life_tables(df[df["table"] == 1], "q")
+        np.testing.assert_allclose(result.loc[result["table"] == 1, "ex"], single["ex"])
+        short = result[result["table"] == 0]
+        assert list(short["age"]) == [0, 1, 5]
+        assert short["ex"].iloc[-1] == pytest.approx(2.0)  # Half of the 4 year interval
+
+    def test_duplicate_ages(self):
+        df = pd.DataFrame({"age": [0, 0], "q": [0.1, 1.0]})
+        with pytest.raises(ValueError, match="repeat"):
+            life_tables(df, "q")
+
+
+class TestSurvivalCurves:
+    """Tests for survival and expected age at death queries."""
+
+    @pytest.fixture
+    def curves(self):
+        # Two tables: halving survivors per year, and a single open interval
+        return SurvivalCurves([0, 0, 0, 1], [0, 1, 2, 0], [100, 50, 25, 10], [1.5, 1.0, 2.0, 4.0])
+
+    def test_survival(self, curves):
+        tables = np.array([0, 0, 0, 0, 1, -1])
+        p = curves.survival(tables, [0, 0, 2, 1, 0, 0], [1, 1.5, 4, 0.5, 4, 1])
+        expected = [0.5, 0.5**1.5, np.exp(-1), np.nan, np.exp(-1), np.nan]
+        np.testing.assert_allclose(p, expected)
+
+    def test_expected_age_at_death(self, curves):
+        tables = np.array([0, 0, 0, 1, 0])
+        result = curves.expected_age_at_death(tables, [0, 2, 3, 5, -1])
+        # The open interval is memoryless
+        np.testing.assert_allclose(result, [1.5, 4.0, 5.0, 9.0, np.nan])
+        # Within an interval: T(x) less the years lived since x, per survivor
+        half = curves.expected_age_at_death(np.array([0]), [0.5])[0]
+        lived = (1 - np.sqrt(0.5)) / np.log(2)
+        assert half == pytest.approx(0.5 + (1.5 - lived) / np.sqrt(0.5))
+
+
+class TestSurvivalQueries:
+    """Tests for survival queries against the packaged data."""
+
+    def test_ssa(self, ssa):
+        df = pd.DataFrame(
+            {"age": [30, 30], "sex": ["M", "F"], "year": [2022, 2022], "to_age": [65, 65]}
+        )
+        result = survival_ssa(df, to_age="to_age")
+        ssa = ssa.set_index("age")
+        for row, sex in zip(result.itertuples(), ["male", "female"], strict=True):
+            lives = ssa[f"{sex}_n_lives"]
+            assert row.ssa_survival == pytest.approx(lives[65] / lives[30])
+            assert row.ssa_expected_age_at_death == pytest.approx(
+                30 + ssa.loc[30, f"{sex}_life_expectancy"]
+            )
+        assert "ssa_survival" not in survival_ssa(df).columns
+
+    def test_hld(self, hld_sample):
+        df = make_hld_sample()
+        df["l(x)"] = 100_000.0 * 0.99 ** df["Age"]
+        df.to_csv(hld_sample, compression="gzip", index=False)
+        query = pd.DataFrame(
+            {"country": "XXX", "sex": ["M", "F"], "age": [10, 10], "year": 1950, "to_age": 20}
+        )
+        result = survival_hld(query, to_age="to_age")
+        np.testing.assert_allclose(result["hld_survival"], 0.99**10)
+        # Female 1950 e(x) is 75 - age
+        assert result["hld_expected_age_at_death"].iloc[1] == pytest.approx(75.0)
+
+
+class TestDiscounting:
+    """Tests for discounted and age-weighted years of life lost."""
+
+    def test_table_values(self, ssa):
+        codes = np.zeros(len(ssa), dtype=np.intp)
+        args = (codes, ssa["age"], ssa["male_n_lives"], ssa["male_life_expectancy"])
+        # Neither discounted nor weighted: the table's own e(x)
+        np.testing.assert_allclose(
+            discounted_life_expectancy(*args), ssa["male_life_expectancy"], atol=1e-9
+        )
+        discounted = discounted_life_expectancy(*args, discount_rate=0.03)
+        assert (discounted <= ssa["male_life_expectancy"] + 1e-9).all()
+        assert discounted[0] == pytest.approx(29.6, abs=0.5)
+
+    def test_cached_on_index(self, ssa):
+        index = LifeTableIndex(ssa, [])
+        args = ("male_n_lives", "male_life_expectancy", 0.03)
+        values = indexed_discounted_life_expectancy(index, *args)
+        np.testing.assert_allclose(
+            values,
+            discounted_life_expectancy(
+                index.table_codes,
+                ssa["age"],
+                ssa["male_n_lives"],
+                ssa["male_life_expectancy"],
+                0.03,
+            ),
+        )
+        assert indexed_discounted_life_expectancy(index, *args) is values
+        assert indexed_discounted_life_expectancy(index, *args, age_weighting=1.0) is not values
+
+    def test_constant_hazard(self):
+        """With a constant force of mortality the discounted value is 1 / (r + mu)."""
+        ages = np.arange(0, 300.0)
+        mu = 0.05
+        values = discounted_life_expectancy(
+            np.zeros(len(ages), dtype=np.intp),
+            ages,
+            np.exp(-mu * ages),
+            np.full(len(ages), 1 / mu),
+            discount_rate=0.03,
+        )
+        np.testing.assert_allclose(values[:50], 1 / (np.log(1.03) + mu), rtol=1e-3)
+
+    def test_closed_form(self):
+        np.testing.assert_allclose(discounted_years([30], [20]), [20])
+        r = np.log(1.03)
+        np.testing.assert_allclose(discounted_years([30], [20], 0.03), [(1 - np.exp(-20 * r)) / r])
+        # Full age weighting favours young adult years
+        weighted = discounted_years([20, 70], [10, 10], 0.0, 1.0)
+        assert weighted[0] > 10 > weighted[1]
+
+    def test_lookup_columns(self, who_sample):
+        df = pd.DataFrame({"country": "XXX", "age": [30, 30], "sex": ["M", "F"], "year": 2000})
+        assert "who_discounted_yll" not in lost_years_who(df).columns
+        result = lost_years_who(df, discount_rate=0.03, age_weighting=1.0)
+        np.testing.assert_allclose(
+            result["who_discounted_yll"],
+            discounted_years(df["age"], result["who_life_expectancy"], 0.03, 1.0),
+        )
+        ssa = lost_years_ssa(df, discount_rate=0.03)
+        assert (ssa["ssa_discounted_yll"] < ssa["ssa_life_expectancy"]).all()
+
+
+class TestCohorts:
+    """Tests for HLD cohort life expectancy."""
+
+    @staticmethod
+    def rate(age, year):
+        return 0.01 + 0.002 * age + 0.0005 * (year - 1950)
+
+    @pytest.fixture
+    def cohort_sample(self, hld_sample):
+        """Complete period tables for 1950-2000, ages 0-40, from a known m(x)."""
+        ages = np.arange(41)
+        df = pd.DataFrame(
+            [
+                {"Country": "XXX", "Year1": year, "Year2": year, "Sex": sex, "Age": age}
+                for sex in [1, 2]
+                for year in range(1950, 2001)
+                for age in ages
+            ]
+        )
+        df["AgeInt"] = np.where(df["Age"] == 40, 99, 1)
+        df["e(x)"] = 10.0
+        df["m(x)"] = self.rate(df["Age"], df["Year1"]) + (df["Sex"] - 1) * 0.001
+        df.to_csv(hld_sample, compression="gzip", index=False)
+        return df
+
+    def expected(self, birth_year, sex=1):
+        ages = np.arange(41)
+        mx = self.rate(ages, birth_year + ages) + (sex - 1) * 0.001
+        return life_table(ages, mx=mx).ex[0]
+
+    def test_diagonals(self, cohort_sample):
+        result = cohort_life_expectancy_hld()
+        assert list(result.columns) == ["country", "sex", "cohort", "age", "life_expectancy"]
+        # Cohorts observed through age 40 by 2000
+        assert result["cohort"].max() == 1960
+        born = result[(result["cohort"] == 1955) & (result["sex"] == "F")]
+        np.testing.assert_allclose(born["life_expectancy"], self.expected(1955, sex=2))
+
+        # Born before 1950: known from the age reached in 1950 on
+        early = result[(result["cohort"] == 1930) & (result["sex"] == "M")]
+        assert early["age"].min() == 20
+        ages = np.arange(20, 41)
+        tail = life_table(ages, mx=self.rate(ages, 1930 + ages)).ex[0]
+        np.testing.assert_allclose(early["life_expectancy"], tail)
+        assert result["cohort"].min() == 1910
+
+    def test_lookup(self, cohort_sample):
+        df = pd.DataFrame({"country": "XXX", "age": [0, 20], "sex": "M", "year": [1955, 1950]})
+        result = lost_years_hld(df, cohort=True)
+        assert list(result["hld_cohort"]) == [1955, 1930]
+        assert "hld_year" not in result.columns
+        assert result["hld_life_expectancy"].iloc[0] == pytest.approx(self.expected(1955)[0])
+        period = lost_years_hld(df)
+        assert period["hld_life_expectancy"].iloc[0] == 10.0
+
+    def test_abridged(self, hld_sample):
+        """Rates of an age interval apply to each of its ages; q(x) stands in for m(x)."""
+        ages = [0, 1, 5, 10]
+        df = pd.DataFrame(
+            [{"Country": "XXX", "Year1": 1900, "Year2": 2000, "Sex": 1, "Age": age} for age in ages]
+        )
+        df["AgeInt"] = [1, 4, 5, 99]
+        m = np.array([0.02, 0.01, 0.005, 0.1])
+        n = np.array([1.0, 4.0, 5.0, np.nan])
+        df["q(x)"] = n * m / (1 + n * m / 2)
+        df["m(x)"] = [np.nan, np.nan, np.nan, 0.1]
+        df["e(x)"] = 10.0
+        df.to_csv(hld_sample, compression="gzip", index=False)
+        result = cohort_life_expectancy_hld()
+        born = result[result["cohort"] == 1950]
+        expected = life_table(np.arange(11), mx=np.repeat(m, [1, 4, 5, 1])).ex[0]
+        np.testing.assert_allclose(born["life_expectancy"], expected)
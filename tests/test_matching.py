@@ -0,0 +1,124 @@
+"""Tests for matching module."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from lost_years.matching import (
+    GRID_WEIGHTINGS,
+    AgeYearGrid,
+    LifeTableIndex,
+    SpanIndex,
+    iter_groups,
+)
+
+
+class TestAgeYearGrid:
+    """Test joint nearest (age, year) matching."""
+
+    def test_matches_brute_force(self):
+        """Grid lookups agree with an exhaustive weighted L1 search."""
+        rng = np.random.default_rng(0)
+        for _ in range(50):
+            n = rng.integers(1, 30)
+            ages = rng.integers(0, 30, n)
+            years = rng.integers(1900, 1960, n)
+            age_weight, year_weight = rng.uniform(0.1, 3.0, 2)
+            grid = AgeYearGrid(ages, years, age_weight, year_weight)
+
+            q_ages = rng.integers(-5, 40, 100)
+            q_years = rng.integers(1890, 1970, 100)
+            found = grid.query(q_ages, q_years)
+
+            dist = age_weight * np.abs(q_ages[:, None] - ages) + year_weight * np.abs(
+                q_years[:, None] - years
+            )
+            assert np.allclose(dist[np.arange(100), found], dist.min(axis=1))
+
+    def test_duplicate_points_prefer_first(self):
+        """The earliest of several identical points is returned."""
+        grid = AgeYearGrid(np.array([10, 10, 20]), np.array([2000, 2000, 2000]))
+        assert grid.query(np.array([11.0]), np.array([2001.0])).tolist() == [0]
+
+
+class TestGridCache:
+    """Test the bounded cache of joint age/year grids."""
+
+    def test_weightings_evicted(self):
+        table = pd.DataFrame(
+            {"g": ["a", "a", "b"], "age": [0.0, 5.0, 0.0], "year": [2000.0, 2000.0, 2001.0]}
+        )
+        index = LifeTableIndex(table, ["g"])
+        groups = np.array([0, 1])
+        for weight in range(1, GRID_WEIGHTINGS + 3):
+            rows = index.lookup(groups, np.array([4.0, 1.0]), np.array([2000.0, 2000.0]), weight)
+            assert rows.tolist() == [1, 2]
+        assert len(index._grids) == GRID_WEIGHTINGS
+        assert list(index._grids)[-1] == (GRID_WEIGHTINGS + 2, 1.0)
+        assert all(len(grids) == 2 for grids in index._grids.values())
+
+
+class TestSpanIndex:
+    """Test containment lookup over year spans and age intervals."""
+
+    def test_overlapping_spans(self):
+        """The narrowest containing span wins and age intervals are respected."""
+        # Group 0: table 0 spans 1900-1960, table 1 spans 1950-1951; group 1: table 2
+        group_codes = np.array([0, 0, 0, 0, 1])
+        table_codes = np.array([0, 0, 1, 1, 2])
+        year_starts = np.array([1900.0, 1900, 1950, 1950, 1950])
+        year_ends = np.array([1961.0, 1961, 1952, 1952, 1951])
+        age_starts = np.array([0.0, 50, 0, 50, 0])
+        age_ends = np.array([50.0, np.inf, 50, np.inf, 10])
+        index = SpanIndex(group_codes, table_codes, year_starts, year_ends, age_starts, age_ends)
+
+        found = index.query(
+            np.array([0, 0, 0, 0, 1, 1, -1]),
+            np.array([10.0, 60, 10, 10, 5, 20, 5]),
+            np.array([1955.0, 1951, 1951.5, 1962, 1950, 1950, 1950]),
+        )
+        assert found.tolist() == [0, 3, 2, -1, 4, -1, -1]
+
+
+class TestTrendFactors:
+    """Test log-linear projection past the last year of a group."""
+
+    @pytest.fixture
+    def index(self):
+        years = np.arange(2000, 2020)
+        # Group a falls 2% a year until 2009 and 1% after; group b is flat
+        falling = np.where(years < 2009, -0.02 * (years - 2009), -0.01 * (years - 2009))
+        table = pd.concat(
+            [
+                pd.DataFrame(
+                    {"group": "a", "age": 0, "year": years, "value": 50 * np.exp(falling)}
+                ),
+                pd.DataFrame({"group": "b", "age": 0, "year": years[:15], "value": 40.0}),
+            ]
+        )
+        return LifeTableIndex(table, ["group"])
+
+    def test_factors(self, index):
+        group_ids = index.group_ids([pd.Series(["a", "a", "b", "a"])])
+        ages = np.zeros(4)
+        years = np.array([2025.0, 2015, 2030, 2025])
+        rows = index.lookup(group_ids, ages, years)
+        rows[3] = -1
+        factors = index.trend_factors("value", rows, years)
+        # Fitted to 2009-2019 only, from the last year of the group
+        np.testing.assert_allclose(factors, [np.exp(-0.01 * 6), 1.0, 1.0, 1.0])
+        projected = index.table["value"].to_numpy()[rows[0]] * factors[0]
+        assert projected == pytest.approx(50 * np.exp(-0.01 * 16))
+
+    def test_window(self, index):
+        rows = index.lookup(np.array([0]), np.zeros(1), np.array([2021.0]))
+        factors = index.trend_factors("value", rows, np.array([2021.0]), window=20)
+        assert factors[0] < np.exp(-0.01 * 2)
+
+
+def test_iter_groups():
+    """Positions are split by code and negative codes are skipped."""
+    groups = dict(iter_groups(np.array([2, -1, 0, 2, 0])))
+    assert sorted(groups) == [0, 2]
+    assert groups[0].tolist() == [2, 4]
+    assert groups[2].tolist() == [0, 3]
@@ -0,0 +1,116 @@
+"""Tests for data schema validation."""
+
+import pandas as pd
+
+from lost_years.data.schemas import HLDSchema, SSASchema, load_table, validate_data_file
+
+from .conftest import make_hld_sample
+
+
+def make_ssa_sample() -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "age": range(120),
+            "male_death_prob": 0.01,
+            "male_n_lives": 1000.0,
+            "male_life_expectancy": 50.0,
+            "female_death_prob": 0.01,
+            "female_n_lives": 1000.0,
+            "female_life_expectancy": 55.0,
+            "year": 2022,
+        }
+    )
+
+
+class TestSchemaValidation:
+    """Tests for streaming schema validation."""
+
+    def test_valid(self):
+        result = SSASchema.validate(make_ssa_sample())
+        assert result["valid"]
+        assert result["row_count"] == 120
+        assert result["invalid_counts"] == {}
+
+    def test_bounded_samples(self):
+        """Every offending row is counted but only a few are kept."""
+        df = make_ssa_sample()
+        df.loc[::2, "age"] = 150
+        df["year"] = df["year"].astype(object)
+        df.loc[3, "year"] = "unknown"
+        result = SSASchema.validate(df, max_samples=3)
+        assert not result["valid"]
+        assert result["invalid_counts"] == {"Invalid ages": 60, "Invalid years": 1}
+        assert [s["row"] for s in result["samples"]["Invalid ages"]] == [1, 3, 5]
+        assert result["samples"]["Invalid years"][0]["year"] == "unknown"
+        assert "Invalid ages: 60 rows, e.g. [150]" in result["issues"]
+
+    def test_chunked_file(self, tmp_path):
+        """Validating in chunks gives the same result as a single chunk."""
+        df = make_hld_sample()
+        df.loc[df["Age"] == 40, "e(x)"] = -1.0
+        df.loc[5, "Sex"] = 3
+        path = tmp_path / "hld.csv.gz"
+        df.to_csv(path, index=False)
+
+        result = validate_data_file("hld", str(path), chunk_size=7)
+        assert result == HLDSchema.validate(df)
+        assert result["row_count"] == len(df)
+        assert result["invalid_counts"] == {
+            "Invalid sex codes": 1,
+            "Invalid life expectancy values": (~df["e(x)"].between(0, 100)).sum(),
+        }
+        assert result["samples"]["Invalid sex codes"][0]["row"] == 6
+        assert result["countries"] == 1
+        assert result["years"] == [1950, 1951, 1990]
+
+    def test_unknown_source(self, tmp_path):
+        result = validate_data_file("xyz", str(tmp_path / "data.csv"))
+        assert result == {"valid": False, "issues": ["Unknown source: xyz"]}
+
+
+class TestLoadTable:
+    """Tests for schema-driven loading."""
+
+    def test_hld_layout(self, tmp_path):
+        """HLD data is parsed into final names and types in one pass."""
+        df = make_hld_sample().drop(columns=["Region", "Version"])
+        df["e(x)"] = df["e(x)"].astype(object)
+        df.loc[0, "e(x)"] = "."
+        df.loc[1, "Ref-ID"] = None
+        path = tmp_path / "hld.csv.gz"
+        df.to_csv(path, index=False)
+
+        hdf = load_table("hld", path, engine="c")
+        assert len(hdf) == len(df) - 1
+        assert hdf["year"].dtype == "int32"
+        assert hdf["life_expectancy"].dtype == "float64"
+        assert (hdf["region"] == 0).all()
+        assert (hdf["version"] == 1).all()
+        assert hdf.loc[1, "source"] == ""
+        assert "Year1" not in hdf.columns
+
+    def test_missing_required_integers(self, tmp_path):
+        """Rows missing an integer key are dropped; the column stays int32."""
+        df = make_hld_sample()
+        df["Age"] = df["Age"].astype(object)
+        df.loc[3, "Age"] = None
+        df.loc[4, "Age"] = "."
+        df["Year1"] = df["Year1"].astype(object)
+        df.loc[5, "Year1"] = None
+        path = tmp_path / "hld.csv.gz"
+        df.to_csv(path, index=False)
+
+        hdf = load_table("hld", path)
+        assert len(hdf) == len(df) - 3
+        assert hdf["age"].dtype == "int32"
+        assert hdf["year"].dtype == "int32"
+        assert hdf["sex"].dtype == "int32"
+
+    def test_who_default_age_group(self, tmp_path):
+        """WHO files without age groups hold life expectancy at birth."""
+        path = tmp_path / "who.csv"
+        path.write_text("country_code,year,sex_code,life_expectancy\nUSA,2000,MLE,74.1\n")
+        wdf = load_table("who", path)
+        assert list(wdf["age_group"]) == ["AGELT1"]
+        assert wdf["age_group"].dtype == "category"
+        assert {"country", "sex"} <= set(wdf.columns)
@@ -0,0 +1,84 @@
+"""Tests for the master data updater."""
+
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("bs4")
+
+from lost_years.data import update_all_data  # noqa: E402
+from lost_years.data.update_all_data import SOURCES, MasterDataUpdater  # noqa: E402
+
+
+class FakeSession:
+    def __init__(self):
+        self.closed = threading.Event()
+
+    def close(self):
+        self.closed.set()
+
+
+def make_updater(method, delay, success=True, error=None):
+    """Build an updater class whose update method sleeps for `delay` seconds."""
+
+    class FakeUpdater:
+        instances = []
+
+        def __init__(self):
+            self.session = FakeSession()
+            FakeUpdater.instances.append(self)
+
+        def update(self):
+            # Return early once the session is closed, like an aborted request
+            self.session.closed.wait(delay)
+            if error is not None:
+                raise error
+            return success
+
+    setattr(FakeUpdater, method, FakeUpdater.update)
+    return FakeUpdater
+
+
+@pytest.fixture
+def fake_sources(monkeypatch, tmp_path):
+    """Replace the real updaters with fast, slow and failing fakes."""
+    updaters = {
+        "who": make_updater("update_who_data", 0.2),
+        "ssa": make_updater("update_ssa_data", 5.0),
+        "hld": make_updater("update_hld_data", 0.2, error=RuntimeError("boom")),
+    }
+    for source, updater in updaters.items():
+        monkeypatch.setitem(SOURCES[source], "updater", updater)
+        monkeypatch.setitem(SOURCES[source], "data_dir", tmp_path)
+    recorded = updaters["recorded"] = []
+    monkeypatch.setattr(update_all_data, "record_artifacts", recorded.extend)
+    return updaters
+
+
+class TestMasterDataUpdater:
+    """Tests for concurrent updates."""
+
+    def test_concurrent_with_timeout(self, fake_sources):
+        """Sources run concurrently and a hung source is cancelled."""
+        updater = MasterDataUpdater(timeouts={"ssa": 0.5})
+        started = time.monotonic()
+        assert updater.update_all() is False
+        assert time.monotonic() - started < 2.0
+
+        results = updater.summary()["sources"]
+        assert list(results) == ["WHO", "SSA", "HLD"]
+        assert results["WHO"]["status"] == "success"
+        assert results["SSA"]["status"] == "timeout"
+        assert results["HLD"]["status"] == "error"
+        assert results["HLD"]["message"] == "Error: boom"
+        assert fake_sources["ssa"].instances[0].session.closed.is_set()
+        assert all(result["duration"] >= 0 for result in results.values())
+        assert fake_sources["recorded"] == ["who"]
+
+    def test_written_bytes(self, tmp_path):
+        """Only files modified since the start are counted."""
+        (tmp_path / "old.csv").write_bytes(b"x" * 10)
+        since = time.time() + 1
+        assert update_all_data.written_bytes(tmp_path, since) == 0
+        assert update_all_data.written_bytes(tmp_path, 0) == 10
@@ -1,14 +1,96 @@
 """Tests for utils module."""
 
+import hashlib
 import logging
-import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
-from unittest.mock import Mock, patch
 
 import numpy as np
 import pandas as pd
-
-from lost_years.utils import closest, column_exists, download_file, fixup_columns, isstring
+import pytest
+import requests
+
+from lost_years.utils import (
+    CachedSession,
+    closest,
+    column_exists,
+    decimal_year,
+    download_file,
+    exact_age,
+    file_sha256,
+    fixup_columns,
+    isstring,
+    read_csv,
+    read_sha256_manifest,
+    resolve_engine,
+)
+
+PAYLOAD = bytes(range(256)) * 4096  # 1 MiB
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Serve PAYLOAD with Range support and scripted failures."""
+
+    # Failures to inject, consumed one per request: "truncate", "error", "missing"
+    failures: list[str] = []
+    ranges: list[str | None] = []
+    etag = '"v1"'
+    conditions: list[str | None] = []
+
+    def do_GET(self):
+        self.ranges.append(self.headers.get("Range"))
+        self.conditions.append(self.headers.get("If-None-Match"))
+        if self.headers.get("If-None-Match") == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        failure = self.failures.pop(0) if self.failures else None
+        if failure == "missing":
+            self.send_error(404)
+            return
+        if failure == "error":
+            self.send_error(503)
+            return
+        start = 0
+        if self.headers.get("Range"):
+            start = int(self.headers["Range"].removeprefix("bytes=").rstrip("-"))
+            if start >= len(PAYLOAD):
+                self.send_error(416)
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(PAYLOAD) - 1}/{len(PAYLOAD)}")
+        else:
+            self.send_response(200)
+        body = PAYLOAD[start:]
+        self.send_header("ETag", self.etag)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if failure == "truncate":
+            # Drop the connection half way through the body
+            self.wfile.write(body[: len(body) // 2])
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stand_in_server():
+    """Run a local HTTP server serving PAYLOAD at /data.bin."""
+    StandInHandler.failures = []
+    StandInHandler.ranges = []
+    StandInHandler.etag = '"v1"'
+    StandInHandler.conditions = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/data.bin"
+    server.shutdown()
+    server.server_close()
 
 
 class TestUtilFunctions:
@@ -101,74 +183,151 @@ class TestUtilFunctions:
         lst = [1.0, 2.0, 3.0]
         assert closest(lst, 2.0) == 2.0
 
-    @patch("lost_years.utils.requests.get")
-    def test_download_file_default_path(self, mock_get):
-        """Test download_file with default path."""
-        # Mock response
-        mock_response = Mock()
-        mock_response.iter_content.return_value = [b"chunk1", b"chunk2"]
-        mock_get.return_value = mock_response
-
-        with tempfile.TemporaryDirectory() as tmpdir:
-            original_cwd = Path.cwd()
-            try:
-                # Change to temp directory for test
-                import os
-
-                os.chdir(tmpdir)
-
-                download_file("https://example.com/file.txt")
-
-                # Check file was created
-                assert Path("file.txt").exists()
-
-                # Check content
-                content = Path("file.txt").read_bytes()
-                assert content == b"chunk1chunk2"
-
-            finally:
-                os.chdir(original_cwd)
-
-    @patch("lost_years.utils.requests.get")
-    def test_download_file_custom_path(self, mock_get):
-        """Test download_file with custom path."""
-        # Mock response
-        mock_response = Mock()
-        mock_response.iter_content.return_value = [b"test data"]
-        mock_get.return_value = mock_response
-
-        with tempfile.NamedTemporaryFile(delete=False) as tmp:
-            custom_path = tmp.name
-
-        try:
-            download_file("https://example.com/file.txt", custom_path)
-
-            # Check file exists and has correct content
-            assert Path(custom_path).exists()
-            content = Path(custom_path).read_bytes()
-            assert content == b"test data"
-
-        finally:
-            Path(custom_path).unlink(missing_ok=True)
-
-    @patch("lost_years.utils.requests.get")
-    def test_download_file_path_object(self, mock_get):
-        """Test download_file with Path object."""
-        # Mock response
-        mock_response = Mock()
-        mock_response.iter_content.return_value = [b"path test"]
-        mock_get.return_value = mock_response
-
-        with tempfile.NamedTemporaryFile(delete=False) as tmp:
-            path_obj = Path(tmp.name)
-
-        try:
-            download_file("https://example.com/file.txt", path_obj)
-
-            # Check file exists and has correct content
-            assert path_obj.exists()
-            content = path_obj.read_bytes()
-            assert content == b"path test"
-
-        finally:
-            path_obj.unlink(missing_ok=True)
+
+class TestDates:
+    """Tests for exact ages and years from dates."""
+
+    def test_exact_age(self):
+        birth = pd.Series(["2000-03-01", "2000-03-01", "2000-02-29", "1980-07-02", None])
+        event = pd.Series(["2001-03-01", "2001-02-28", "2001-02-28", "2020-01-01", "2020-01-01"])
+        ages = exact_age(birth, event)
+        np.testing.assert_allclose(ages[:3], [1.0, 364 / 365, 1.0])
+        assert ages[3] == pytest.approx(39 + 183 / 366)
+        assert np.isnan(ages[4])
+
+    def test_decimal_year(self):
+        years = decimal_year(pd.Series(["2021-01-01", "2020-07-02", "bad"]))
+        np.testing.assert_allclose(years[:2], [2021.0, 2020.5])
+        assert np.isnan(years[2])
+
+
+class TestReadCsv:
+    """Tests for the selectable CSV parser."""
+
+    def test_resolve_engine(self, monkeypatch):
+        """'auto' picks pyarrow only when it is installed."""
+        monkeypatch.setattr("importlib.util.find_spec", lambda name: None)
+        assert resolve_engine("auto") == "c"
+        assert resolve_engine("python") == "python"
+        with pytest.raises(ImportError):
+            resolve_engine("pyarrow")
+        with pytest.raises(ValueError):
+            resolve_engine("fast")
+
+    @pytest.mark.parametrize("engine", ["c", "python"])
+    def test_dtypes_and_usecols(self, tmp_path, engine):
+        """Explicit dtypes and callable usecols are honoured by every engine."""
+        path = tmp_path / "data.csv"
+        path.write_text("age,year,name\n1,2000,a\n2,2001,b\n")
+        df = read_csv(
+            path, engine, usecols=lambda c: c != "name", dtype={"age": "int32", "year": "int32"}
+        )
+        assert list(df.columns) == ["age", "year"]
+        assert (df.dtypes == "int32").all()
+
+
+class TestDownloadFile:
+    """Tests for the streaming downloader against a local stand-in server."""
+
+    digest = hashlib.sha256(PAYLOAD).hexdigest()
+
+    def test_default_path(self, stand_in_server, tmp_path, monkeypatch):
+        """The file is saved under the URL's name in the current directory."""
+        monkeypatch.chdir(tmp_path)
+        path = download_file(stand_in_server, backoff=0)
+        assert path == Path("data.bin")
+        assert (tmp_path / "data.bin").read_bytes() == PAYLOAD
+        assert not (tmp_path / "data.bin.part").exists()
+
+    def test_custom_path(self, stand_in_server, tmp_path):
+        """str and Path destinations are both accepted."""
+        download_file(stand_in_server, str(tmp_path / "a.bin"), backoff=0)
+        download_file(stand_in_server, tmp_path / "b.bin", backoff=0)
+        assert (tmp_path / "a.bin").read_bytes() == PAYLOAD
+        assert (tmp_path / "b.bin").read_bytes() == PAYLOAD
+
+    def test_retry_resumes_partial_file(self, stand_in_server, tmp_path):
+        """A dropped connection is retried with a Range request."""
+        StandInHandler.failures = ["truncate", "error"]
+        path = download_file(stand_in_server, tmp_path / "data.bin", sha256=self.digest, backoff=0)
+        assert path.read_bytes() == PAYLOAD
+        assert StandInHandler.ranges[0] is None
+        assert StandInHandler.ranges[-1] == f"bytes={len(PAYLOAD) // 2}-"
+
+    def test_resume_existing_part(self, stand_in_server, tmp_path):
+        """A partial file left by an earlier run is completed."""
+        (tmp_path / "data.bin.part").write_bytes(PAYLOAD[:1000])
+        download_file(stand_in_server, tmp_path / "data.bin", backoff=0)
+        assert (tmp_path / "data.bin").read_bytes() == PAYLOAD
+        assert StandInHandler.ranges == ["bytes=1000-"]
+
+    def test_checksum_mismatch(self, stand_in_server, tmp_path):
+        """A file that never matches its digest is not kept."""
+        with pytest.raises(ValueError, match="Checksum mismatch"):
+            download_file(stand_in_server, tmp_path / "data.bin", sha256="0" * 64, backoff=0)
+        assert not (tmp_path / "data.bin").exists()
+        assert not (tmp_path / "data.bin.part").exists()
+        assert len(StandInHandler.ranges) == 4
+
+    def test_corrupt_part_is_discarded(self, stand_in_server, tmp_path):
+        """A corrupt partial file is restarted after the checksum fails."""
+        (tmp_path / "data.bin.part").write_bytes(b"x" * 1000)
+        download_file(stand_in_server, tmp_path / "data.bin", sha256=self.digest, backoff=0)
+        assert (tmp_path / "data.bin").read_bytes() == PAYLOAD
+        assert StandInHandler.ranges == ["bytes=1000-", None]
+
+    def test_manifest(self, stand_in_server, tmp_path):
+        """Digests are looked up by file name and matching files are skipped."""
+        manifest = tmp_path / "SHA256SUMS"
+        manifest.write_text(f"# checksums\n{self.digest} *data.bin\n")
+        assert read_sha256_manifest(manifest) == {"data.bin": self.digest}
+        path = download_file(stand_in_server, tmp_path / "data.bin", manifest=manifest)
+        assert file_sha256(path) == self.digest
+        download_file(stand_in_server, tmp_path / "data.bin", manifest=manifest)
+        assert len(StandInHandler.ranges) == 1
+
+    def test_client_error_not_retried(self, stand_in_server, tmp_path):
+        """Permanent HTTP errors are raised immediately."""
+        StandInHandler.failures = ["missing"]
+        with pytest.raises(requests.HTTPError):
+            download_file(stand_in_server, tmp_path / "data.bin", backoff=0)
+        assert len(StandInHandler.ranges) == 1
+
+
+class TestCachedSession:
+    """Tests for the conditional-GET cache against a local stand-in server."""
+
+    def test_not_modified(self, stand_in_server, tmp_path):
+        """Committed responses are revalidated and served from the cache."""
+        session = CachedSession(tmp_path)
+        response = session.get(stand_in_server)
+        assert response.status_code == 200
+        assert response.from_cache is False
+        session.commit(stand_in_server)
+
+        # A new session sharing the cache directory sends the validator
+        response = CachedSession(tmp_path).get(stand_in_server)
+        assert StandInHandler.conditions == [None, '"v1"']
+        assert response.status_code == 304
+        assert response.from_cache is True
+        assert response.content == PAYLOAD
+
+    def test_changed_upstream(self, stand_in_server, tmp_path):
+        """A new ETag upstream gives a full response."""
+        session = CachedSession(tmp_path)
+        session.get(stand_in_server)
+        session.commit(stand_in_server)
+        StandInHandler.etag = '"v2"'
+        response = session.get(stand_in_server)
+        assert response.status_code == 200
+        assert response.from_cache is False
+
+    def test_uncommitted_not_cached(self, stand_in_server, tmp_path):
+        """Responses that were never committed are fetched again in full."""
+        session = CachedSession(tmp_path)
+        session.get(stand_in_server)
+        session.commit(None)
+        response = session.get(stand_in_server)
+        assert response.status_code == 200
+        assert StandInHandler.conditions == [None, None]
+        assert not any(tmp_path.iterdir())